@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.server import BenchServer
+from core.daemon import DaemonClient, DaemonError
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def run_jobs(label, count, parallel, job):
+    """Run ``count`` jobs, ``parallel`` at a time, and print throughput and latency"""
+    def timed(_):
+        start = time.perf_counter()
+        job()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        latencies = list(pool.map(timed, range(count)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {count / elapsed:8.1f} jobs/s  p50 {percentile(latencies, 50) * 1000:8.1f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:8.1f} ms")
+    return count / elapsed
+
+def wait_for_daemon(address, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with DaemonClient(address) as client:
+                return client.status()
+        except DaemonError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-process scans vs. jobs sent to a serve daemon')
+    parser.add_argument('-n', '--jobs', type=int, default=40, help='Scans per mode')
+    parser.add_argument('-p', '--parallel', type=int, default=4, help='Scans submitted at the same time')
+    parser.add_argument('--latency', type=float, default=0.005, help='Server latency per request in seconds')
+    parser.add_argument('--template', default=str(ROOT / 'templates' / 'http-trace.yaml'),
+                        help='Template every scan runs')
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix='pentoscan-bench-'))
+    templates_dir = work_dir / 'templates'
+    templates_dir.mkdir()
+    shutil.copy(args.template, templates_dir)
+    address = f"unix:{work_dir / 'daemon.sock'}"
+    main_py = str(ROOT / 'main.py')
+    env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    quiet = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL, 'cwd': work_dir, 'env': env}
+
+    with BenchServer(latency=args.latency) as server:
+        daemon = subprocess.Popen([sys.executable, main_py, 'serve', '--templates', str(templates_dir),
+                                   '--listen', address, '--jobs', str(args.parallel)], **quiet)
+        try:
+            status = wait_for_daemon(address, daemon)
+            print(f"Scanning {server.url}, {args.jobs} scans of {Path(args.template).name} per mode, "
+                  f"{args.parallel} at a time; daemon has {status['templates']} templates\n")
+
+            cli = run_jobs('scan (one process each)', args.jobs, args.parallel, lambda: subprocess.run(
+                [sys.executable, main_py, 'scan', '-t', server.url, '-template', str(templates_dir),
+                 '-o', str(work_dir / 'results')], check=True, **quiet))
+            client = run_jobs('client scan (one process each)', args.jobs, args.parallel, lambda: subprocess.run(
+                [sys.executable, main_py, 'client', 'scan', '-t', server.url, '--daemon', address],
+                check=True, **quiet))
+
+            def api_job():
+                with DaemonClient(address) as api:
+                    job = api.submit([server.url])
+                    for _ in api.results(job['id']):
+                        pass
+
+            api = run_jobs('daemon API', args.jobs, args.parallel, api_job)
+            print(f"\nclient scan {client / cli:.1f}x, daemon API {api / cli:.1f}x the per-process throughput")
+        finally:
+            daemon.terminate()
+            daemon.wait()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.server import BenchServer
+from core.archive import INDEX_NAME
+
+def batch(args, *extra, **kwargs):
+    """Run ``main.py batch`` with the templates directory and return the seconds it took"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(ROOT / 'main.py'), 'batch', '--templates', args.templates,
+                    '-w', str(args.workers), '--checkpoint-interval', '0', *extra], check=True, **kwargs)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Record a batch into an archive, then re-match it offline')
+    parser.add_argument('-n', '--targets', type=int, default=200, help='Targets to record')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='Batch worker processes')
+    parser.add_argument('--latency', type=float, default=0.005, help='Server latency per request in seconds')
+    parser.add_argument('--templates', default=str(ROOT / 'templates'), help='Templates every target runs')
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix='pentoscan-bench-'))
+    archive = work_dir / 'archive'
+    env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    quiet = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL, 'cwd': work_dir, 'env': env}
+
+    try:
+        with BenchServer(latency=args.latency) as server:
+            # Distinct paths, so every target reflects its own bodies
+            targets = work_dir / 'targets.txt'
+            targets.write_text(''.join(f"{server.url}site{i}/\n" for i in range(args.targets)))
+            recorded = batch(args, '-l', str(targets), '--record', str(archive), '--no-baseline',
+                             '-o', str(work_dir / 'recorded'), **quiet)
+            sent = server.requests
+
+        with sqlite3.connect(archive / INDEX_NAME) as conn:
+            responses = conn.execute('SELECT COUNT(*) FROM exchanges').fetchone()[0]
+            bodies, raw, stored = conn.execute('SELECT COUNT(*), SUM(size), SUM(length) FROM bodies').fetchone()
+        on_disk = sum(f.stat().st_size for f in archive.rglob('*') if f.is_file())
+        print(f"Recorded {responses} responses ({sent} requests sent) from {args.targets} targets in "
+              f"{recorded:.1f}s; {bodies} distinct bodies, {raw / 1048576:.1f} MB stored as "
+              f"{stored / 1048576:.1f} MB, {on_disk / 1048576:.1f} MB on disk with the index")
+
+        # The server is gone: anything not answered from the archive fails
+        replayed = batch(args, '--replay', str(archive), '-o', str(work_dir / 'replayed'), **quiet)
+        rate = responses / replayed
+        print(f"Replayed with {args.workers} workers in {replayed:.1f}s: {rate:,.0f} responses/s, "
+              f"about {1_000_000 / rate / 60:.1f} minutes for a million")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.server import SQL_ERROR_PAGE, BenchServer
+from bench.template_load import build_corpus
+from core.http_client import HttpClient, HttpResponse
+from core.loader import load_template, load_templates
+from core.ratelimit import RateController
+from core.scanner import run_scan
+from core.template_cache import TemplateCache
+
+class TimedClient(HttpClient):
+    """HttpClient that records the wall time of every request it sends"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self._latency_lock = threading.Lock()
+
+    def _send(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super()._send(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._latency_lock:
+                self.latencies.append(elapsed)
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_templates(server, templates, args):
+    """Scan the server with every template, ``args.rounds`` times each"""
+    results = {}
+    for template in templates:
+        latencies = []
+        sent = 0
+        elapsed = 0.0
+        for _ in range(args.rounds):
+            # A fresh client per round: no connections or limits carried over
+            client = TimedClient(
+                concurrency=args.concurrency,
+                per_host=args.concurrency,
+                rate_controller=RateController(args.concurrency, adaptive=False),
+            )
+            before = server.requests
+            start = time.perf_counter()
+            try:
+                scan_result = run_scan(server.url, template, client=client)
+            finally:
+                client.close()
+            elapsed += time.perf_counter() - start
+            sent += server.requests - before
+            latencies.extend(client.latencies)
+        result = results[template.id] = {
+            'requests': sent,
+            'seconds': round(elapsed, 4),
+            'requests_per_sec': round(sent / elapsed, 1) if elapsed else None,
+            'p50_ms': _ms(percentile(latencies, 50)),
+            'p99_ms': _ms(percentile(latencies, 99)),
+            'vulnerable': scan_result.vulnerable,
+        }
+        print(f"  {template.id:<28} {sent:>6} req  {result['requests_per_sec'] or 0:>8} req/s  "
+              f"p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  "
+              f"{'vulnerable' if result['vulnerable'] else 'clean'}")
+    return results
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+def bench_matchers(template_path, body_size, iterations):
+    """Evaluate the template's compiled matchers against a SQL error page"""
+    template = load_template(template_path)
+    step = template.compiled_steps[0]
+    filler = "<p>" + "lorem ipsum dolor sit amet " * (body_size // 27) + "</p>"
+    bodies = {
+        'match': (filler + SQL_ERROR_PAGE.format(near="'")).encode(),
+        'no_match': (filler + "<p>nothing to see here</p>").encode(),
+    }
+    results = {}
+    for name, body in bodies.items():
+        response = HttpResponse('http://bench/', 200, {'Content-Type': 'text/html'}, content=body)
+        step.evaluate(response, {})
+        start = time.perf_counter()
+        for _ in range(iterations):
+            # A fresh response each time so no decoded text is reused
+            response = HttpResponse('http://bench/', 200, {'Content-Type': 'text/html'}, content=body)
+            step.evaluate(response, {})
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            'body_bytes': len(body),
+            'evaluations_per_sec': round(iterations / elapsed, 1),
+            'mb_per_sec': round(len(body) * iterations / elapsed / (1024 * 1024), 1),
+        }
+    return results
+
+def bench_template_load(count):
+    """Parse a cloned corpus uncached, then from a cold and a warm cache"""
+    work_dir = Path(tempfile.mkdtemp(prefix='pentoscan-bench-'))
+    corpus_dir = work_dir / 'templates'
+    cache = TemplateCache(work_dir / 'cache')
+    build_corpus(corpus_dir, count, source_dir=ROOT / 'templates')
+    timings = {'templates': count}
+    for label, load in (
+        ('uncached_ms', lambda: load_templates(corpus_dir, use_cache=False)),
+        ('cold_cache_ms', lambda: cache.load(corpus_dir).select()),
+        ('warm_cache_ms', lambda: cache.load(corpus_dir).select()),
+    ):
+        start = time.perf_counter()
+        load()
+        timings[label] = round((time.perf_counter() - start) * 1000, 1)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return timings
+
+def compare(current, baseline_path):
+    """Print per-metric changes against an earlier result file"""
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}):")
+    for template_id, now in current['templates'].items():
+        before = baseline.get('templates', {}).get(template_id)
+        if before and before.get('requests_per_sec') and now.get('requests_per_sec'):
+            change = (now['requests_per_sec'] / before['requests_per_sec'] - 1) * 100
+            print(f"  {template_id:<28} req/s {change:+6.1f}%")
+    for name, now in current['matchers'].items():
+        before = baseline.get('matchers', {}).get(name)
+        if before:
+            change = (now['evaluations_per_sec'] / before['evaluations_per_sec'] - 1) * 100
+            label = f"matchers ({name})"
+            print(f"  {label:<28} eval/s {change:+6.1f}%")
+    same_corpus = baseline.get('template_load', {}).get('templates') == current['template_load']['templates']
+    for key in ('uncached_ms', 'warm_cache_ms'):
+        before = baseline.get('template_load', {}).get(key)
+        if before and same_corpus:
+            change = (current['template_load'][key] / before - 1) * 100
+            label = f"template load {key}"
+            print(f"  {label:<28} {change:+6.1f}%")
+    before = baseline.get('peak_rss_mb')
+    if before:
+        print(f"  {'peak RSS':<28} {current['peak_rss_mb'] - before:+6.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline PentoScan benchmark')
+    parser.add_argument('--latency', type=float, default=0.005, help='Server latency per request in seconds')
+    parser.add_argument('--body-size', type=int, default=16 * 1024, help='Response body size in bytes')
+    parser.add_argument('--no-cookies', action='store_true', help='Server sets no cookies')
+    parser.add_argument('--no-sql-errors', action='store_true', help='Server never returns SQL error pages')
+    parser.add_argument('-c', '--concurrency', type=int, default=20, help='Requests in flight')
+    parser.add_argument('--rounds', type=int, default=5, help='Scans per template')
+    parser.add_argument('--templates', default=str(ROOT / 'templates'), help='Template directory to run')
+    parser.add_argument('--matcher-iterations', type=int, default=2000, help='Matcher evaluations per body')
+    parser.add_argument('--load-count', type=int, default=1000, help='Templates in the load-time corpus')
+    parser.add_argument('-o', '--output', help='Result file (default: bench/results/<time>_<commit>.json)')
+    parser.add_argument('--compare', help='Earlier result file to compare against')
+    args = parser.parse_args()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'config': {
+            'latency': args.latency,
+            'body_size': args.body_size,
+            'cookies': not args.no_cookies,
+            'sql_errors': not args.no_sql_errors,
+            'concurrency': args.concurrency,
+            'rounds': args.rounds,
+        },
+    }
+
+    templates = load_templates(args.templates, use_cache=False)
+    with BenchServer(latency=args.latency, body_size=args.body_size, cookies=not args.no_cookies,
+                     sql_errors=not args.no_sql_errors) as server:
+        print(f"Scanning {server.url} with {len(templates)} templates")
+        report['templates'] = bench_templates(server, templates, args)
+
+    print("Matcher throughput (sqli-error-based.yaml)")
+    report['matchers'] = bench_matchers(ROOT / 'templates' / 'sqli-error-based.yaml', args.body_size,
+                                        args.matcher_iterations)
+    for name, result in report['matchers'].items():
+        print(f"  {name:<10} {result['evaluations_per_sec']:>10} eval/s  {result['mb_per_sec']:>8} MB/s")
+
+    print(f"Template load ({args.load_count} templates)")
+    report['template_load'] = bench_template_load(args.load_count)
+    print("  " + "  ".join(f"{k} {v}" for k, v in report['template_load'].items() if k != 'templates'))
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    print(f"Peak RSS: {report['peak_rss_mb']} MB")
+
+    output = Path(args.output) if args.output else (
+        ROOT / 'bench' / 'results' / f"{datetime.now():%Y%m%d_%H%M%S}_{report['commit'] or 'unknown'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == '__main__':
+    main()
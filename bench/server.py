@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import argparse
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+SQL_ERROR_PAGE = (
+    "<html><body><h1>Database error</h1>"
+    "<p>You have an error in your SQL syntax; check the manual that corresponds "
+    "to your MySQL server version for the right syntax to use near '{near}' at line 1</p>"
+    "</body></html>"
+)
+SWAGGER_PAGE = (
+    "<!DOCTYPE html><html><head><title>Swagger UI</title></head>"
+    "<body><div id=\"swagger-ui\"></div>"
+    "<script>/* @version v4.15.5 */ window.onload = function() { loadSwaggerUI(); }</script>"
+    "</body></html>"
+)
+PASSWD = "root:x:0:0:root:/root:/bin/bash\nnobody:x:65534:65534:nobody:/nonexistent:/usr/sbin/nologin\n"
+SQL_CHARS = ("'", '"', ';')
+SWAGGER_PATHS = ('/swagger-ui.html', '/swagger/index.html', '/api/swagger.json')
+
+class BenchServer:
+    """
+    In-process stand-in for a target, covering what the shipped templates probe.
+
+    - every response pads its body to ``body_size`` bytes and waits ``latency``
+      seconds before answering
+    - ``/`` sets one plain and one Secure cookie (``cookies``)
+    - paths or queries containing quotes or ';' return a MySQL error page
+      (``sql_errors``)
+    - a few Swagger UI paths return a Swagger page; ``?file=`` returns
+      /etc/passwd content; TRACE echoes the request; OPTIONS allows TRACE
+    - the requested path is reflected in HTML bodies
+    - every other path is a 404, or with ``catch_all`` a 200 page like the
+      ones single-page apps serve for any path
+    - with ``certfile`` (a PEM file holding the certificate and its key) it
+      speaks HTTPS
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, body_size=2048, cookies=True,
+                 sql_errors=True, catch_all=False, certfile=None):
+        self.latency = latency
+        self.body_size = body_size
+        self.cookies = cookies
+        self.sql_errors = sql_errors
+        self.catch_all = catch_all
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self.scheme = 'http'
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            self._httpd.socket = context.wrap_socket(self._httpd.socket, server_side=True)
+            self.scheme = 'https'
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"{self.scheme}://{host}:{port}/"
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    def _pad(self, text):
+        filler = self.body_size - len(text)
+        if filler > 0:
+            text += "<!--" + "x" * max(0, filler - 7) + "-->"
+        return text
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, status, body, headers=()):
+                data = body.encode('utf-8') if isinstance(body, str) else body
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(data)
+
+            def _route(self):
+                server._count()
+                if server.latency:
+                    time.sleep(server.latency)
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+
+                path = unquote(self.path)
+                html = [('Content-Type', 'text/html; charset=utf-8')]
+                if self.command == 'TRACE':
+                    echo = f"{self.command} {self.path} {self.request_version}\r\n{self.headers}"
+                    return self._respond(200, echo, [('Content-Type', 'message/http')])
+                if self.command == 'OPTIONS':
+                    return self._respond(200, '', [('Allow', 'GET, POST, OPTIONS, TRACE')])
+                if server.sql_errors and any(c in path for c in SQL_CHARS):
+                    return self._respond(500, server._pad(SQL_ERROR_PAGE.format(near=path[-20:])), html)
+                if path.split('?')[0] in SWAGGER_PATHS:
+                    return self._respond(200, server._pad(SWAGGER_PAGE), html)
+                if '?file=' in path:
+                    return self._respond(200, PASSWD, [('Content-Type', 'text/plain')])
+                if path.split('?')[0] == '/' or '?' in path:
+                    headers = list(html)
+                    if server.cookies:
+                        headers += [('Set-Cookie', 'session=abc123; Path=/; HttpOnly'),
+                                    ('Set-Cookie', 'csrf=1; Path=/; Secure')]
+                    return self._respond(200, server._pad(f"<html><body>{path}</body></html>"), headers)
+                if server.catch_all:
+                    return self._respond(200, server._pad('<html><body><div id="app"></div></body></html>'), html)
+                return self._respond(404, server._pad(f"<html><body>Not found: {path}</body></html>"), html)
+
+            do_GET = do_POST = do_HEAD = do_PUT = do_DELETE = do_OPTIONS = do_TRACE = _route
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='bench-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Local target server for benchmarks and tests')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each response')
+    parser.add_argument('--body-size', type=int, default=2048, help='Minimum HTML body size in bytes')
+    parser.add_argument('--no-cookies', action='store_true', help='Do not set cookies')
+    parser.add_argument('--no-sql-errors', action='store_true', help='Do not return SQL error pages')
+    parser.add_argument('--catch-all', action='store_true', help='Answer unknown paths with 200 instead of 404')
+    args = parser.parse_args()
+
+    server = BenchServer(host=args.host, port=args.port, latency=args.latency, body_size=args.body_size,
+                         cookies=not args.no_cookies, sql_errors=not args.no_sql_errors, catch_all=args.catch_all)
+    print(f"Serving on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.loader import load_templates
+from core.template_cache import TemplateCache
+
+def build_corpus(corpus_dir, count, source_dir='templates'):
+    """Write `count` templates by cloning the shipped ones under fresh ids"""
+    sources = sorted(Path(source_dir).glob('*.yaml'))
+    for i in range(count):
+        source = sources[i % len(sources)]
+        content = source.read_text()
+        content = content.replace('id: ', f'id: bench-{i}-', 1)
+        subdir = Path(corpus_dir) / f"group-{i % 50}"
+        subdir.mkdir(parents=True, exist_ok=True)
+        (subdir / f"template-{i}.yaml").write_text(content)
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed * 1000:10.1f} ms  ({len(result)} templates)")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Template load benchmark')
+    parser.add_argument('-n', '--count', type=int, default=5000, help='Number of templates')
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix='pentoscan-bench-'))
+    corpus_dir = work_dir / 'templates'
+    cache = TemplateCache(work_dir / 'cache')
+    try:
+        build_corpus(corpus_dir, args.count)
+        print(f"Corpus: {args.count} templates in {corpus_dir}\n")
+
+        timed('uncached (parse all YAML)', lambda: load_templates(corpus_dir, use_cache=False))
+        timed('cold cache (parse + write)', lambda: cache.load(corpus_dir).select())
+        timed('warm cache', lambda: cache.load(corpus_dir).select())
+        timed('warm cache, tag filter', lambda: cache.load(corpus_dir).select(tags=['sqli']))
+
+        # Modify a handful of files and measure the incremental reload
+        for path in sorted(corpus_dir.rglob('*.yaml'))[:10]:
+            path.write_text(path.read_text() + '\n# modified\n')
+        timed('warm cache, 10 files changed', lambda: cache.load(corpus_dir).select())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+from core.http_client import HttpResponse
+from core.metrics import metrics
+from core.response_cache import request_key
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+INDEX_NAME = 'index.sqlite'
+SEGMENT_DIR = 'segments'
+COMPRESSION_LEVEL = 6
+# Rows a writer collects before committing them to the index
+FLUSH_ROWS = 512
+# Decompressed bodies kept by a reader; error and soft-404 pages repeat a lot
+BODY_CACHE_ENTRIES = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS bodies (
+    digest BLOB PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS exchanges (
+    request BLOB PRIMARY KEY,
+    method TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    head BLOB NOT NULL,
+    body BLOB,
+    recorded REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS scans (
+    target TEXT NOT NULL,
+    template_id TEXT NOT NULL,
+    variables TEXT,
+    recorded REAL NOT NULL,
+    PRIMARY KEY (target, template_id)
+) WITHOUT ROWID;
+"""
+
+class ArchiveError(Exception):
+    """Custom exception for response archive errors"""
+    pass
+
+class ArchiveMiss(ArchiveError):
+    """A replayed request the archive holds no response for"""
+    pass
+
+def _request_id(method, url, headers, data, allow_redirects):
+    key = request_key(method, url, headers, data, allow_redirects)
+    encoded = json.dumps(key, default=str, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+def _connect(path):
+    """Open (creating if needed) the index of the archive in directory path"""
+    path = Path(path)
+    try:
+        (path / SEGMENT_DIR).mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(path / INDEX_NAME), timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            conn.close()
+            raise ArchiveError(f"Unsupported archive version {version} in {path}")
+        conn.executescript(SCHEMA)
+        conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        return conn
+    except (OSError, sqlite3.Error) as e:
+        raise ArchiveError(f"Cannot open archive {path}: {str(e)}")
+
+class ArchiveWriter:
+    """
+    Records the requests of a run and the responses they got.
+
+    An archive is a directory of append-only segment files holding
+    compressed response bodies, plus a SQLite index mapping every request
+    (by its response cache key) to its compressed status line and headers
+    and to its body. Identical bodies are stored once. Each writer appends
+    to a segment of its own, so several processes can record into one
+    archive; a request recorded again replaces the older answer in the
+    index. Segments are never rewritten, so readers can map them into
+    memory.
+
+    Rows are committed in batches and on flush(); bodies are written to
+    their segment before the rows pointing at them.
+    """
+
+    recording = True
+
+    def __init__(self, path):
+        """
+        Open or create an archive for writing
+
+        Args:
+            path (str): Archive directory
+
+        Raises:
+            ArchiveError: If the archive cannot be opened or is not one
+                this version can use
+        """
+        self.path = Path(path)
+        self.conn = _connect(self.path)
+        self._lock = threading.Lock()
+        name = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{uuid.uuid4().hex[:8]}.seg"
+        try:
+            with self.conn:
+                self.segment = self.conn.execute('INSERT INTO segments (name) VALUES (?)', (name,)).lastrowid
+            self._file = open(self.path / SEGMENT_DIR / name, 'xb')
+        except (OSError, sqlite3.Error) as e:
+            raise ArchiveError(f"Cannot write to archive {path}: {str(e)}")
+        self._offset = 0
+        self._known = set()
+        self._bodies = []
+        self._exchanges = []
+        self._scans = []
+        self.counts = {'responses': 0, 'bodies': 0, 'body_bytes': 0, 'stored_bytes': 0}
+
+    def record(self, method, url, headers, data, allow_redirects, response):
+        """Keep one request and the HttpResponse it got"""
+        head = {
+            'url': response.url,
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            'header_list': response.header_list,
+            'encoding': response.encoding,
+            'elapsed': response.elapsed,
+            'transport': response.transport,
+            'body_read': response.body_read,
+            'truncated': response.truncated,
+            'partial': response.partial,
+        }
+        packed_head = zlib.compress(json.dumps(head, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL)
+        digest = hashlib.blake2b(response.content, digest_size=16).digest() if response.body_read else None
+        request = _request_id(method, url, headers, data, allow_redirects)
+        with self._lock:
+            new_body = digest is not None and digest not in self._known and not self._stored(digest)
+            if digest is not None:
+                self._known.add(digest)
+        if new_body:
+            packed = zlib.compress(response.content, COMPRESSION_LEVEL)
+        with self._lock:
+            if new_body:
+                self._file.write(packed)
+                self._bodies.append((digest, self.segment, self._offset, len(packed), len(response.content)))
+                self._offset += len(packed)
+                self.counts['bodies'] += 1
+                self.counts['body_bytes'] += len(response.content)
+                self.counts['stored_bytes'] += len(packed)
+            self._exchanges.append((request, method.upper(), url, response.status_code, packed_head, digest,
+                                    time.time()))
+            self.counts['responses'] += 1
+            due = len(self._exchanges) >= FLUSH_ROWS
+        if due:
+            self.flush()
+
+    def _stored(self, digest):
+        # Bodies recorded earlier, possibly by another writer
+        return self.conn.execute('SELECT 1 FROM bodies WHERE digest = ?', (digest,)).fetchone() is not None
+
+    def record_scan(self, target, template_id, variables=None):
+        """
+        Note that a template ran against a target, with the values its
+        template variables took, so a replay can use the same ones
+        """
+        encoded = json.dumps(variables, separators=(',', ':'), default=str) if variables else None
+        with self._lock:
+            self._scans.append((target, template_id, encoded, time.time()))
+
+    def flush(self):
+        """Commit what was recorded since the last flush to the index"""
+        with self._lock:
+            bodies, self._bodies = self._bodies, []
+            exchanges, self._exchanges = self._exchanges, []
+            scans, self._scans = self._scans, []
+            if not (bodies or exchanges or scans):
+                return
+            try:
+                # The index never points past what the segment holds
+                self._file.flush()
+                with self.conn:
+                    self.conn.executemany('INSERT OR IGNORE INTO bodies VALUES (?, ?, ?, ?, ?)', bodies)
+                    self.conn.executemany('INSERT OR REPLACE INTO exchanges VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                          exchanges)
+                    self.conn.executemany('INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?)', scans)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Could not save {len(exchanges)} responses to archive {self.path}: {str(e)}")
+
+    def stats(self):
+        """Responses recorded, new bodies stored, and their raw and compressed sizes"""
+        with self._lock:
+            return dict(self.counts)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._file.close()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ResponseArchive:
+    """
+    Answers requests from an archive written by ArchiveWriter.
+
+    Segments are memory-mapped, so bodies are only read (and decompressed)
+    for responses whose body a matcher needs; recently used bodies are
+    kept decompressed.
+    """
+
+    recording = False
+
+    def __init__(self, path):
+        """
+        Open an archive for reading
+
+        Args:
+            path (str): Archive directory
+
+        Raises:
+            ArchiveError: If there is no archive at path, or it is not one
+                this version can use
+        """
+        self.path = Path(path)
+        if not (self.path / INDEX_NAME).is_file():
+            raise ArchiveError(f"No archive in {path}")
+        self.conn = _connect(self.path)
+        self._lock = threading.Lock()
+        self._segments = {}
+        self._bodies = OrderedDict()
+        self.counts = {'hits': 0, 'misses': 0}
+
+    def targets(self):
+        """Targets scanned into the archive, in the order they were first recorded"""
+        with self._lock:
+            rows = self.conn.execute('SELECT target FROM scans GROUP BY target ORDER BY MIN(recorded)').fetchall()
+        return [row[0] for row in rows]
+
+    def variables(self, target, template_id):
+        """Values the template's variables took when it was recorded against target, if it was"""
+        with self._lock:
+            row = self.conn.execute('SELECT variables FROM scans WHERE target = ? AND template_id = ?',
+                                    (target, template_id)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def response(self, method, url, headers=None, data=None, allow_redirects=False, read_body=None):
+        """
+        The archived response to a request
+
+        Args:
+            read_body (callable, optional): Decides from status and headers
+                whether the body is needed, as for HttpClient.request
+
+        Returns:
+            HttpResponse: The response as it was recorded
+
+        Raises:
+            ArchiveMiss: If the request was never recorded
+        """
+        request = _request_id(method, url, headers, data, allow_redirects)
+        with self._lock:
+            row = self.conn.execute('SELECT head, body FROM exchanges WHERE request = ?', (request,)).fetchone()
+            self.counts['hits' if row else 'misses'] += 1
+        if row is None:
+            metrics.inc('archive_requests_total', result='miss')
+            raise ArchiveMiss(f"No archived response for {method} {url}")
+        metrics.inc('archive_requests_total', result='hit')
+        head = json.loads(zlib.decompress(row[0]))
+        response = HttpResponse(
+            url=head['url'],
+            status_code=head['status_code'],
+            headers=head['headers'],
+            encoding=head['encoding'],
+            elapsed=head['elapsed'],
+            header_list=[tuple(item) for item in head['header_list']],
+            transport=head['transport'],
+        )
+        response.truncated = head['truncated']
+        response.partial = head['partial']
+        if row[1] is None or (read_body is not None and not read_body(response)):
+            response.body_read = False
+        else:
+            response.content = self._body(row[1])
+        return response
+
+    def _body(self, digest):
+        with self._lock:
+            body = self._bodies.get(digest)
+            if body is not None:
+                self._bodies.move_to_end(digest)
+                return body
+            row = self.conn.execute('SELECT segment, offset, length FROM bodies WHERE digest = ?',
+                                    (digest,)).fetchone()
+            if row is None:
+                raise ArchiveError(f"Archive {self.path} is missing a body its index refers to")
+            segment, offset, length = row
+            data = self._segment(segment, offset + length)
+            packed = data[offset:offset + length]
+        body = zlib.decompress(packed)
+        with self._lock:
+            self._bodies[digest] = body
+            if len(self._bodies) > BODY_CACHE_ENTRIES:
+                self._bodies.popitem(last=False)
+        return body
+
+    def _segment(self, segment, end):
+        # Mapped on first use, and again if a writer has appended since
+        data = self._segments.get(segment)
+        if data is None or len(data) < end:
+            name = self.conn.execute('SELECT name FROM segments WHERE id = ?', (segment,)).fetchone()
+            try:
+                with open(self.path / SEGMENT_DIR / name[0], 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, TypeError, ValueError) as e:
+                raise ArchiveError(f"Cannot read segment {segment} of archive {self.path}: {str(e)}")
+            if segment in self._segments:
+                self._segments[segment].close()
+            self._segments[segment] = data
+        return data
+
+    def stats(self):
+        """Requests answered from the archive (hits) and not found in it (misses)"""
+        with self._lock:
+            return dict(self.counts)
+
+    def close(self):
+        with self._lock:
+            for data in self._segments.values():
+                data.close()
+            self._segments.clear()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ReplayClient:
+    """
+    Stands in for HttpClient, answering every request from a ResponseArchive.
+
+    Nothing is sent: a request the archive holds no response for fails
+    with ArchiveMiss, as one that could not connect would. There is no
+    network to wait for, so requests are answered in the calling thread.
+    The client owns the archive and closes it.
+    """
+
+    def __init__(self, archive):
+        """
+        Initialize the client
+
+        Args:
+            archive (ResponseArchive): Where responses come from
+        """
+        self.archive = archive
+        self.concurrency = 1
+        self.cache = None
+
+    def request(self, method, url, headers=None, data=None, allow_redirects=False,
+                read_body=None, watch=None):
+        """Answer a request as HttpClient.request would have; watch is not needed for a stored body"""
+        return self.archive.response(method, url, headers, data, allow_redirects, read_body)
+
+    def map(self, requests_iter, window=None, skip=None):
+        """
+        Answer request specs in order, as HttpClient.map does
+
+        Yields:
+            tuple: (spec, HttpResponse or None, Exception or None)
+        """
+        for spec in requests_iter:
+            if skip and skip(spec):
+                continue
+            try:
+                response = self.request(
+                    spec['method'], spec['url'],
+                    headers=spec.get('headers'),
+                    data=spec.get('data'),
+                    allow_redirects=spec.get('allow_redirects', False),
+                    read_body=spec.get('read_body'),
+                )
+            except ArchiveError as e:
+                yield spec, None, e
+                continue
+            yield spec, response, None
+
+    def close(self):
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,325 @@
+import hashlib
+import html
+import logging
+import re
+import secrets
+import string
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import quote, unquote, urlsplit
+
+import requests
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Random paths requested to learn what a missing page looks like
+PROBE_SUFFIXES = ('', '.html')
+PROBE_TOKEN_LENGTH = 16
+# Statuses that already say "not found"; templates may match these pages on purpose
+NOT_FOUND_STATUSES = frozenset((404, 410))
+# Path pieces shorter than this are too common to strip from a body
+MIN_STRIP_LENGTH = 3
+# Only the start of a body is searched for technology hints
+HINT_BODY_BYTES = 64 * 1024
+
+# (technology, category, where, pattern); where is 'header:<name>',
+# 'cookie' (Set-Cookie names) or 'body'
+TECHNOLOGY_HINTS = (
+    ('apache', 'server', 'header:server', r'apache(?!-coyote)'),
+    ('nginx', 'server', 'header:server', r'nginx|openresty'),
+    ('iis', 'server', 'header:server', r'microsoft-iis'),
+    ('litespeed', 'server', 'header:server', r'litespeed'),
+    ('tomcat', 'server', 'header:server', r'apache-coyote|tomcat'),
+    ('php', 'language', 'header:x-powered-by', r'php'),
+    ('php', 'language', 'cookie', r'^phpsessid$'),
+    ('asp.net', 'language', 'header:x-powered-by', r'asp\.net'),
+    ('asp.net', 'language', 'header:x-aspnet-version', r'.'),
+    ('asp.net', 'language', 'cookie', r'^asp\.net_sessionid$'),
+    ('java', 'language', 'cookie', r'^jsessionid$'),
+    ('java', 'language', 'header:x-powered-by', r'servlet|jsp'),
+    ('node', 'language', 'header:x-powered-by', r'express|next\.js'),
+    ('python', 'language', 'header:server', r'gunicorn|werkzeug|uvicorn|python'),
+    ('ruby', 'language', 'header:x-powered-by', r'phusion passenger'),
+    ('ruby', 'language', 'cookie', r'^_[a-z0-9_]+_session$'),
+    ('wordpress', 'cms', 'body', r'/wp-content/|/wp-includes/'),
+    ('drupal', 'cms', 'header:x-generator', r'drupal'),
+    ('drupal', 'cms', 'body', r'drupal-settings-json|/sites/default/files/'),
+    ('joomla', 'cms', 'body', r'/media/jui/|content="joomla'),
+)
+TECHNOLOGIES = {technology: category for technology, category, _, _ in TECHNOLOGY_HINTS}
+# Template tags naming a technology differently
+TECHNOLOGY_ALIASES = {'aspnet': 'asp.net', 'asp': 'asp.net', 'jsp': 'java', 'nodejs': 'node', 'wp': 'wordpress'}
+# A host runs one of these at a time, so seeing one rules out the others.
+# Servers are not here: a proxy in front hides what runs behind it.
+EXCLUSIVE_CATEGORIES = ('language', 'cms')
+
+_HINTS = [(technology, where, re.compile(pattern, re.IGNORECASE))
+          for technology, _, where, pattern in TECHNOLOGY_HINTS]
+
+def detect_technologies(response):
+    """Technologies a response gives away in its headers, cookies or body"""
+    found = set()
+    cookies = None
+    body = None
+    for technology, where, pattern in _HINTS:
+        if technology in found:
+            continue
+        if where == 'cookie':
+            if cookies is None:
+                cookies = [value.split('=', 1)[0].strip() for name, value in response.header_list
+                           if name.lower() == 'set-cookie']
+            if any(pattern.search(cookie) for cookie in cookies):
+                found.add(technology)
+        elif where == 'body':
+            if body is None:
+                body = response.content[:HINT_BODY_BYTES].decode('utf-8', 'replace')
+            if pattern.search(body):
+                found.add(technology)
+        elif pattern.search(response.headers.get(where[len('header:'):], '')):
+            found.add(technology)
+    return found
+
+def _template_technologies(template):
+    tags = (tag.lower() for tag in template.tags)
+    return {TECHNOLOGY_ALIASES.get(tag, tag) for tag in tags} & TECHNOLOGIES.keys()
+
+def _strip_path(body, path):
+    """Remove the requested path from a body, as pages often echo it"""
+    last = path.rstrip('/').rsplit('/', 1)[-1]
+    pieces = set()
+    for piece in (path, last):
+        for form in (piece, unquote(piece), quote(unquote(piece), safe='/')):
+            pieces.add(form)
+            pieces.add(html.escape(form))
+    for piece in sorted(pieces, key=len, reverse=True):
+        if len(piece) >= MIN_STRIP_LENGTH:
+            body = body.replace(piece.encode('utf-8', 'replace'), b'')
+    return body
+
+def _content_type(response):
+    return response.headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+
+def _digest(body):
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+class Soft404Signature:
+    """
+    What a host answers for paths that do not exist, when that is not a 404.
+
+    Built from responses to random paths, with the path stripped from the
+    body. A response matches when it has the same status and content type
+    and either the same stripped body, or (when the probes differed from
+    each other, e.g. by a timestamp) a stripped length within the spread
+    the probes showed. Redirects match on their stripped Location.
+    """
+
+    __slots__ = ('status_code', 'content_type', 'digests', 'min_length', 'max_length', 'locations')
+
+    def __init__(self, status_code, content_type):
+        self.status_code = status_code
+        self.content_type = content_type
+        self.digests = set()
+        self.min_length = None
+        self.max_length = None
+        self.locations = set()
+
+    def add(self, response, path):
+        body = _strip_path(response.content, path)
+        self.digests.add(_digest(body))
+        self.min_length = len(body) if self.min_length is None else min(self.min_length, len(body))
+        self.max_length = len(body) if self.max_length is None else max(self.max_length, len(body))
+        self.locations.add(_strip_path(response.headers.get('Location', '').encode('utf-8'), path))
+
+    def needs_body(self, response):
+        """Whether matches() would have to look at the body of this response"""
+        return (response.status_code == self.status_code and not 300 <= self.status_code < 400
+                and _content_type(response) == self.content_type)
+
+    def matches(self, response, path):
+        if response.status_code != self.status_code:
+            return False
+        if 300 <= self.status_code < 400:
+            return _strip_path(response.headers.get('Location', '').encode('utf-8'), path) in self.locations
+        if _content_type(response) != self.content_type or not response.body_read or response.partial:
+            return False
+        body = _strip_path(response.content, path)
+        if _digest(body) in self.digests:
+            return True
+        if len(self.digests) < 2:
+            return False
+        spread = self.max_length - self.min_length
+        return self.min_length - spread <= len(body) <= self.max_length + spread
+
+class TargetProfile:
+    """
+    What one cheap look at a target showed, taken once per run.
+
+    Holds whether the target answered at all, the technologies its
+    responses named, the methods its OPTIONS answer allowed (None if it
+    listed none) and the soft-404 signatures of its missing pages.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.base_path = urlsplit(target).path.rstrip('/')
+        self.reachable = True
+        self.error = None
+        self.technologies = frozenset()
+        self.allowed_methods = None
+        self.signatures = []
+
+    def skip_reason(self, template):
+        """
+        Why a template cannot apply to this target
+
+        Returns:
+            str: The reason, or None when the template should run
+        """
+        if not self.reachable:
+            return f"unreachable ({self.error})"
+        wanted = _template_technologies(template)
+        for category in EXCLUSIVE_CATEGORIES:
+            required = {t for t in wanted if TECHNOLOGIES[t] == category}
+            seen = {t for t in self.technologies if TECHNOLOGIES[t] == category}
+            if required and seen and not required & seen:
+                return f"runs {', '.join(sorted(seen))}, not {', '.join(sorted(required))}"
+        return None
+
+    def variables(self):
+        """Values pre-conditions can test, e.g. contains(technologies, "php")"""
+        return {
+            'technologies': ','.join(sorted(self.technologies)),
+            'allowed_methods': ','.join(sorted(self.allowed_methods or ())),
+            'soft_404': bool(self.signatures),
+        }
+
+    def needs_body(self, url, response):
+        """
+        Whether telling a response (so far its status and headers) from
+        the soft-404 page takes its body, even if no matcher reads it
+        """
+        if not self.signatures or urlsplit(url).path.rstrip('/') == self.base_path:
+            return False
+        return any(signature.needs_body(response) for signature in self.signatures)
+
+    def is_soft_404(self, url, response):
+        """
+        Whether a response to a path other than the target's own is just
+        the host's page for missing paths
+        """
+        if not self.signatures:
+            return False
+        path = urlsplit(url).path
+        if path.rstrip('/') == self.base_path:
+            return False
+        return any(signature.matches(response, path) for signature in self.signatures)
+
+def _probe_url(target):
+    alphabet = string.ascii_lowercase + string.digits
+    return target.rstrip('/') + '/' + ''.join(secrets.choice(alphabet) for _ in range(PROBE_TOKEN_LENGTH))
+
+def fingerprint(target, client):
+    """
+    Profile a target with a few requests: its root page, random paths and
+    OPTIONS.
+
+    Returns:
+        TargetProfile: The profile; unreachable if the root page could not
+            be fetched for lack of a connection
+    """
+    profile = TargetProfile(target)
+    try:
+        root = client.request('GET', target)
+    except requests.exceptions.ConnectionError as e:
+        profile.reachable = False
+        profile.error = type(e).__name__
+        return profile
+    except requests.RequestException as e:
+        logger.debug(f"Baseline request to {target} failed: {str(e)}")
+        return profile
+    technologies = detect_technologies(root)
+
+    signatures = {}
+    for suffix in PROBE_SUFFIXES:
+        url = _probe_url(target) + suffix
+        try:
+            response = client.request('GET', url)
+        except requests.RequestException as e:
+            logger.debug(f"Baseline request to {url} failed: {str(e)}")
+            continue
+        technologies |= detect_technologies(response)
+        if response.status_code in NOT_FOUND_STATUSES or not response.body_read or response.partial:
+            continue
+        key = (response.status_code, _content_type(response))
+        if key not in signatures:
+            signatures[key] = Soft404Signature(*key)
+        signatures[key].add(response, urlsplit(url).path)
+    profile.signatures = list(signatures.values())
+
+    try:
+        options = client.request('OPTIONS', target)
+        allow = options.headers.get('Allow')
+        if allow and options.status_code < 400:
+            profile.allowed_methods = frozenset(m.strip().upper() for m in allow.split(',') if m.strip())
+    except requests.RequestException as e:
+        logger.debug(f"Baseline OPTIONS request to {target} failed: {str(e)}")
+    profile.technologies = frozenset(technologies)
+    return profile
+
+class ProfileCache:
+    """
+    Baseline profiles of a run's targets.
+
+    Every target is fingerprinted once; callers asking for a target that
+    is being fingerprinted wait for that instead of probing again.
+    """
+
+    def __init__(self, client):
+        """
+        Initialize the cache
+
+        Args:
+            client (HttpClient): Client the baseline requests are sent with
+        """
+        self.client = client
+        self._profiles = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get(self, target):
+        """Profile of target, fingerprinting it on first use"""
+        with self._lock:
+            profile = self._profiles.get(target)
+            if profile is not None:
+                return profile
+            flight = self._in_flight.get(target)
+            owner = flight is None
+            if owner:
+                flight = self._in_flight[target] = Future()
+        if not owner:
+            return flight.result()
+        try:
+            profile = fingerprint(target, self.client)
+            metrics.inc('baseline_targets_total', reachable=profile.reachable, soft_404=bool(profile.signatures))
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(target, None)
+        with self._lock:
+            self._profiles[target] = profile
+        flight.set_result(profile)
+        return profile
+
+    def prefetch(self, targets):
+        """
+        Fingerprint many targets concurrently
+
+        Returns:
+            dict: Target -> TargetProfile
+        """
+        with ThreadPoolExecutor(max_workers=self.client.concurrency, thread_name_prefix='pentoscan-baseline') as pool:
+            return dict(zip(targets, pool.map(self.get, targets)))
@@ -0,0 +1,390 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from core.metrics import metrics
+from core.payloads import PayloadError, count_combinations
+
+logger = logging.getLogger(__name__)
+
+# Payload combinations per work unit; larger payload sets are split over
+# several units so they spread across workers and checkpoint in pieces
+PAYLOAD_CHUNK_SIZE = 256
+
+# Per-process state, populated once by _init_worker
+_worker_templates = {}
+_worker_client = None
+_worker_profiler = None
+_worker_validators = None
+
+def read_targets(source):
+    """
+    Read target URLs from a file, or from stdin when source is '-'.
+    Blank lines and '#' comments are skipped, duplicates dropped.
+    """
+    handle = sys.stdin if source == '-' else open(source, 'r')
+    try:
+        seen = set()
+        targets = []
+        for line in handle:
+            target = line.strip()
+            if not target or target.startswith('#'):
+                continue
+            if '://' not in target:
+                target = f"http://{target}"
+            if target in seen:
+                continue
+            seen.add(target)
+            targets.append(target)
+        return targets
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+def payload_chunks(template, chunk_size=PAYLOAD_CHUNK_SIZE):
+    """
+    Split every http step of a template into ranges of payload indexes.
+
+    Returns:
+        list: Per step, a list of (start, end) ranges, or [None] when the
+            step runs as a single unit
+    """
+    if not template.http_steps:
+        return [[None]]
+    plan = []
+    for step in template.http_steps:
+        try:
+            count = count_combinations(step.get('payloads'), step.get('attack'), template.path)
+        except PayloadError:
+            # The scan itself reports the problem
+            count = 0
+        if count <= chunk_size:
+            plan.append([None])
+        else:
+            plan.append([(start, min(start + chunk_size, count)) for start in range(0, count, chunk_size)])
+    return plan
+
+def build_work_queue(targets, templates, plan, key=None):
+    """
+    Lazily expand targets x templates into (target, template_path, step, payloads) units.
+
+    ``plan`` maps template paths to their payload_chunks(); ``payloads`` is
+    the unit's range of payload indexes, or None for the whole step. With
+    ``key`` (a function of the template), units and ``plan`` use that
+    instead of the template path. Units are ordered by template, step and
+    payload chunk first and by target last, so consecutive units go to
+    different hosts and no single host receives a burst. The order is stable for the same inputs, which is what lets a
+    checkpoint refer to units by position.
+    """
+    for template in templates:
+        template_key = key(template) if key else template.path
+        for step, chunks in enumerate(plan[template_key]):
+            for payloads in chunks:
+                for target in targets:
+                    yield target, template_key, step, payloads
+
+def _init_worker(templates, client_options):
+    """Receive the parsed templates and open the HTTP client once per worker process"""
+    global _worker_client, _worker_profiler, _worker_validators
+    from core.http_client import HttpClient
+    from core.metrics import TemplateProfiler
+    from core.ratelimit import RateController
+    from core.response_cache import ResponseCache
+
+    logging.getLogger().setLevel(client_options.pop('log_level', logging.WARNING))
+    if client_options.pop('metrics', False):
+        metrics.enable()
+    profile_dir = client_options.pop('profile_dir', None)
+    if profile_dir:
+        _worker_profiler = TemplateProfiler(profile_dir, suffix=f".{os.getpid()}")
+    for template in templates:
+        _worker_templates[template.path] = template
+    state_db = client_options.pop('incremental', None)
+    if state_db:
+        from core.incremental import ValidatorStore
+        _worker_validators = ValidatorStore(state_db)
+    replay = client_options.pop('replay', None)
+    if replay:
+        from core.archive import ReplayClient, ResponseArchive
+        _worker_client = ReplayClient(ResponseArchive(replay))
+        return
+    record = client_options.pop('record', None)
+    if record:
+        from core.archive import ArchiveWriter
+        # One segment per worker; the index is shared
+        client_options['archive'] = ArchiveWriter(record)
+    # Each worker shares responses between the templates it runs
+    cache_size = client_options.pop('cache_size', 0)
+    if cache_size > 0:
+        client_options['cache'] = ResponseCache(cache_size)
+    client_options['rate_controller'] = RateController(
+        client_options.get('per_host', 6),
+        max_rate=client_options.pop('max_rate', None),
+        adaptive=client_options.pop('adaptive', True),
+    )
+    _worker_client = HttpClient(**client_options)
+
+def _run_unit(target, template_path, step, payloads, profile=None, variables=None):
+    """
+    Execute one work unit inside a worker, with the target's baseline profile if any
+    and the template variables shared by all units of its (target, template) pair.
+
+    Returns:
+        tuple: (the unit's ScanResult.to_partial(), metrics collected since
+            the last unit or None)
+    """
+    from core.metrics import metrics
+    from core.scanner import run_scan
+
+    template = _worker_templates[template_path]
+    steps = [step] if template.http_steps else None
+    if _worker_profiler is not None:
+        with _worker_profiler.profile(template.id):
+            scan_result = run_scan(target, template, client=_worker_client, steps=steps, payloads=payloads,
+                                   validators=_worker_validators, profile=profile, variables=variables)
+    else:
+        scan_result = run_scan(target, template, client=_worker_client, steps=steps, payloads=payloads,
+                               validators=_worker_validators, profile=profile, variables=variables)
+    snapshot = metrics.snapshot(reset=True) if metrics.enabled else None
+    partial = scan_result.to_partial()
+    scan_result.close()
+    return partial, snapshot
+
+def stop_steps(template):
+    """Indexes of the template's http steps that end at their first match"""
+    return [index for index, step in enumerate(template.http_steps) if step.get('stop-at-first-match')]
+
+class ResultMerger:
+    """
+    Folds per-unit scan results into one result per (target, template) pair.
+
+    Units are (target, template_key, step, payloads) tuples, where the
+    template key is whatever the caller identifies templates by. Their
+    findings are appended to one ScanResult per pair as they arrive, so
+    beyond the first few hundred of a pair they wait on disk rather than
+    in memory (see FindingLog). Once every unit of a pair has finished,
+    its ScanResult goes to ``on_result``, which then owns it and should
+    save or close() it. With a checkpoint, progress is kept in it (and
+    saved when due) so that units completed before a resume are skipped.
+    """
+
+    def __init__(self, templates, plans, stop_steps, on_result, checkpoint=None):
+        """
+        Initialize the merger
+
+        Args:
+            templates (dict): Template key -> template
+            plans (dict): Template key -> payload_chunks() of the template
+            stop_steps (set): (template key, step) pairs that stop at the
+                first match
+            on_result (callable): Called with (target, ScanResult)
+            checkpoint (Checkpoint, optional): Where progress is kept
+        """
+        self.templates = templates
+        self.plans = plans
+        self.unit_counts = {key: sum(len(chunks) for chunks in plan) for key, plan in plans.items()}
+        self.stop_steps = stop_steps
+        self.on_result = on_result
+        self.checkpoint = checkpoint
+        self.units_left = {}
+        # Progress lives in the checkpoint when there is one, so it is
+        # saved as it stands
+        self.merged = checkpoint.partial if checkpoint is not None else {}
+        self.stopped = checkpoint.stopped if checkpoint is not None else set()
+        self.completed = checkpoint.completed if checkpoint is not None else None
+        for key, partial in list(self.merged.items()):
+            # Findings of a resumed checkpoint come back as plain dicts
+            if isinstance(partial, dict):
+                self.merged[key] = self._result(key)
+                self.merged[key].add_partial(partial)
+
+    def _result(self, key):
+        from core.scanner import ScanResult
+
+        target, template_key = key
+        return ScanResult(self.templates[template_key], target)
+
+    def skip(self, index, unit):
+        """Whether a unit was done before a resume, or cut short by stop-at-first-match"""
+        target, template_key, step, _ = unit
+        if self.completed is not None and index is not None and index in self.completed:
+            return True
+        return (target, template_key, step) in self.stopped
+
+    def finish(self, index, unit, partial):
+        """
+        Account for a finished (or skipped) unit
+
+        Args:
+            index (int, optional): Position of the unit in the work queue
+            unit (tuple): The unit
+            partial (dict, optional): Its ScanResult.to_partial(), None if
+                skipped or failed
+        """
+        target, template_key, step, _ = unit
+        key = (target, template_key)
+        # Chunks of a step that already matched are dropped, as a single
+        # scan would never have sent them
+        if partial is not None and (target, template_key, step) not in self.stopped:
+            if key not in self.merged:
+                self.merged[key] = self._result(key)
+            self.merged[key].add_partial(partial)
+            if partial['vulnerable'] and (template_key, step) in self.stop_steps:
+                self.stopped.add((target, template_key, step))
+        if self.completed is not None and index is not None:
+            self.completed.add(index)
+
+        self.units_left.setdefault(key, self.unit_counts[template_key])
+        self.units_left[key] -= 1
+        if self.units_left[key] == 0:
+            del self.units_left[key]
+            for step_index in range(len(self.plans[template_key])):
+                self.stopped.discard((target, template_key, step_index))
+            result = self.merged.pop(key, None)
+            if result is not None:
+                self.on_result(target, result)
+        if self.checkpoint is not None:
+            self.checkpoint.save_due()
+
+class BatchScheduler:
+    """
+    Spread a (target, template, step, payload range) work queue over a process pool.
+
+    Every worker process keeps its own parsed templates and pooled HTTP
+    client. Findings are merged per (target, template) in the parent (see
+    ResultMerger) and handed to a single sink once all units of that pair
+    are done.
+    """
+
+    def __init__(self, targets, templates, workers=None, client_options=None, window=None,
+                 chunk_size=PAYLOAD_CHUNK_SIZE):
+        """
+        Initialize the scheduler
+
+        Args:
+            targets (list): Target URLs
+            templates (list): Template objects (must have been loaded from a path)
+            workers (int, optional): Worker processes, defaults to the CPU count
+            client_options (dict, optional): Keyword arguments for HttpClient,
+                plus 'cache_size' in bytes for a per-worker ResponseCache,
+                'max_rate'/'adaptive' for its RateController, 'metrics' to
+                collect metrics into the parent's registry, 'profile_dir'
+                for per-template profiles, 'incremental' for the
+                ValidatorStore database, 'record' for an archive directory
+                to record responses in and 'replay' for one to answer
+                every request from instead of HttpClient
+            window (int, optional): Maximum units submitted but not finished
+            chunk_size (int): Payload combinations per work unit
+        """
+        self.targets = targets
+        self.templates = [t for t in templates if t.path]
+        self.workers = workers or os.cpu_count() or 1
+        self.client_options = dict(client_options or {})
+        self.window = window or self.workers * 4
+        self.plan = {t.path: payload_chunks(t, chunk_size) for t in self.templates}
+
+    @property
+    def total_units(self):
+        return len(self.targets) * sum(len(chunks) for t in self.templates for chunks in self.plan[t.path])
+
+    def fingerprint(self):
+        """Identifies the work queue; a checkpoint only applies to the same queue"""
+        queue = [self.targets, [[t.path, self.plan[t.path]] for t in self.templates]]
+        return hashlib.sha1(json.dumps(queue).encode('utf-8')).hexdigest()
+
+    def run(self, on_result, checkpoint=None, profiles=None):
+        """
+        Execute the whole queue.
+
+        Args:
+            on_result (callable): Called with (target, ScanResult) once
+                every unit of a (target, template) pair has completed; it
+                should save or close() the result
+            checkpoint (Checkpoint, optional): Records progress as units
+                complete; units it already lists as completed are skipped
+            profiles (dict, optional): Target -> baseline TargetProfile;
+                units of templates that cannot apply to their target are
+                skipped, the others run with the profile
+
+        Returns:
+            int: Number of work units executed
+        """
+        from core.scanner import template_variables
+
+        templates = {t.path: t for t in self.templates}
+        merger = ResultMerger(
+            templates,
+            {t.path: self.plan[t.path] for t in self.templates},
+            {(t.path, index) for t in self.templates for index in stop_steps(t)},
+            on_result,
+            checkpoint=checkpoint,
+        )
+        options = {**self.client_options, 'log_level': logging.getLogger().level}
+        units = enumerate(build_work_queue(self.targets, self.templates, self.plan))
+        # Template variables of the (target, template) pairs under way, so
+        # every unit of a pair sends the same random values, also after a resume
+        variables = checkpoint.variables if checkpoint is not None else {}
+        pending = {}
+        executed = 0
+
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.templates, options),
+        )
+
+        def fill():
+            while len(pending) < self.window:
+                item = next(units, None)
+                if item is None:
+                    return
+                index, unit = item
+                if merger.skip(index, unit):
+                    finish(index, unit, None)
+                    continue
+                profile = profiles.get(unit[0]) if profiles else None
+                if profile is not None and profile.skip_reason(templates[unit[1]]):
+                    metrics.inc('baseline_skipped_units_total')
+                    finish(index, unit, None)
+                    continue
+                pair = unit[:2]
+                if pair not in variables:
+                    variables[pair] = template_variables(unit[0], templates[unit[1]], profile)
+                pending[pool.submit(_run_unit, *unit, profile, variables[pair])] = (index, unit)
+
+        def finish(index, unit, partial):
+            merger.finish(index, unit, partial)
+            if unit[:2] not in merger.units_left:
+                # Every unit of the pair is done
+                variables.pop(unit[:2], None)
+
+        try:
+            fill()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, unit = pending.pop(future)
+                    executed += 1
+                    try:
+                        partial, snapshot = future.result()
+                        if snapshot:
+                            metrics.merge(snapshot)
+                    except BrokenProcessPool:
+                        # A worker was killed; the unit is not done
+                        raise
+                    except Exception as e:
+                        logger.error(f"Work unit {unit[0]} / {unit[1]} failed: {str(e)}")
+                        partial = None
+                    finish(index, unit, partial)
+                fill()
+        except BaseException:
+            # Interrupted: do not wait for units that will be redone anyway
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+
+        return executed
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from pathlib import Path
+
+from core.defaults import DEFAULT_CHECKPOINT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 2
+CHECKPOINT_DIR = 'checkpoints'
+
+class CheckpointError(Exception):
+    """Custom exception for checkpoint-related errors"""
+    pass
+
+class RangeSet:
+    """
+    A set of non-negative integers kept as sorted, disjoint [start, end) ranges.
+
+    Work finishes roughly in queue order, so the completed units of even a
+    very long run collapse into a handful of ranges.
+    """
+
+    def __init__(self, ranges=None):
+        self._starts = []
+        self._ends = []
+        for start, end in ranges or ():
+            self.add_range(start, end)
+
+    def add(self, value):
+        self.add_range(value, value + 1)
+
+    def add_range(self, start, end):
+        # Merge every range that overlaps or touches [start, end)
+        lo = bisect_left(self._ends, start)
+        hi = bisect_right(self._starts, end)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+
+    def __contains__(self, value):
+        index = bisect_right(self._starts, value) - 1
+        return index >= 0 and value < self._ends[index]
+
+    def __len__(self):
+        return sum(end - start for start, end in zip(self._starts, self._ends))
+
+    def to_list(self):
+        return [[start, end] for start, end in zip(self._starts, self._ends)]
+
+def _plain(result, method):
+    # Results are ScanResults once a run has them, dicts when just loaded
+    return result if isinstance(result, dict) else getattr(result, method)()
+
+def checkpoint_path(output_dir, run_id):
+    """Where the checkpoint of a run lives"""
+    return Path(output_dir) / CHECKPOINT_DIR / f"{run_id}.json"
+
+def new_run_id(output_dir):
+    """A timestamp run id that no checkpoint in output_dir uses yet"""
+    base = datetime.now().strftime('%Y%m%d_%H%M%S')
+    run_id = base
+    counter = 1
+    while checkpoint_path(output_dir, run_id).exists():
+        run_id = f"{base}_{counter}"
+        counter += 1
+    return run_id
+
+class Checkpoint:
+    """
+    Progress of one batch run, saved atomically next to its results.
+
+    The work queue is deterministic, so units are identified by their
+    position in it; each unit covers one (target, template, step) and a
+    range of payload indexes. Completed units are kept as ranges of
+    positions. Findings and template variables of (target, template) pairs
+    with units still outstanding, steps stopped by stop-at-first-match and
+    findings waiting for their exploit module are saved as well, together with the position
+    the result file had reached, so a resumed run neither repeats work nor
+    emits a finding twice.
+
+    Saving is cheap (a small JSON file written with one rename) and happens
+    at most every ``interval`` seconds; call save_due() as work completes.
+    """
+
+    def __init__(self, path, run_id, spec, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """
+        Initialize an empty checkpoint
+
+        Args:
+            path (str): Checkpoint file
+            run_id (str): Identifies the run and its result file
+            spec (dict): What the run covers; checked again on resume
+            interval (float): Minimum seconds between periodic saves
+        """
+        self.path = Path(path)
+        self.run_id = run_id
+        self.spec = spec
+        self.interval = interval
+        self.completed = RangeSet()
+        # (target, template_path) -> ScanResult merged so far (a plain
+        # to_partial() dict until a resumed run picks it up)
+        self.partial = {}
+        # (target, template_path, step) stopped after a match
+        self.stopped = set()
+        # (target, template_path) -> template variables its units share
+        self.variables = {}
+        # key -> ScanResult (or its dict) whose exploit has not finished yet
+        self.deferred = {}
+        self.emitted = 0
+        self.complete = False
+        self.results = None
+        self.sink = None
+        self._saved = time.monotonic()
+
+    @classmethod
+    def create(cls, output_dir, run_id, spec, targets, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """Start a new run's checkpoint, keeping its target list beside it"""
+        path = checkpoint_path(output_dir, run_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            raise CheckpointError(f"Run {run_id} already has a checkpoint")
+        path.with_suffix('.targets').write_text(''.join(f"{target}\n" for target in targets))
+        return cls(path, run_id, spec, interval)
+
+    @classmethod
+    def load(cls, output_dir, run_id, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """
+        Read the checkpoint of an earlier run
+
+        Raises:
+            CheckpointError: If there is no usable checkpoint for the run
+        """
+        path = checkpoint_path(output_dir, run_id)
+        try:
+            state = json.loads(path.read_text())
+        except FileNotFoundError:
+            raise CheckpointError(f"No checkpoint for run {run_id} in {path.parent}")
+        except (OSError, ValueError) as e:
+            raise CheckpointError(f"Unreadable checkpoint {path}: {str(e)}")
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise CheckpointError(f"Checkpoint {path} was written by an incompatible version")
+        if state.get('complete'):
+            raise CheckpointError(f"Run {run_id} already completed")
+
+        checkpoint = cls(path, run_id, state['spec'], interval)
+        checkpoint.completed = RangeSet(state['completed'])
+        checkpoint.partial = {tuple(item['key']): item['result'] for item in state['partial']}
+        checkpoint.stopped = {tuple(key) for key in state['stopped']}
+        checkpoint.variables = {tuple(item['key']): item['variables'] for item in state['variables']}
+        checkpoint.deferred = {tuple(item['key']): item['result'] for item in state['deferred']}
+        checkpoint.emitted = state['emitted']
+        checkpoint.results = state['results']
+        return checkpoint
+
+    @property
+    def targets_path(self):
+        return self.path.with_suffix('.targets')
+
+    def targets(self):
+        """The target list the run was started with"""
+        try:
+            return self.targets_path.read_text().splitlines()
+        except OSError as e:
+            raise CheckpointError(f"Cannot read targets of run {self.run_id}: {str(e)}")
+
+    def finding_emitted(self):
+        """
+        Count a saved finding.
+
+        Per-file results cannot be rolled back like a result stream, so
+        the checkpoint is saved right away to keep the finding from being
+        emitted again after a crash.
+        """
+        self.emitted += 1
+        if not getattr(self.sink, 'resumable', False):
+            self.save()
+
+    def save_due(self):
+        """Save if the last save is at least ``interval`` seconds old"""
+        if time.monotonic() - self._saved >= self.interval:
+            self.save()
+
+    def save(self):
+        """Write the checkpoint, first making saved findings durable"""
+        if self.sink is not None:
+            self.results = self.sink.sync()
+        partial = [(key, _plain(result, 'to_partial')) for key, result in self.partial.items()]
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'run_id': self.run_id,
+            'updated': datetime.now().isoformat(),
+            'spec': self.spec,
+            'complete': self.complete,
+            'completed': self.completed.to_list(),
+            'partial': [{'key': list(key), 'result': result} for key, result in partial if result['results']],
+            'stopped': sorted(list(key) for key in self.stopped),
+            'variables': [{'key': list(key), 'variables': variables} for key, variables in self.variables.items()],
+            'deferred': [{'key': list(key), 'result': _plain(result, 'to_dict')}
+                         for key, result in self.deferred.items()],
+            'emitted': self.emitted,
+            'results': self.results,
+        }
+        temp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(state, f, separators=(',', ':'), default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to save checkpoint {self.path}: {str(e)}")
+        self._saved = time.monotonic()
+
+    def finish(self):
+        """Mark the run complete; the target list is no longer needed"""
+        self.complete = True
+        self.partial.clear()
+        self.stopped.clear()
+        self.variables.clear()
+        self.save()
+        try:
+            self.targets_path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,727 @@
+import hmac
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from core.defaults import DEFAULT_DAEMON_ADDRESS, DEFAULT_DAEMON_PORT, DEFAULT_JOB_SLOTS
+from core.distributed import TOKEN_HEADER
+from core.loader import filter_templates, load_templates
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 1
+# Finished jobs kept for status and result queries
+DEFAULT_JOB_HISTORY = 256
+# A result stream with nothing new sends a blank line this often, so
+# idle connections stay open and gone clients are noticed
+STREAM_KEEPALIVE = 15.0
+DEFAULT_CLIENT_TIMEOUT = 60.0
+# Connections waiting to be accepted; many CI jobs may connect at once
+LISTEN_BACKLOG = 128
+JOB_STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+FINAL_STATES = ('done', 'failed', 'cancelled')
+
+class DaemonError(Exception):
+    """Custom exception for scan daemon errors"""
+    pass
+
+def parse_address(address):
+    """
+    Split a daemon address: 'unix:/path/to.sock' for a Unix socket,
+    otherwise 'http://host:port' or 'host:port'
+
+    Returns:
+        tuple: ('unix', path) or ('tcp', host, port)
+    """
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    parts = urlsplit(address if '://' in address else f"http://{address}")
+    return 'tcp', parts.hostname or '127.0.0.1', parts.port or DEFAULT_DAEMON_PORT
+
+def _targets(value):
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not value:
+        raise DaemonError("A job needs at least one target")
+    targets = []
+    for target in value:
+        if not isinstance(target, str) or not target.strip():
+            raise DaemonError(f"Invalid target {target!r}")
+        target = target.strip()
+        if '://' not in target:
+            target = f"http://{target}"
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+def _names(value):
+    # Filters may come as a list or one comma-separated string
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(name).strip() for name in value if str(name).strip()] if value else None
+
+class Job:
+    """
+    One submitted scan: every selected template against every target.
+
+    Records of vulnerable scans are kept in the order they were found, in
+    the form result files use, so any number of readers can stream them
+    from any offset while the job runs.
+    """
+
+    def __init__(self, targets, templates, baseline=True, exploit=True):
+        self.id = uuid.uuid4().hex[:16]
+        self.targets = targets
+        self.templates = templates
+        self.baseline = baseline
+        self.exploit = exploit
+        self.state = 'queued'
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.total_scans = len(targets) * len(templates)
+        self.finished_scans = 0
+        self.skipped_scans = 0
+        self.records = []
+        self.cancelled = False
+        self.future = None
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.state in FINAL_STATES
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                'id': self.id,
+                'state': self.state,
+                'error': self.error,
+                'targets': len(self.targets),
+                'templates': len(self.templates),
+                'total_scans': self.total_scans,
+                'finished_scans': self.finished_scans,
+                'skipped_scans': self.skipped_scans,
+                'findings': len(self.records),
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+            }
+
+    def start(self):
+        """Mark the job running, unless it was cancelled while queued"""
+        with self._cond:
+            if self.cancelled:
+                return False
+            self.state = 'running'
+            self.started = time.time()
+            return True
+
+    def add(self, record=None, skipped=False):
+        """Account for one finished scan and its record, if it found something"""
+        with self._cond:
+            self.finished_scans += 1
+            if skipped:
+                self.skipped_scans += 1
+            if record is not None:
+                self.records.append(record)
+                self._cond.notify_all()
+
+    def finish(self, state, error=None):
+        with self._cond:
+            self.state = state
+            self.error = error
+            self.finished = time.time()
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Stop the job after the scan it is running; a queued job never starts"""
+        with self._cond:
+            if self.done:
+                return
+            self.cancelled = True
+        if self.future is not None and self.future.cancel():
+            self.finish('cancelled')
+
+    def records_after(self, offset, timeout=None):
+        """
+        Wait until there are records past offset or the job has ended
+
+        Returns:
+            tuple: (new records, whether the job has ended)
+        """
+        with self._cond:
+            if len(self.records) <= offset and not self.done:
+                self._cond.wait(timeout)
+            return self.records[offset:], self.done
+
+class ScanDaemon:
+    """
+    Long-running scanner answering scan jobs over a local HTTP API.
+
+    Templates are parsed and compiled once, job slots keep their warmed V8
+    contexts, and every job shares one HttpClient, so its connection pools,
+    per-host limits and exploit modules stay warm between jobs. Each job
+    gets its own response cache so responses are never reused across jobs.
+
+    The daemon listens on a TCP port or, for an address 'unix:PATH', on a
+    Unix socket only the owner can connect to. The protocol is JSON over
+    HTTP:
+
+    - ``GET /status``: templates, slots and job counts
+    - ``GET /templates``: ids of the loaded templates
+    - ``POST /reload``: parse new or modified templates
+    - ``POST /jobs``: queue a job ``{"targets": [...], "templates": [ids],
+      "tags": [...], "severity": [...], "baseline": true, "exploit": true}``;
+      everything but targets is optional
+    - ``GET /jobs``: recent jobs
+    - ``GET /jobs/<id>``: a job's status
+    - ``GET /jobs/<id>/results?offset=N``: newline-delimited JSON, one
+      ``{"record": ...}`` line per vulnerable scan as it is found, then a
+      final ``{"job": ...}`` line once the job has ended
+    - ``DELETE /jobs/<id>``: cancel a job
+    """
+
+    def __init__(self, template_dir, client, address=DEFAULT_DAEMON_ADDRESS, slots=DEFAULT_JOB_SLOTS,
+                 token=None, use_cache=True, cache_size=0, validators=None, exploits=None,
+                 history=DEFAULT_JOB_HISTORY):
+        """
+        Initialize the daemon and load its templates
+
+        Args:
+            template_dir (str): Directory jobs select templates from
+            client (HttpClient): Client shared by all jobs
+            address (str): 'http://host:port' or 'unix:PATH' to listen on
+            slots (int): Jobs running at the same time
+            token (str, optional): Shared secret clients must send
+            use_cache (bool): Load templates through the template cache
+            cache_size (int): Bytes of each job's ResponseCache (0 disables)
+            validators (ValidatorStore, optional): Previous responses, for
+                incremental scans
+            exploits (ExploitRunner, optional): Runs exploit modules of
+                vulnerable templates; without one, none are run
+            history (int): Finished jobs kept for queries
+
+        Raises:
+            DaemonError: If the address is in use
+        """
+        self.template_dir = template_dir
+        self.client = client
+        self.slots = max(1, slots)
+        self.token = token
+        self.use_cache = use_cache
+        self.cache_size = cache_size
+        self.validators = validators
+        self.exploits = exploits
+        self.history = history
+        self.started = time.time()
+        self.templates = {}
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._socket_path = None
+        self._httpd = self._server(address)
+        self.reload()
+        self._executor = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix='pentoscan-job',
+                                            initializer=self._warm_slot)
+
+    @property
+    def url(self):
+        if self._socket_path:
+            return f"unix:{self._socket_path}"
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reload(self):
+        """
+        Load new or modified templates from the template directory
+
+        Returns:
+            int: Number of templates loaded
+        """
+        templates = {}
+        for template in load_templates(self.template_dir, use_cache=self.use_cache):
+            if template.id in templates:
+                logger.warning(f"Template id {template.id} is used by both {templates[template.id].path} "
+                               f"and {template.path}; keeping the latter")
+            # Compiled here once rather than by the first job using them
+            template.compiled_steps
+            templates[template.id] = template
+        with self._lock:
+            self.templates = templates
+        logger.info(f"Daemon loaded {len(templates)} templates from {self.template_dir}")
+        return len(templates)
+
+    def _javascript_steps(self):
+        with self._lock:
+            templates = list(self.templates.values())
+        return [step['code'] for t in templates for step in t.javascript or ()]
+
+    def _start_javascript(self):
+        # V8 must start on the thread serving the daemon before any slot
+        # thread builds a context. It is started even without javascript
+        # templates, since a later reload may bring some in from a request
+        # handler thread.
+        try:
+            from core.javascript import init_engine
+            init_engine()
+        except Exception as e:
+            logger.debug(f"Could not start javascript engine: {str(e)}")
+
+    def _warm_slot(self):
+        # Contexts are only built when some template runs javascript; the
+        # pool builds them one slot at a time
+        codes = self._javascript_steps()
+        if not codes:
+            return
+        from core.javascript import get_pool
+        try:
+            get_pool().warm(codes)
+        except Exception as e:
+            logger.debug(f"Could not warm javascript context: {str(e)}")
+
+    def _server(self, address):
+        import socketserver
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        daemon = self
+        kind, *where = parse_address(address)
+        routes = {
+            ('GET', 'status'): lambda body, job_id, query: daemon.status(),
+            ('GET', 'templates'): lambda body, job_id, query: {'templates': sorted(daemon.templates)},
+            ('POST', 'reload'): lambda body, job_id, query: {'templates': daemon.reload()},
+            ('POST', 'jobs'): lambda body, job_id, query: daemon.submit(body).to_dict(),
+            ('GET', 'jobs'): lambda body, job_id, query: {'jobs': daemon.jobs()},
+            ('GET', 'jobs/'): lambda body, job_id, query: daemon.job(job_id).to_dict(),
+            ('DELETE', 'jobs/'): lambda body, job_id, query: daemon.cancel(job_id).to_dict(),
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes
+            disable_nagle_algorithm = kind == 'tcp'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, job, offset):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+                def chunk(data):
+                    self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+
+                while True:
+                    records, done = job.records_after(offset, timeout=STREAM_KEEPALIVE)
+                    offset += len(records)
+                    lines = [json.dumps({'record': record}, separators=(',', ':'), default=str)
+                             for record in records]
+                    if done:
+                        lines.append(json.dumps({'job': job.to_dict()}, separators=(',', ':')))
+                    chunk(('\n'.join(lines) + '\n').encode('utf-8'))
+                    if done:
+                        break
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                if daemon.token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), daemon.token):
+                    return self._reply(403, {'error': 'Invalid token'})
+                parts = urlsplit(self.path)
+                query = dict(parse_qsl(parts.query))
+                path = parts.path.strip('/')
+                job_id = None
+                if path.startswith('jobs/'):
+                    path, _, job_id = path.partition('/')
+                    path += '/'
+                    if job_id.endswith('/results') and self.command == 'GET':
+                        try:
+                            job = daemon.job(job_id[:-len('/results')])
+                            offset = int(query.get('offset', 0))
+                        except KeyError as e:
+                            return self._reply(404, {'error': str(e.args[0])})
+                        except ValueError as e:
+                            return self._reply(400, {'error': f"Bad request: {str(e)}"})
+                        try:
+                            return self._stream(job, offset)
+                        except OSError:
+                            # The client went away; the job carries on
+                            self.close_connection = True
+                            return None
+                route = routes.get((self.command, path))
+                if route is None:
+                    return self._reply(404, {'error': f"Unknown endpoint {self.command} {parts.path}"})
+                try:
+                    body = json.loads(raw) if raw else {}
+                    return self._reply(200, route(body, job_id, query))
+                except KeyError as e:
+                    return self._reply(404, {'error': str(e.args[0]) if e.args else 'Not found'})
+                except DaemonError as e:
+                    return self._reply(400, {'error': str(e)})
+                except (TypeError, ValueError) as e:
+                    return self._reply(400, {'error': f"Bad request: {str(e)}"})
+
+            do_GET = do_POST = do_DELETE = _handle
+
+        try:
+            if kind == 'unix':
+                path = where[0]
+                self._claim_socket(path)
+
+                class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                    request_queue_size = LISTEN_BACKLOG
+
+                # Only the owner may submit scans through the socket
+                umask = os.umask(0o177)
+                try:
+                    httpd = UnixHTTPServer(path, Handler)
+                finally:
+                    os.umask(umask)
+                self._socket_path = path
+            else:
+                class TCPHTTPServer(ThreadingHTTPServer):
+                    request_queue_size = LISTEN_BACKLOG
+
+                httpd = TCPHTTPServer((where[0], where[1]), Handler)
+        except OSError as e:
+            raise DaemonError(f"Cannot listen on {address}: {str(e)}")
+        httpd.daemon_threads = True
+        return httpd
+
+    def _claim_socket(self, path):
+        # A socket file left by a daemon that died is removed; one still
+        # answering belongs to a running daemon
+        if not os.path.exists(path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            raise DaemonError(f"A daemon is already listening on unix:{path}")
+        finally:
+            probe.close()
+
+    def status(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            template_count = len(self.templates)
+        counts = {state: 0 for state in JOB_STATES}
+        for job in jobs:
+            counts[job.state] += 1
+        return {
+            'version': PROTOCOL_VERSION,
+            'uptime': round(time.time() - self.started, 1),
+            'templates': template_count,
+            'slots': self.slots,
+            'jobs': counts,
+        }
+
+    def jobs(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown job {job_id}")
+        return job
+
+    def cancel(self, job_id):
+        job = self.job(job_id)
+        job.cancel()
+        return job
+
+    def submit(self, spec):
+        """
+        Queue a job
+
+        Args:
+            spec (dict): 'targets' plus optional 'templates' (ids), 'tags',
+                'severity', 'baseline' and 'exploit'
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            DaemonError: If the spec is invalid or selects no templates
+        """
+        if self._stop.is_set():
+            raise DaemonError("The daemon is shutting down")
+        if not isinstance(spec, dict):
+            raise DaemonError("A job must be a JSON object")
+        targets = _targets(spec.get('targets'))
+        with self._lock:
+            available = self.templates
+        template_ids = spec.get('templates')
+        if template_ids:
+            missing = [template_id for template_id in template_ids if template_id not in available]
+            if missing:
+                raise DaemonError(f"Unknown templates: {', '.join(map(str, missing))}")
+            templates = [available[template_id] for template_id in dict.fromkeys(template_ids)]
+        else:
+            templates = list(available.values())
+        templates = filter_templates(templates, _names(spec.get('tags')), _names(spec.get('severity')))
+        if not templates:
+            raise DaemonError("No templates match the job")
+
+        job = Job(targets, templates, baseline=spec.get('baseline', True) is not False,
+                  exploit=spec.get('exploit', True) is not False)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        metrics.inc('daemon_jobs_submitted_total')
+        logger.info(f"Job {job.id}: {len(targets)} targets x {len(templates)} templates")
+        return job
+
+    def _run(self, job):
+        from core.baseline import ProfileCache
+        from core.logger import result_record
+        from core.response_cache import ResponseCache
+        from core.scanner import run_scan
+
+        if not job.start():
+            return
+        client = self.client.with_cache(ResponseCache(self.cache_size)) if self.cache_size > 0 else self.client
+        state = 'done'
+        error = None
+        try:
+            profiles = ProfileCache(client) if job.baseline else None
+            if profiles is not None and len(job.targets) > 1:
+                profiles.prefetch(job.targets)
+            for target in job.targets:
+                profile = profiles.get(target) if profiles is not None else None
+                for template in job.templates:
+                    if job.cancelled:
+                        break
+                    if profile is not None and profile.skip_reason(template):
+                        job.add(skipped=True)
+                        continue
+                    scan_result = run_scan(target, template, client=client, validators=self.validators,
+                                           profile=profile)
+                    if not scan_result.vulnerable:
+                        scan_result.close()
+                        job.add()
+                        continue
+                    exploit_result = None
+                    if job.exploit and template.exploit_module and self.exploits is not None:
+                        exploit_result = self.exploits.result(
+                            self.exploits.submit(template.exploit_module, target, scan_result))
+                    job.add(result_record(scan_result, exploit_result))
+                    scan_result.close()
+            if job.cancelled:
+                state = 'cancelled'
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            state, error = 'failed', str(e)
+        finally:
+            job.finish(state, error)
+            metrics.inc('daemon_jobs_total', state=state)
+            self._forget_old_jobs()
+        logger.info(f"Job {job.id} {state}: {len(job.records)} vulnerable scans")
+
+    def _forget_old_jobs(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.done]
+            for job_id in finished[:max(0, len(finished) - self.history)]:
+                del self._jobs[job_id]
+
+    def serve(self):
+        """Start answering clients in a background thread, with every job slot started"""
+        self._start_javascript()
+        # Slot threads start (and warm up) on demand; start them all now so
+        # the first jobs do not pay for it
+        barrier = threading.Barrier(self.slots)
+        for _ in range(self.slots):
+            self._executor.submit(barrier.wait)
+        threading.Thread(target=self._httpd.serve_forever, name='pentoscan-daemon', daemon=True).start()
+        logger.info(f"Daemon listening on {self.url}")
+        return self
+
+    def wait(self):
+        """Block until close() is called from another thread"""
+        while not self._stop.wait(1.0):
+            pass
+
+    def close(self):
+        """Stop listening and cancel every job; running ones stop after their current scan"""
+        self._stop.set()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._socket_path:
+            try:
+                os.unlink(self._socket_path)
+            except OSError:
+                pass
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self.serve()
+
+    def __exit__(self, *exc):
+        self.close()
+
+class DaemonClient:
+    """
+    Submits jobs to a ScanDaemon and reads their results.
+
+    Uses http.client only, so a short-lived client process does not load
+    the HTTP stack the scans themselves use.
+    """
+
+    def __init__(self, address=DEFAULT_DAEMON_ADDRESS, token=None, timeout=DEFAULT_CLIENT_TIMEOUT):
+        """
+        Initialize the client
+
+        Args:
+            address (str): 'http://host:port' or 'unix:PATH' of the daemon
+            token (str, optional): Shared secret expected by the daemon
+            timeout (float): Socket timeout in seconds
+        """
+        self.address = address
+        self.token = token
+        self.timeout = timeout
+        self._conn = None
+
+    def _connect(self):
+        import http.client
+
+        kind, *where = parse_address(self.address)
+        if kind == 'tcp':
+            return http.client.HTTPConnection(where[0], where[1], timeout=self.timeout)
+        path = where[0]
+
+        class UnixHTTPConnection(http.client.HTTPConnection):
+            def connect(self):
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.settimeout(self.timeout)
+                self.sock.connect(path)
+
+        return UnixHTTPConnection('localhost', timeout=self.timeout)
+
+    def _request(self, conn, method, path, payload=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+        except OSError as e:
+            conn.close()
+            raise DaemonError(f"Daemon unreachable at {self.address}: {str(e)}")
+        if response.status != 200:
+            data = response.read()
+            try:
+                error = json.loads(data).get('error')
+            except ValueError:
+                error = data[:200].decode('utf-8', 'replace')
+            raise DaemonError(f"Daemon refused {method} {path}: {error}")
+        return response
+
+    def _call(self, method, path, payload=None):
+        if self._conn is None:
+            self._conn = self._connect()
+        response = self._request(self._conn, method, path, payload)
+        try:
+            return json.loads(response.read())
+        except OSError as e:
+            self.close()
+            raise DaemonError(f"Daemon unreachable at {self.address}: {str(e)}")
+
+    def status(self):
+        return self._call('GET', '/status')
+
+    def templates(self):
+        return self._call('GET', '/templates')['templates']
+
+    def reload(self):
+        """Have the daemon pick up template changes; returns the number loaded"""
+        return self._call('POST', '/reload')['templates']
+
+    def submit(self, targets, templates=None, tags=None, severity=None, baseline=True, exploit=True):
+        """
+        Queue a job
+
+        Returns:
+            dict: The job's status, including its 'id'
+        """
+        spec = {'targets': list(targets), 'baseline': baseline, 'exploit': exploit}
+        for name, value in (('templates', templates), ('tags', tags), ('severity', severity)):
+            if value:
+                spec[name] = list(value)
+        return self._call('POST', '/jobs', spec)
+
+    def jobs(self):
+        return self._call('GET', '/jobs')['jobs']
+
+    def job(self, job_id):
+        return self._call('GET', f"/jobs/{job_id}")
+
+    def cancel(self, job_id):
+        return self._call('DELETE', f"/jobs/{job_id}")
+
+    def results(self, job_id, offset=0):
+        """
+        Stream a job's records as they are found
+
+        Yields:
+            dict: {'record': ...} per vulnerable scan, then {'job': status}
+                once the job has ended
+        """
+        conn = self._connect()
+        try:
+            response = self._request(conn, 'GET', f"/jobs/{job_id}/results?offset={offset}")
+            while True:
+                try:
+                    line = response.readline()
+                except OSError as e:
+                    raise DaemonError(f"Lost the result stream of job {job_id}: {str(e)}")
+                if not line:
+                    raise DaemonError(f"Result stream of job {job_id} ended early")
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                yield item
+                if 'job' in item:
+                    return
+        finally:
+            conn.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
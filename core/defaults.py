@@ -0,0 +1,29 @@
+"""
+Command line defaults of the heavier modules. main.py builds every
+sub-parser on each run, so these live here, free of imports, instead of
+pulling the daemon, coordinator, batch and sqlite code into `list`
+and `--help`. The owning modules re-export them under the same names.
+"""
+
+from pathlib import Path
+
+# core.checkpoint
+DEFAULT_CHECKPOINT_INTERVAL = 10.0
+
+# core.daemon
+DEFAULT_DAEMON_PORT = 8610
+DEFAULT_DAEMON_ADDRESS = f"http://127.0.0.1:{DEFAULT_DAEMON_PORT}"
+DEFAULT_JOB_SLOTS = 4
+
+# core.distributed
+DEFAULT_COORDINATOR_PORT = 8600
+DEFAULT_LEASE_SIZE = 16
+DEFAULT_LEASE_TTL = 60.0
+DEFAULT_WORKER_SLOTS = 4
+
+# core.incremental
+DEFAULT_STATE_DB = Path('.cache') / 'incremental.sqlite'
+
+# core.module_loader
+DEFAULT_EXPLOIT_WORKERS = 4
+DEFAULT_EXPLOIT_TIMEOUT = 120.0
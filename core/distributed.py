@@ -0,0 +1,571 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from core.batch import PAYLOAD_CHUNK_SIZE, ResultMerger, build_work_queue, payload_chunks, stop_steps
+from core.defaults import DEFAULT_COORDINATOR_PORT, DEFAULT_LEASE_SIZE, DEFAULT_LEASE_TTL, DEFAULT_WORKER_SLOTS
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 2
+# Idle workers ask for work this often; heartbeats go out every TTL / 3
+POLL_INTERVAL = 1.0
+# Workers retry an unreachable coordinator for this long before giving up
+COORDINATOR_RETRY_SECONDS = 30.0
+# After the last unit, keep answering so polling workers learn they are done
+DONE_LINGER = 10.0
+TOKEN_HEADER = 'X-Pentoscan-Token'
+
+class DistributedError(Exception):
+    """Custom exception for coordinator/worker errors"""
+    pass
+
+def target_host(target):
+    """The host a target lives on; two leases never share one"""
+    return (urlsplit(target).hostname or target).lower()
+
+def template_fingerprint(templates, plans):
+    """
+    Identify templates by id, file content and payload chunking.
+
+    Workers load templates from their own disk; comparing fingerprints
+    makes sure they run exactly what the coordinator planned.
+    """
+    digest = hashlib.sha1()
+    for template in sorted(templates, key=lambda t: t.id):
+        digest.update(template.id.encode('utf-8'))
+        digest.update(Path(template.path).read_bytes() if template.path else b'')
+        digest.update(json.dumps(plans[template.id]).encode('utf-8'))
+    return digest.hexdigest()
+
+class _Lease:
+    def __init__(self, lease_id, worker, host, units, ttl):
+        self.id = lease_id
+        self.worker = worker
+        self.host = host
+        # unit id -> unit, removed as results arrive
+        self.units = units
+        self.expires = time.monotonic() + ttl
+
+class Coordinator:
+    """
+    Hands out a target x template work queue to remote workers as leases.
+
+    Work is grouped by host: a lease holds up to ``lease_size`` units of a
+    single host and a host is leased to one worker at a time, so no two
+    workers ever scan the same host at once. Hosts are handed out
+    round-robin, so throughput grows with the number of workers as long as
+    there are more hosts than worker slots.
+
+    Workers renew their leases with heartbeats; a lease not renewed within
+    ``lease_ttl`` seconds is taken back and its unfinished units are issued
+    again. Results for a unit are accepted once, and only from the worker
+    holding its lease. They are merged per (target, template) exactly as
+    in a local batch run and handed to ``on_result``. Template variables
+    are evaluated here once per pair and sent with every unit of it, so
+    all its units use the same random values whichever worker runs them.
+
+    The protocol is JSON over HTTP:
+
+    - ``GET /config``: templates, fingerprint and timing for workers
+    - ``POST /lease``: a lease for the worker, ``{"wait": true}`` when
+      nothing is free right now, or ``{"done": true}``
+    - ``POST /report``: results for units of a lease
+    - ``POST /heartbeat``: renew leases; answers with the ones lost
+    - ``GET /status``: progress
+    """
+
+    def __init__(self, targets, templates, on_result, host='127.0.0.1', port=DEFAULT_COORDINATOR_PORT,
+                 lease_size=DEFAULT_LEASE_SIZE, lease_ttl=DEFAULT_LEASE_TTL, token=None,
+                 chunk_size=PAYLOAD_CHUNK_SIZE):
+        """
+        Initialize the coordinator
+
+        Args:
+            targets (list): Target URLs
+            templates (list): Template objects (loaded from a path)
+            on_result (callable): Called with (target, ScanResult) once all
+                units of a pair are done, which it should save or close();
+                called under a lock
+            host (str): Address to listen on
+            port (int): Port to listen on (0 picks a free one)
+            lease_size (int): Maximum units per lease
+            lease_ttl (float): Seconds a lease lives without a heartbeat
+            token (str, optional): Shared secret workers must send
+            chunk_size (int): Payload combinations per work unit
+        """
+        self.templates = [t for t in templates if t.path]
+        self.plans = {t.id: payload_chunks(t, chunk_size) for t in self.templates}
+        self.fingerprint = template_fingerprint(self.templates, self.plans)
+        self.chunk_size = chunk_size
+        self.lease_size = max(1, lease_size)
+        self.lease_ttl = lease_ttl
+        self.token = token
+        self.total_units = len(targets) * sum(len(chunks) for plan in self.plans.values() for chunks in plan)
+        self.finished_units = 0
+        self._by_id = {t.id: t for t in self.templates}
+        # Template variables of the (target, template) pairs under way
+        self._variables = {}
+        self.merger = ResultMerger(
+            self._by_id,
+            self.plans,
+            {(t.id, index) for t in self.templates for index in stop_steps(t)},
+            on_result,
+        )
+
+        by_host = {}
+        for target in targets:
+            by_host.setdefault(target_host(target), []).append(target)
+        # host -> (lazy unit iterator, units taken back from expired leases)
+        self._queues = {
+            host: (build_work_queue(host_targets, self.templates, self.plans, key=lambda t: t.id), deque())
+            for host, host_targets in by_host.items()
+        }
+        self._ready = deque(self._queues)
+        self._leases = {}
+        self._workers = {}
+        self._next_unit = 0
+        self._told_done = set()
+        self._cond = threading.Condition()
+        self._httpd = self._server(host, port)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def done(self):
+        return not self._queues and not self._leases
+
+    def _server(self, host, port):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        coordinator = self
+        routes = {
+            ('GET', '/config'): lambda body: coordinator.config(),
+            ('GET', '/status'): lambda body: coordinator.status(),
+            ('POST', '/lease'): lambda body: coordinator.lease(body['worker']),
+            ('POST', '/report'): lambda body: coordinator.report(body['worker'], body['lease'], body['results'],
+                                                                 body.get('metrics')),
+            ('POST', '/heartbeat'): lambda body: coordinator.heartbeat(body['worker'], body['leases']),
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                if coordinator.token and not hmac.compare_digest(
+                        self.headers.get(TOKEN_HEADER, ''), coordinator.token):
+                    return self._reply(403, {'error': 'Invalid token'})
+                route = routes.get((self.command, self.path))
+                if route is None:
+                    return self._reply(404, {'error': f"Unknown endpoint {self.command} {self.path}"})
+                try:
+                    body = json.loads(raw) if raw else {}
+                    return self._reply(200, route(body))
+                except (KeyError, TypeError, ValueError) as e:
+                    return self._reply(400, {'error': f"Bad request: {str(e)}"})
+
+            do_GET = do_POST = _handle
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        httpd.daemon_threads = True
+        return httpd
+
+    def config(self):
+        return {
+            'version': PROTOCOL_VERSION,
+            'templates': [t.id for t in self.templates],
+            'fingerprint': self.fingerprint,
+            'chunk_size': self.chunk_size,
+            'lease_ttl': self.lease_ttl,
+            'metrics': metrics.enabled,
+        }
+
+    def status(self):
+        with self._cond:
+            return {
+                'total_units': self.total_units,
+                'finished_units': self.finished_units,
+                'leases': len(self._leases),
+                'hosts_left': len(self._queues),
+                'workers': {
+                    worker: {'finished_units': info['finished'], 'seen': round(time.monotonic() - info['seen'], 1)}
+                    for worker, info in self._workers.items()
+                },
+                'done': self.done,
+            }
+
+    def _seen(self, worker):
+        info = self._workers.setdefault(worker, {'finished': 0, 'seen': 0.0})
+        info['seen'] = time.monotonic()
+        return info
+
+    def lease(self, worker):
+        """Give the worker the next free host's units, if any"""
+        with self._cond:
+            self._seen(worker)
+            self._expire()
+            if self.done:
+                return self._tell_done(worker)
+            for _ in range(len(self._ready)):
+                host = self._ready.popleft()
+                units = self._take(host)
+                if units:
+                    lease = _Lease(uuid.uuid4().hex, worker, host, units, self.lease_ttl)
+                    self._leases[lease.id] = lease
+                    return {
+                        'lease': lease.id,
+                        'units': [[unit_id, *unit, self._pair_variables(unit)] for unit_id, unit in units.items()],
+                    }
+            if self.done:
+                return self._tell_done(worker)
+            return {'wait': True}
+
+    def _pair_variables(self, unit):
+        from core.scanner import template_variables
+
+        pair = unit[:2]
+        if pair not in self._variables:
+            self._variables[pair] = template_variables(unit[0], self._by_id[unit[1]])
+        return self._variables[pair]
+
+    def _tell_done(self, worker):
+        self._told_done.add(worker)
+        self._cond.notify_all()
+        return {'done': True}
+
+    def _take(self, host):
+        # Pull up to lease_size units of one host, retried units first
+        units, retry = self._queues[host]
+        taken = {}
+        while len(taken) < self.lease_size:
+            unit = retry.popleft() if retry else next(units, None)
+            if unit is None:
+                break
+            if self.merger.skip(None, unit):
+                self._finish(unit, None)
+                continue
+            self._next_unit += 1
+            taken[self._next_unit] = unit
+        if not taken and not retry:
+            # The host is exhausted; it is not put back on the ready list
+            del self._queues[host]
+        return taken
+
+    def _finish(self, unit, partial):
+        self.finished_units += 1
+        self.merger.finish(None, unit, partial)
+        if unit[:2] not in self.merger.units_left:
+            # Every unit of the pair is done
+            self._variables.pop(unit[:2], None)
+
+    def _release(self, lease):
+        del self._leases[lease.id]
+        if lease.host in self._queues:
+            self._ready.append(lease.host)
+
+    def report(self, worker, lease_id, results, snapshot=None):
+        """
+        Accept results for units of a lease; units already finished, and
+        reports from a worker that no longer holds the lease, are ignored
+        """
+        with self._cond:
+            info = self._seen(worker)
+            if snapshot and metrics.enabled:
+                metrics.merge(snapshot)
+            lease = self._leases.get(lease_id)
+            if lease is None or lease.worker != worker:
+                # Expired and re-issued; its units will be (or were) reported again
+                return {'accepted': 0, 'lease_lost': True}
+            lease.expires = time.monotonic() + self.lease_ttl
+            accepted = 0
+            for item in results:
+                unit = lease.units.pop(item['unit'], None)
+                if unit is None:
+                    continue
+                if item.get('error'):
+                    logger.error(f"Work unit {unit[0]} / {unit[1]} failed on {worker}: {item['error']}")
+                self._finish(unit, item.get('result'))
+                info['finished'] += 1
+                accepted += 1
+            if not lease.units:
+                self._release(lease)
+            self._cond.notify_all()
+            return {'accepted': accepted, 'lease_lost': False}
+
+    def heartbeat(self, worker, lease_ids):
+        """Renew the worker's leases; returns the ones it no longer holds"""
+        with self._cond:
+            self._seen(worker)
+            self._expire()
+            lost = []
+            deadline = time.monotonic() + self.lease_ttl
+            for lease_id in lease_ids:
+                lease = self._leases.get(lease_id)
+                if lease is None or lease.worker != worker:
+                    lost.append(lease_id)
+                else:
+                    lease.expires = deadline
+            return {'lost': lost}
+
+    def _expire(self):
+        now = time.monotonic()
+        for lease in [lease for lease in self._leases.values() if lease.expires < now]:
+            logger.warning(f"Lease on {lease.host} held by {lease.worker} expired; "
+                           f"re-issuing {len(lease.units)} units")
+            # Back to the front of the host's queue, in their original order
+            self._queues[lease.host][1].extendleft(reversed(list(lease.units.values())))
+            self._release(lease)
+
+    def serve(self):
+        """Start answering workers in a background thread"""
+        threading.Thread(target=self._httpd.serve_forever, name='pentoscan-coordinator', daemon=True).start()
+        logger.info(f"Coordinator listening on {self.url}")
+        return self
+
+    def wait(self):
+        """Block until every unit is finished, then give polling workers time to notice"""
+        with self._cond:
+            while not self.done:
+                self._expire()
+                self._cond.wait(POLL_INTERVAL)
+        deadline = time.monotonic() + DONE_LINGER
+        with self._cond:
+            while time.monotonic() < deadline:
+                # Stop once every recently active worker has been told
+                active = {worker for worker, info in self._workers.items()
+                          if time.monotonic() - info['seen'] < self.lease_ttl}
+                if active <= self._told_done:
+                    break
+                self._cond.wait(POLL_INTERVAL)
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.serve()
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Worker:
+    """
+    Runs leases from a coordinator with the local scanner.
+
+    Each of ``slots`` threads works through one lease at a time and sends
+    every unit's result back as soon as it is done. A heartbeat thread
+    renews the held leases three times per lease TTL; a lease the
+    coordinator reports lost (its heartbeats arrived too late and the
+    units went to another worker) is abandoned.
+    """
+
+    def __init__(self, coordinator_url, templates, client, slots=DEFAULT_WORKER_SLOTS, token=None,
+                 worker_id=None, validators=None, profiles=None):
+        """
+        Initialize the worker
+
+        Args:
+            coordinator_url (str): Base URL of the coordinator
+            templates (list): Locally loaded templates; must contain every
+                template the coordinator plans with, unchanged
+            client (HttpClient): Client shared by all scans of this worker
+            slots (int): Leases worked on at the same time
+            token (str, optional): Shared secret expected by the coordinator
+            worker_id (str, optional): Name shown in the coordinator's status
+            validators (ValidatorStore, optional): Previous responses, for
+                incremental scans
+            profiles (ProfileCache, optional): Baseline profiles; templates
+                that cannot apply to a target are not run against it
+        """
+        self.url = coordinator_url.rstrip('/')
+        self.client = client
+        self.validators = validators
+        self.profiles = profiles
+        self.slots = max(1, slots)
+        self.token = token
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.templates = {}
+        self.lease_ttl = DEFAULT_LEASE_TTL
+        self.finished_units = 0
+        self._available = {t.id: t for t in templates}
+        self._leases = set()
+        self._lost = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._local = threading.local()
+
+    def _call(self, method, path, payload=None):
+        import requests
+
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            if self.token:
+                session.headers[TOKEN_HEADER] = self.token
+        deadline = time.monotonic() + COORDINATOR_RETRY_SECONDS
+        while True:
+            try:
+                response = session.request(method, self.url + path, json=payload, timeout=30)
+            except requests.RequestException as e:
+                if time.monotonic() >= deadline or self._stop.is_set():
+                    raise DistributedError(f"Coordinator unreachable: {str(e)}")
+                time.sleep(POLL_INTERVAL)
+                continue
+            if response.status_code != 200:
+                try:
+                    error = response.json().get('error')
+                except ValueError:
+                    error = response.text[:200]
+                raise DistributedError(f"Coordinator refused {path}: {error}")
+            return response.json()
+
+    def connect(self):
+        """
+        Fetch the coordinator's configuration and check the local templates against it
+
+        Raises:
+            DistributedError: If templates are missing or differ
+        """
+        config = self._call('GET', '/config')
+        if config.get('version') != PROTOCOL_VERSION:
+            raise DistributedError(f"Coordinator speaks protocol version {config.get('version')}, "
+                                   f"this worker {PROTOCOL_VERSION}")
+        missing = [template_id for template_id in config['templates'] if template_id not in self._available]
+        if missing:
+            raise DistributedError(f"Templates not available on this worker: {', '.join(missing)}")
+        self.templates = {template_id: self._available[template_id] for template_id in config['templates']}
+        plans = {template_id: payload_chunks(template, config['chunk_size'])
+                 for template_id, template in self.templates.items()}
+        if template_fingerprint(self.templates.values(), plans) != config['fingerprint']:
+            raise DistributedError("Templates or payloads on this worker differ from the coordinator's")
+        self.lease_ttl = config['lease_ttl']
+        if config.get('metrics'):
+            metrics.enable()
+        return config
+
+    def run(self):
+        """
+        Work until the coordinator has nothing left
+
+        Returns:
+            int: Number of units this worker ran
+        """
+        self.connect()
+        if any(t.javascript for t in self.templates.values()):
+            # V8 must start on this thread before slot threads build contexts
+            from core.javascript import init_engine
+            init_engine()
+        errors = []
+        threading.Thread(target=self._heartbeat_loop, name='pentoscan-heartbeat', daemon=True).start()
+        slots = [
+            threading.Thread(target=self._slot_loop, args=(errors,), name=f"pentoscan-slot-{index}", daemon=True)
+            for index in range(self.slots)
+        ]
+        for slot in slots:
+            slot.start()
+        try:
+            for slot in slots:
+                slot.join()
+        finally:
+            self._stop.set()
+        if errors:
+            raise errors[0]
+        return self.finished_units
+
+    def _slot_loop(self, errors):
+        try:
+            while not self._stop.is_set():
+                reply = self._call('POST', '/lease', {'worker': self.id})
+                if reply.get('done'):
+                    # No leases are out anywhere, so the other slots are idle too
+                    self._stop.set()
+                    return
+                if 'lease' not in reply:
+                    self._stop.wait(POLL_INTERVAL)
+                    continue
+                self._run_lease(reply['lease'], reply['units'])
+        except DistributedError as e:
+            errors.append(e)
+            self._stop.set()
+
+    def _run_lease(self, lease_id, units):
+        from core.scanner import ScanResult, run_scan
+
+        with self._lock:
+            self._leases.add(lease_id)
+        try:
+            for unit_id, target, template_id, step, payloads, variables in units:
+                if self._stop.is_set() or lease_id in self._lost:
+                    break
+                template = self.templates[template_id]
+                item = {'unit': unit_id}
+                try:
+                    profile = self.profiles.get(target) if self.profiles is not None else None
+                    steps = [step] if template.http_steps else None
+                    if profile is not None and profile.skip_reason(template):
+                        # Reported as done, with nothing found
+                        scan_result = ScanResult(template, target)
+                    else:
+                        scan_result = run_scan(target, template, client=self.client, steps=steps,
+                                               payloads=payloads, validators=self.validators,
+                                               profile=profile, variables=variables)
+                    item['result'] = scan_result.to_partial()
+                    scan_result.close()
+                except Exception as e:
+                    item['error'] = str(e)
+                snapshot = metrics.snapshot(reset=True) if metrics.enabled else None
+                reply = self._call('POST', '/report', {
+                    'worker': self.id,
+                    'lease': lease_id,
+                    'results': [item],
+                    'metrics': snapshot,
+                })
+                with self._lock:
+                    self.finished_units += 1
+                if reply.get('lease_lost'):
+                    logger.warning(f"Lease {lease_id} was taken back by the coordinator; abandoning it")
+                    break
+        finally:
+            with self._lock:
+                self._leases.discard(lease_id)
+                self._lost.discard(lease_id)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.lease_ttl / 3):
+            with self._lock:
+                held = list(self._leases)
+            if not held:
+                continue
+            try:
+                reply = self._call('POST', '/heartbeat', {'worker': self.id, 'leases': held})
+            except DistributedError as e:
+                logger.warning(f"Heartbeat failed: {str(e)}")
+                continue
+            with self._lock:
+                self._lost.update(reply['lost'])
@@ -0,0 +1,424 @@
+import base64
+import hashlib
+import html
+import logging
+import random
+import re
+import string
+import time
+from functools import lru_cache
+from urllib.parse import quote, unquote
+
+logger = logging.getLogger(__name__)
+
+# Compiled expressions and strings are cached by source text; payload
+# values with placeholders can be numerous, so the cache is bounded
+COMPILE_CACHE_SIZE = 65536
+PLACEHOLDER_RE = re.compile(r"\{\{(.+?)\}\}", re.S)
+TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+\.\d*|\.\d+|\d+)
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>==|!=|<=|>=|&&|\|\||=~|!~|[-+*/%<>!(),])
+    )""", re.X | re.S)
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', "'": "'", '\\': '\\'}
+CONSTANTS = {'true': True, 'false': False, 'nil': None}
+
+class DslError(Exception):
+    """Custom exception for DSL parsing and evaluation errors"""
+    pass
+
+class UnresolvedName(DslError):
+    """An expression referenced a variable the context does not have"""
+    pass
+
+def _text(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return '' if value is None else str(value)
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        text = _text(value).strip()
+        return int(text) if text.lstrip('-').isdigit() else float(text)
+    except ValueError:
+        raise DslError(f"Not a number: {value!r}")
+
+def _random_text(length, charset):
+    return ''.join(random.choice(charset) for _ in range(int(length)))
+
+def _without(charset, cutset):
+    return ''.join(c for c in charset if c not in cutset) if cutset else charset
+
+def _rand_int(minimum=0, maximum=2 ** 31 - 1):
+    minimum, maximum = int(minimum), int(maximum)
+    return random.randrange(minimum, maximum) if maximum > minimum else minimum
+
+def _trim(value, cutset=None):
+    return _text(value).strip(cutset) if cutset is not None else _text(value).strip()
+
+def _decode_base64(value):
+    text = _text(value)
+    return base64.b64decode(text + '=' * (-len(text) % 4)).decode('utf-8', 'replace')
+
+def _regex(pattern, value):
+    return re.search(_text(pattern), _text(value)) is not None
+
+# name -> (implementation, pure); pure calls on constants are folded at compile time
+FUNCTIONS = {
+    'len': (lambda value: len(value) if isinstance(value, (list, tuple, dict)) else len(_text(value)), True),
+    'to_lower': (lambda value: _text(value).lower(), True),
+    'to_upper': (lambda value: _text(value).upper(), True),
+    'to_string': (_text, True),
+    'to_number': (_number, True),
+    'trim': (_trim, True),
+    'trim_left': (lambda value, cutset: _text(value).lstrip(cutset), True),
+    'trim_right': (lambda value, cutset: _text(value).rstrip(cutset), True),
+    'trim_space': (lambda value: _text(value).strip(), True),
+    'trim_prefix': (lambda value, prefix: _text(value).removeprefix(_text(prefix)), True),
+    'trim_suffix': (lambda value, suffix: _text(value).removesuffix(_text(suffix)), True),
+    'reverse': (lambda value: _text(value)[::-1], True),
+    'repeat': (lambda value, count: _text(value) * int(count), True),
+    'replace': (lambda value, old, new: _text(value).replace(_text(old), _text(new)), True),
+    'replace_regex': (lambda value, pattern, new: re.sub(_text(pattern), _text(new), _text(value)), True),
+    'concat': (lambda *values: ''.join(_text(v) for v in values), True),
+    'join': (lambda separator, *values: _text(separator).join(_text(v) for v in values), True),
+    'contains': (lambda value, part: _text(part) in _text(value), True),
+    'contains_all': (lambda value, *parts: all(_text(p) in _text(value) for p in parts), True),
+    'contains_any': (lambda value, *parts: any(_text(p) in _text(value) for p in parts), True),
+    'starts_with': (lambda value, *prefixes: any(_text(value).startswith(_text(p)) for p in prefixes), True),
+    'ends_with': (lambda value, *suffixes: any(_text(value).endswith(_text(s)) for s in suffixes), True),
+    'line_starts_with': (lambda value, *prefixes: any(
+        line.startswith(_text(p)) for line in _text(value).splitlines() for p in prefixes), True),
+    'line_ends_with': (lambda value, *suffixes: any(
+        line.endswith(_text(s)) for line in _text(value).splitlines() for s in suffixes), True),
+    'regex': (_regex, True),
+    'base64': (lambda value: base64.b64encode(_text(value).encode('utf-8')).decode('ascii'), True),
+    'base64_decode': (_decode_base64, True),
+    'url_encode': (lambda value: quote(_text(value), safe=''), True),
+    'url_decode': (lambda value: unquote(_text(value)), True),
+    'hex_encode': (lambda value: _text(value).encode('utf-8').hex(), True),
+    'hex_decode': (lambda value: bytes.fromhex(_text(value)).decode('utf-8', 'replace'), True),
+    'html_escape': (lambda value: html.escape(_text(value)), True),
+    'html_unescape': (lambda value: html.unescape(_text(value)), True),
+    'md5': (lambda value: hashlib.md5(_text(value).encode('utf-8')).hexdigest(), True),
+    'sha1': (lambda value: hashlib.sha1(_text(value).encode('utf-8')).hexdigest(), True),
+    'sha256': (lambda value: hashlib.sha256(_text(value).encode('utf-8')).hexdigest(), True),
+    'dec_to_hex': (lambda value: format(int(_number(value)), 'x'), True),
+    'hex_to_dec': (lambda value: int(_text(value), 16), True),
+    'rand_int': (_rand_int, False),
+    'rand_char': (lambda charset=string.ascii_letters + string.digits: random.choice(_text(charset)), False),
+    'rand_base': (lambda length, charset=string.ascii_letters + string.digits:
+                  _random_text(length, _text(charset)), False),
+    'rand_text_alpha': (lambda length, cutset='': _random_text(length, _without(string.ascii_letters, cutset)),
+                        False),
+    'rand_text_alphanumeric': (lambda length, cutset='': _random_text(
+        length, _without(string.ascii_letters + string.digits, cutset)), False),
+    'rand_text_numeric': (lambda length, cutset='': _random_text(length, _without(string.digits, cutset)), False),
+    'unix_time': (lambda offset=0: int(time.time()) + int(offset), False),
+}
+
+def _equal(left, right):
+    if type(left) is not type(right) and isinstance(left, (int, float, str)) and isinstance(right, (int, float, str)):
+        # Compare "200" with 200 as numbers, as the response parts are text
+        try:
+            return _number(left) == _number(right)
+        except DslError:
+            return _text(left) == _text(right)
+    return left == right
+
+def _add(left, right):
+    if isinstance(left, str) or isinstance(right, str):
+        return _text(left) + _text(right)
+    return left + right
+
+def _ordered(compare):
+    def apply(left, right):
+        if isinstance(left, str) and isinstance(right, str):
+            return compare(left, right)
+        return compare(_number(left), _number(right))
+    return apply
+
+BINARY = {
+    '==': _equal,
+    '!=': lambda left, right: not _equal(left, right),
+    '<': _ordered(lambda left, right: left < right),
+    '<=': _ordered(lambda left, right: left <= right),
+    '>': _ordered(lambda left, right: left > right),
+    '>=': _ordered(lambda left, right: left >= right),
+    '=~': lambda left, right: _regex(right, left),
+    '!~': lambda left, right: not _regex(right, left),
+    '+': _add,
+    '-': lambda left, right: _number(left) - _number(right),
+    '*': lambda left, right: _number(left) * _number(right),
+    '/': lambda left, right: _number(left) / _number(right),
+    '%': lambda left, right: _number(left) % _number(right),
+}
+PRECEDENCE = [('||',), ('&&',), ('==', '!=', '=~', '!~'), ('<', '<=', '>', '>='), ('+', '-'), ('*', '/', '%')]
+
+class _Node:
+    """A compiled sub-expression: a closure over the context, or a folded constant"""
+    __slots__ = ('fn', 'constant', 'value')
+
+    def __init__(self, fn=None, value=None, constant=False):
+        self.fn = fn if fn is not None else (lambda context: value)
+        self.constant = constant
+        self.value = value
+
+def _constant(value):
+    return _Node(value=value, constant=True)
+
+def _fold(fn, args, pure=True):
+    """Evaluate now if every input is known, otherwise build the closure"""
+    if pure and all(arg.constant for arg in args):
+        try:
+            return _constant(fn(None))
+        except Exception:
+            pass
+    return _Node(fn)
+
+class _Parser:
+    def __init__(self, source):
+        self.source = source
+        self.tokens = self._tokenize(source)
+        self.position = 0
+        self.names = set()
+
+    @staticmethod
+    def _tokenize(source):
+        tokens = []
+        position = 0
+        source = source.rstrip()
+        while position < len(source):
+            match = TOKEN_RE.match(source, position)
+            if match is None or match.end() == position:
+                raise DslError(f"Unexpected character at {position} in {source!r}")
+            kind = match.lastgroup
+            tokens.append((kind, match.group(kind)))
+            position = match.end()
+        return tokens
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def _expect(self, op):
+        kind, value = self._next()
+        if kind != 'op' or value != op:
+            raise DslError(f"Expected '{op}' in {self.source!r}")
+
+    def parse(self):
+        node = self._binary(0)
+        if self.position != len(self.tokens):
+            raise DslError(f"Unexpected {self._peek()[1]!r} in {self.source!r}")
+        return node
+
+    def _binary(self, level):
+        if level == len(PRECEDENCE):
+            return self._unary()
+        left = self._binary(level + 1)
+        while True:
+            kind, op = self._peek()
+            if kind != 'op' or op not in PRECEDENCE[level]:
+                return left
+            self._next()
+            right = self._binary(level + 1)
+            left = self._combine(op, left, right)
+
+    @staticmethod
+    def _combine(op, left, right):
+        l, r = left.fn, right.fn
+        if op == '&&':
+            return _fold(lambda context: bool(l(context)) and bool(r(context)), (left, right))
+        if op == '||':
+            return _fold(lambda context: bool(l(context)) or bool(r(context)), (left, right))
+        apply = BINARY[op]
+        return _fold(lambda context: apply(l(context), r(context)), (left, right))
+
+    def _unary(self):
+        kind, op = self._peek()
+        if kind == 'op' and op in ('!', '-'):
+            self._next()
+            operand = self._unary()
+            fn = operand.fn
+            if op == '!':
+                return _fold(lambda context: not fn(context), (operand,))
+            return _fold(lambda context: -_number(fn(context)), (operand,))
+        return self._primary()
+
+    def _primary(self):
+        kind, value = self._next()
+        if kind == 'number':
+            return _constant(float(value) if '.' in value else int(value))
+        if kind == 'string':
+            body = value[1:-1]
+            return _constant(re.sub(r"\\(.)", lambda m: ESCAPES.get(m.group(1), m.group(0)), body, flags=re.S))
+        if kind == 'op' and value == '(':
+            node = self._binary(0)
+            self._expect(')')
+            return node
+        if kind == 'name':
+            if self._peek() == ('op', '('):
+                return self._call(value)
+            if value in CONSTANTS:
+                return _constant(CONSTANTS[value])
+            return self._load(value)
+        raise DslError(f"Unexpected {value!r} in {self.source!r}" if value else f"Incomplete expression {self.source!r}")
+
+    def _load(self, name):
+        self.names.add(name)
+
+        def load(context):
+            try:
+                return context[name]
+            except KeyError:
+                raise UnresolvedName(name)
+        return _Node(load)
+
+    def _call(self, name):
+        if name not in FUNCTIONS:
+            raise DslError(f"Unknown function {name}() in {self.source!r}")
+        function, pure = FUNCTIONS[name]
+        self._expect('(')
+        args = []
+        if self._peek() != ('op', ')'):
+            while True:
+                args.append(self._binary(0))
+                if self._peek() != ('op', ','):
+                    break
+                self._next()
+        self._expect(')')
+        fns = tuple(arg.fn for arg in args)
+        return _fold(lambda context: function(*(fn(context) for fn in fns)), args, pure)
+
+class Expression:
+    """
+    A DSL expression compiled to a closure.
+
+    Calling it with a context mapping evaluates it; a name missing from
+    the context raises UnresolvedName. ``names`` lists the variables the
+    expression reads.
+    """
+    __slots__ = ('source', 'names', '_fn', 'constant')
+
+    def __init__(self, source):
+        parser = _Parser(source)
+        node = parser.parse()
+        self.source = source
+        self.names = frozenset(parser.names)
+        self._fn = node.fn
+        self.constant = node.constant
+
+    def __call__(self, context):
+        return self._fn(context)
+
+    def test(self, context):
+        """Evaluate as a condition; errors and unresolved names count as false"""
+        try:
+            return bool(self._fn(context))
+        except UnresolvedName as e:
+            logger.debug(f"DSL {self.source!r}: unresolved variable {e}")
+        except Exception as e:
+            logger.debug(f"DSL {self.source!r} failed: {str(e)}")
+        return False
+
+class TemplateString:
+    """
+    Text with {{...}} placeholders, compiled once.
+
+    Each placeholder holds a variable name or a DSL expression. Rendering
+    substitutes their values; a placeholder that cannot be resolved (or
+    parsed) is left as written, so later stages can still fill it in.
+    """
+    __slots__ = ('source', 'names', '_parts')
+
+    def __init__(self, source):
+        self.source = source
+        parts = []
+        names = set()
+        position = 0
+        for match in PLACEHOLDER_RE.finditer(source):
+            if match.start() > position:
+                parts.append(source[position:match.start()])
+            try:
+                expression = compile_expression(match.group(1).strip())
+            except DslError:
+                parts.append(match.group(0))
+            else:
+                if expression.constant:
+                    parts.append(_text(expression(None)))
+                else:
+                    parts.append((expression, match.group(0)))
+                    names |= expression.names
+            position = match.end()
+        if position < len(source):
+            parts.append(source[position:])
+        self.names = frozenset(names)
+        self._parts = parts
+
+    @property
+    def dynamic(self):
+        return any(part.__class__ is not str for part in self._parts)
+
+    def render(self, context):
+        if len(self._parts) == 1 and self._parts[0].__class__ is str:
+            return self._parts[0]
+        out = []
+        for part in self._parts:
+            if part.__class__ is str:
+                out.append(part)
+                continue
+            expression, raw = part
+            try:
+                out.append(_text(expression._fn(context)))
+            except UnresolvedName:
+                out.append(raw)
+            except Exception as e:
+                logger.debug(f"Placeholder {raw} failed: {str(e)}")
+                out.append(raw)
+        return ''.join(out)
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def compile_expression(source):
+    """
+    Compile a DSL expression, or return the cached compilation
+
+    Raises:
+        DslError: If the expression cannot be parsed
+    """
+    return Expression(source)
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def compile_string(source):
+    """Compile text with {{...}} placeholders, or return the cached compilation"""
+    return TemplateString(source)
+
+def render(value, variables):
+    """Replace {{...}} placeholders with their values, leaving unresolvable ones untouched."""
+    if '{{' not in value:
+        return value
+    return compile_string(value).render(variables)
+
+def evaluate_variables(spec, context):
+    """
+    Evaluate a template's ``variables`` in declaration order
+
+    Later variables may refer to earlier ones. Returns the new variables.
+    """
+    values = {}
+    scope = dict(context)
+    for name, value in (spec or {}).items():
+        value = render(value, scope) if isinstance(value, str) else value
+        values[name] = scope[name] = value
+    return values
@@ -0,0 +1,138 @@
+import json
+import logging
+import sys
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Findings of one scan held as objects before the rest spill to disk
+MAX_BUFFERED_FINDINGS = 256
+SPILL_READ_SIZE = 64 * 1024
+
+class Finding:
+    """
+    One matched request.
+
+    Big runs create many of these, so there is no per-instance dict: the
+    method and match details are shared strings (the details come from the
+    compiled matchers) and response headers are only kept when the step
+    reads them.
+    """
+    __slots__ = ('target_url', 'method', 'status_code', 'match_details', 'extracted_data',
+                 'response_length', 'response_headers', 'transport')
+
+    def __init__(self, target_url, method, status_code, match_details=(), extracted_data=None,
+                 response_length=None, response_headers=None, transport=None):
+        self.target_url = target_url
+        self.method = sys.intern(method)
+        self.status_code = status_code
+        self.match_details = tuple(match_details)
+        self.extracted_data = extracted_data
+        self.response_length = response_length
+        self.response_headers = response_headers
+        self.transport = transport
+
+    def to_dict(self):
+        """Serializable form; optional fields are left out when not captured"""
+        data = {
+            'target_url': self.target_url,
+            'method': self.method,
+            'status_code': self.status_code,
+            'vulnerable': True,
+            'match_details': list(self.match_details),
+            'extracted_data': self.extracted_data,
+        }
+        if self.response_length is not None:
+            data['response_length'] = self.response_length
+        if self.response_headers is not None:
+            data['response_headers'] = self.response_headers
+        if self.transport is not None:
+            data['transport'] = self.transport
+        return data
+
+    # Dict-style access, for code written against plain result dicts
+    def __getitem__(self, key):
+        return self.to_dict()[key]
+
+    def get(self, key, default=None):
+        return self.to_dict().get(key, default)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['target_url'],
+            data['method'],
+            data['status_code'],
+            [sys.intern(detail) for detail in data.get('match_details', [])],
+            data.get('extracted_data'),
+            data.get('response_length'),
+            data.get('response_headers'),
+            data.get('transport'),
+        )
+
+class FindingLog:
+    """
+    The findings of one scan, in order, in bounded memory.
+
+    The first ``limit`` findings are kept as objects; the rest are encoded
+    as JSON lines into an anonymous temporary file and decoded again while
+    iterating, so a template matching on every one of a million payloads
+    does not keep a million findings in memory.
+    """
+
+    def __init__(self, limit=MAX_BUFFERED_FINDINGS):
+        self.limit = limit
+        self._buffer = []
+        self._spill = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, finding):
+        self._count += 1
+        if len(self._buffer) < self.limit:
+            self._buffer.append(finding)
+            return
+        line = json.dumps(finding.to_dict(), separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+        with self._lock:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile()
+            self._spill.seek(0, 2)
+            self._spill.write(line)
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __iter__(self):
+        yield from self._buffer
+        if self._spill is not None:
+            yield from self._spilled()
+
+    def _spilled(self):
+        # Read by position under the lock, so iterating from several
+        # threads never moves another reader's place in the file
+        position = 0
+        pending = b''
+        while True:
+            with self._lock:
+                self._spill.seek(position)
+                block = self._spill.read(SPILL_READ_SIZE)
+            if not block:
+                break
+            position += len(block)
+            lines = (pending + block).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield Finding.from_dict(json.loads(line))
+
+    def close(self):
+        """Drop the spill file; the log is empty afterwards"""
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+        self._buffer = []
+        self._count = 0
@@ -0,0 +1,384 @@
+import copy
+import logging
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from core.metrics import metrics
+from core.ratelimit import THROTTLE_STATUSES, RateController, parse_retry_after
+from core.response_cache import request_key
+from core.transport import DEFAULT_TRANSPORT, Transport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 20
+DEFAULT_PER_HOST = 6
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 15.0
+DEFAULT_MAX_BODY_SIZE = 8 * 1024 * 1024
+# Throttled (429/503) requests are retried this many times
+DEFAULT_MAX_RETRIES = 2
+CHUNK_SIZE = 64 * 1024
+# Unread bodies up to this size are drained so the connection can be reused
+DRAIN_LIMIT = 64 * 1024
+
+
+class HttpResponse:
+    """Detached HTTP response, safe to share between threads and templates"""
+
+    def __init__(self, url, status_code, headers, content=b'', encoding=None, elapsed=0.0,
+                 header_list=None, transport=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        # Headers as received, with repeated fields such as Set-Cookie kept apart
+        self.header_list = header_list if header_list is not None else list(self.headers.items())
+        self.content = content
+        self.encoding = encoding
+        self.elapsed = elapsed
+        # How the response arrived: 'h2', 'http/1.1', 'http/1.1-pipelined'...
+        self.transport = transport
+        # body_read is False when the body was skipped; truncated is set when
+        # it was cut at the size limit, partial when reading stopped early
+        self.body_read = True
+        self.truncated = False
+        self.partial = False
+        self._text = None
+
+    @property
+    def raw_headers(self):
+        """Header block as CRLF-separated 'Name: value' lines"""
+        return "\r\n".join(f"{k}: {v}" for k, v in self.header_list)
+
+    @property
+    def text(self):
+        """Body decoded once, on first access"""
+        if self._text is None:
+            self._text = self.content.decode(self.encoding or 'utf-8', errors='replace')
+        return self._text
+
+
+class _TimedConnectionMixin:
+    """Records DNS and TCP connect time for every new connection"""
+
+    _connect_elapsed = 0.0
+
+    def _new_conn(self):
+        label = f"{self.host}:{self.port}"
+        dns_host = self._dns_host
+        start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(dns_host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            # Let urllib3 fail the lookup itself so callers see its usual error
+            return super()._new_conn()
+        resolved = time.perf_counter()
+        metrics.observe('dns_seconds', resolved - start, host=label)
+
+        # Connect to the resolved addresses in turn, as urllib3 would
+        error = None
+        for *_, sockaddr in addresses:
+            self._dns_host = sockaddr[0]
+            attempt = time.perf_counter()
+            try:
+                sock = super()._new_conn()
+            except (NewConnectionError, ConnectTimeoutError) as e:
+                error = e
+                continue
+            finally:
+                self._dns_host = dns_host
+            metrics.observe('connect_seconds', time.perf_counter() - attempt, host=label)
+            self._connect_elapsed = time.perf_counter() - start
+            return sock
+        raise error
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        # Whatever connect() spent beyond DNS and TCP went into the handshake
+        handshake = time.perf_counter() - start - self._connect_elapsed
+        metrics.observe('tls_seconds', max(handshake, 0.0), host=f"{self.host}:{self.port}")
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report DNS, connect and TLS timings"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+def host_key(url):
+    """Return the scheme://host:port key used for per-host limits"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class HttpClient:
+    """
+    Concurrent HTTP client over a per-host choice of transport.
+
+    Requests are executed on a bounded thread pool. Every host goes through
+    its own limiter from the RateController, so a single target never sees
+    more than ``per_host`` requests in flight regardless of the global
+    ``concurrency``, and (unless adaptive limiting is off) gets only as
+    many requests per second as it handles without throttling or slowing
+    down. Requests travel over a keep-alive pool, HTTP/2 streams or an
+    HTTP/1.1 pipeline as the ``transport`` mode and each host allow (see
+    core.transport.Transport).
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 verify=True, headers=None, max_body_size=DEFAULT_MAX_BODY_SIZE, cache=None,
+                 rate_controller=None, max_retries=DEFAULT_MAX_RETRIES, transport=DEFAULT_TRANSPORT,
+                 archive=None):
+        """
+        Initialize the HTTP client
+
+        Args:
+            concurrency (int): Maximum number of requests in flight overall
+            per_host (int): Maximum number of requests in flight per host
+            connect_timeout (float): TCP/TLS connect timeout in seconds
+            read_timeout (float): Socket read timeout in seconds
+            verify (bool): Verify TLS certificates
+            headers (dict, optional): Headers sent with every request
+            max_body_size (int): Bodies are cut off after this many bytes
+            cache (ResponseCache, optional): Shares responses between
+                identical requests
+            rate_controller (RateController, optional): Per-host limits,
+                shared with other clients; adaptive per_host limits if omitted
+            max_retries (int): Retries for 429/503 responses
+            transport (str): 'auto', 'pooled', 'http2' or 'pipeline'
+            archive (ArchiveWriter, optional): Records every response
+                received; bodies are then always read in full
+        """
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.timeout = (connect_timeout, read_timeout)
+        self.verify = verify
+        self.max_body_size = max_body_size
+        self.cache = cache
+        self.rate_controller = rate_controller or RateController(self.per_host)
+        self.max_retries = max_retries
+        self.archive = archive
+
+        # Connection-level timings are only wired in when metrics are collected
+        adapter_class = TimedHTTPAdapter if metrics.enabled else HTTPAdapter
+        self.transport = Transport(
+            transport,
+            timeout=self.timeout,
+            verify=verify,
+            concurrency=self.concurrency,
+            per_host=self.per_host,
+            headers=headers,
+            adapter_class=adapter_class,
+        )
+        self.session = self.transport.session
+
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                            thread_name_prefix='pentoscan-http')
+
+    def request(self, method, url, headers=None, data=None, allow_redirects=False,
+                read_body=None, watch=None):
+        """
+        Send a single request and return a detached HttpResponse.
+
+        The body is streamed. It is only downloaded when ``read_body`` (called
+        with the header-only response) returns True, and never beyond
+        max_body_size. With a cache, cacheable requests are answered from a
+        stored response or joined to an identical one already in flight.
+
+        Args:
+            read_body (callable, optional): Decides from status and headers
+                whether the body is needed; the body is always read if omitted
+            watch (callable, optional): Returns an object whose feed(chunk)
+                returns True when the rest of the body is not needed
+
+        Raises:
+            requests.RequestException: On connection or timeout errors
+        """
+        if self.archive is not None:
+            # A recording keeps whole bodies, for templates that look at more of them later
+            read_body = watch = None
+        send = lambda: self._send(method, url, headers, data, allow_redirects, read_body, watch)
+        if self.cache is not None and self.cache.cacheable(method):
+            key = request_key(method, url, headers, data, allow_redirects)
+            return self.cache.fetch(key, send, read_body)
+        return send()
+
+    def _send(self, method, url, headers, data, allow_redirects, read_body, watch):
+        host = host_key(url)
+        limiter = self.rate_controller.host(host)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            outcome = {'error': True}
+            try:
+                try:
+                    response = self.transport.send(method, url, headers, data, allow_redirects)
+                except requests.RequestException as e:
+                    metrics.inc('request_errors_total', host=host, error=type(e).__name__)
+                    raise
+                metrics.inc('requests_total', host=host, status=response.status_code)
+                metrics.inc('transport_requests_total', host=host, transport=response.protocol)
+                metrics.observe('request_seconds', response.elapsed, host=host)
+                outcome = {
+                    'status_code': response.status_code,
+                    'latency': response.elapsed,
+                    'retry_after': parse_retry_after(response.headers.get('Retry-After')),
+                }
+                if response.status_code in THROTTLE_STATUSES and attempt < self.max_retries:
+                    # The limiter backs off (and honors Retry-After) before the retry
+                    logger.debug(f"{url} answered {response.status_code}, retrying")
+                    response.discard(DRAIN_LIMIT)
+                    response.close()
+                    attempt += 1
+                    continue
+                try:
+                    result = HttpResponse(
+                        url=response.url,
+                        status_code=response.status_code,
+                        headers=response.headers,
+                        encoding=response.encoding,
+                        elapsed=response.elapsed,
+                        header_list=response.header_list,
+                        transport=response.protocol,
+                    )
+                    if read_body is None or read_body(result):
+                        with metrics.timer('transfer_seconds', host=host):
+                            result.content, result.truncated, result.partial = self._read_body(
+                                response, watch() if watch else None)
+                        metrics.inc('response_bytes_total', len(result.content), host=host)
+                    else:
+                        result.body_read = False
+                        response.discard(DRAIN_LIMIT)
+                    if self.archive is not None:
+                        self.archive.record(method, url, headers, data, allow_redirects, result)
+                    return result
+                finally:
+                    response.close()
+            finally:
+                limiter.release(**outcome)
+
+    def _read_body(self, response, watcher=None):
+        """Read the body in chunks up to max_body_size. Returns (content, truncated, partial)"""
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            room = self.max_body_size - size
+            if len(chunk) > room:
+                chunks.append(chunk[:room])
+                logger.debug(f"Body of {response.url} cut at {self.max_body_size} bytes")
+                return b"".join(chunks), True, False
+            chunks.append(chunk)
+            size += len(chunk)
+            if watcher is not None and watcher.feed(chunk):
+                return b"".join(chunks), False, True
+        return b"".join(chunks), False, False
+
+    def submit(self, method, url, **kwargs):
+        """Schedule a request on the pool and return its Future"""
+        return self._executor.submit(self.request, method, url, **kwargs)
+
+    def map(self, requests_iter, window=None, skip=None):
+        """
+        Execute request specs concurrently and yield results in input order.
+
+        Args:
+            requests_iter (iterable): Dicts with 'method', 'url' and optional
+                'headers', 'data', 'allow_redirects' keys
+            window (int, optional): Maximum number of submitted but not yet
+                consumed requests. Defaults to twice the concurrency.
+            skip (callable, optional): Checked after every yielded result;
+                specs for which it returns True are dropped and their
+                queued requests cancelled, e.g. after stop-at-first-match
+
+        Yields:
+            tuple: (spec, HttpResponse or None, Exception or None)
+        """
+        window = window or self.concurrency * 2
+        pending = deque()
+        specs = iter(requests_iter)
+
+        def fill():
+            while len(pending) < window:
+                spec = next(specs, None)
+                if spec is None:
+                    return
+                if skip and skip(spec):
+                    continue
+                future = self.submit(
+                    spec['method'], spec['url'],
+                    headers=spec.get('headers'),
+                    data=spec.get('data'),
+                    allow_redirects=spec.get('allow_redirects', False),
+                    read_body=spec.get('read_body'),
+                    watch=spec.get('watch'),
+                )
+                pending.append((spec, future))
+
+        fill()
+        try:
+            while pending:
+                spec, future = pending.popleft()
+                try:
+                    yield spec, future.result(), None
+                except Exception as e:
+                    yield spec, None, e
+                if skip:
+                    for queued in [item for item in pending if skip(item[0])]:
+                        queued[1].cancel()
+                        pending.remove(queued)
+                fill()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def with_cache(self, cache):
+        """
+        A client answering from its own response cache, sharing this one's
+        connections, threads and host limits.
+
+        Only this client is closed; the one returned lives as long as it does.
+        """
+        client = copy.copy(self)
+        client.cache = cache
+        return client
+
+    def close(self):
+        """Shut down the worker pool and close all connections"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from core.defaults import DEFAULT_STATE_DB
+from core.findings import Finding
+from core.metrics import metrics
+from core.response_cache import request_key
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+# Requests no run has sent for this long are forgotten by prune()
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+# Headers that make a request conditional; templates setting them are left alone
+CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    template_id TEXT NOT NULL,
+    request TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    finding TEXT,
+    seen REAL NOT NULL,
+    PRIMARY KEY (template_id, request)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS requests_seen ON requests(seen);
+"""
+
+class StateError(Exception):
+    """Custom exception for incremental state errors"""
+    pass
+
+class Previous:
+    """What the last run saw for one request of one template"""
+
+    __slots__ = ('etag', 'last_modified', 'finding')
+
+    def __init__(self, etag, last_modified, finding):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.finding = finding
+
+def _request_id(step, spec):
+    key = request_key(spec['method'], spec['url'], spec.get('headers'), spec.get('data'),
+                      spec.get('allow_redirects', False))
+    encoded = json.dumps([step, *key], default=str, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+class ValidatorStore:
+    """
+    Response validators and match outcomes from previous runs.
+
+    For every request a template sent whose response carried an ETag or
+    Last-Modified header, the store keeps those validators together with
+    whether (and how) the response matched. The next run sends the request
+    with If-None-Match / If-Modified-Since; a 304 answer means the response
+    is the one matched last time, so its outcome is reused without
+    downloading or matching anything.
+
+    Rows carry the content hash of the template that produced them: once a
+    template changes, its requests are sent unconditionally and matched
+    again, while unchanged templates only pay for a 304 per unchanged
+    response.
+
+    The store is a SQLite database; several worker processes may share it.
+    Rows are written in one transaction per flush().
+    """
+
+    def __init__(self, db_path=DEFAULT_STATE_DB):
+        """
+        Open or create the store
+
+        Args:
+            db_path (str): SQLite database file
+
+        Raises:
+            StateError: If the database cannot be opened or is not a store
+                this version can use
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        try:
+            self.conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+            if version not in (0, SCHEMA_VERSION):
+                self.conn.close()
+                raise StateError(f"Unsupported incremental state version {version} in {db_path}")
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        except sqlite3.Error as e:
+            raise StateError(f"Cannot open incremental state {db_path}: {str(e)}")
+        self._pending = []
+        self.counts = {'unchanged': 0, 'changed': 0, 'new': 0}
+
+    def conditional(self, template, specs):
+        """
+        Make the request specs of a template conditional where a previous
+        run left validators for them.
+
+        Yields every spec, with 'state' (its key in the store) and, when
+        there is an outcome to fall back on, 'previous' and the
+        conditional headers added. Templates without a content hash
+        (not loaded from a file) are passed through untouched.
+        """
+        digest = getattr(template, 'digest', None)
+        for spec in specs:
+            if digest is None:
+                yield spec
+                continue
+            state = _request_id(spec['step'], spec)
+            spec['state'] = state
+            headers = spec.get('headers') or {}
+            if any(name.lower() in CONDITIONAL_HEADERS for name in headers):
+                yield spec
+                continue
+            previous = self._lookup(template.id, state, digest)
+            if previous is not None:
+                headers = dict(headers)
+                if previous.etag:
+                    headers['If-None-Match'] = previous.etag
+                if previous.last_modified:
+                    headers['If-Modified-Since'] = previous.last_modified
+                spec['headers'] = headers
+                spec['previous'] = previous
+            yield spec
+
+    def _lookup(self, template_id, state, digest):
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT digest, etag, last_modified, finding FROM requests WHERE template_id = ? AND request = ?',
+                (template_id, state),
+            ).fetchone()
+        if row is None or row[0] != digest:
+            return None
+        finding = Finding.from_dict(json.loads(row[3])) if row[3] else None
+        return Previous(row[1], row[2], finding)
+
+    def unchanged_response(self, spec, response):
+        """
+        Whether the response is the one the previous run matched
+
+        Returns:
+            bool: True on a 304 to a request made conditional by conditional()
+        """
+        if 'state' not in spec:
+            return False
+        if 'previous' not in spec:
+            result = 'new'
+        elif response.status_code == 304:
+            result = 'unchanged'
+        else:
+            result = 'changed'
+        with self._lock:
+            self.counts[result] += 1
+        metrics.inc('incremental_requests_total', result=result)
+        return result == 'unchanged'
+
+    def record(self, template, spec, response, finding):
+        """
+        Remember a response's validators and the finding it produced, if any
+
+        Responses without validators are not kept: they could not be
+        asked for conditionally next time.
+        """
+        state = spec.get('state')
+        if state is None:
+            return
+        previous = spec.get('previous')
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code == 304 and previous is not None:
+            # A 304 may leave out validators that still hold
+            etag = etag or previous.etag
+            last_modified = last_modified or previous.last_modified
+        if not etag and not last_modified:
+            return
+        encoded = json.dumps(finding.to_dict(), separators=(',', ':'), default=str) if finding else None
+        with self._lock:
+            self._pending.append((template.id, state, template.digest, etag, last_modified, encoded, time.time()))
+
+    def flush(self):
+        """Write the rows recorded since the last flush"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if not rows:
+                return
+            try:
+                with self.conn:
+                    self.conn.executemany('INSERT OR REPLACE INTO requests VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            except sqlite3.Error as e:
+                # Losing state only makes the next run do more work
+                logger.warning(f"Could not save incremental state to {self.db_path}: {str(e)}")
+
+    def prune(self, max_age=DEFAULT_MAX_AGE):
+        """
+        Forget requests no run has sent for max_age seconds, such as those of
+        removed templates or targets
+
+        Returns:
+            int: Number of rows removed
+        """
+        with self._lock:
+            with self.conn:
+                cursor = self.conn.execute('DELETE FROM requests WHERE seen < ?', (time.time() - max_age,))
+        return cursor.rowcount
+
+    def stats(self):
+        """Requests answered 304 (unchanged), answered in full (changed) and sent without validators (new)"""
+        with self._lock:
+            return dict(self.counts)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
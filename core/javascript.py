@@ -0,0 +1,173 @@
+import json
+import logging
+import threading
+
+from py_mini_racer import MiniRacer
+
+try:
+    from py_mini_racer import init_mini_racer
+except ImportError:
+    # py-mini-racer before 0.7 loads V8 with its first context
+    init_mini_racer = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CALLS = 5000
+DEFAULT_MAX_HEAP_BYTES = 64 * 1024 * 1024
+DEFAULT_TIMEOUT_MS = 2000
+# Heap usage is sampled every this many calls
+HEAP_CHECK_INTERVAL = 100
+
+# V8 crashes or deadlocks when several threads build contexts at once, so
+# contexts are created one at a time; calls into existing contexts still
+# run in parallel.
+_create_lock = threading.Lock()
+
+def _start_v8():
+    # Called with _create_lock held
+    if init_mini_racer is not None:
+        init_mini_racer(ignore_duplicate_init=True)
+
+class JavascriptError(Exception):
+    """Custom exception for javascript step errors"""
+    pass
+
+class _Context:
+    """One V8 context plus the template functions compiled into it"""
+
+    def __init__(self):
+        with _create_lock:
+            _start_v8()
+            self.ctx = MiniRacer()
+        self.functions = {}
+        self.calls = 0
+
+    def close(self):
+        """Free the V8 context, serialized with context creation"""
+        with _create_lock:
+            self.ctx = None
+
+    def function_for(self, code):
+        """Compile a javascript step into a named function on first use"""
+        name = self.functions.get(code)
+        if name is None:
+            name = f"__pentoscan_step_{len(self.functions)}"
+            # The step is a script whose completion value is its result, so
+            # it runs through eval; V8 caches the compiled eval code per
+            # source and call site, so the script is only parsed once.
+            self.ctx.eval(
+                f"var {name} = (function(source) {{"
+                f" return function(template) {{ return eval(source); }};"
+                f" }})({json.dumps(code)});"
+            )
+            self.functions[code] = name
+        return name
+
+class JsContextPool:
+    """
+    Long-lived V8 contexts for template javascript steps, one per thread.
+
+    Each step's code is compiled once per context and then called with the
+    per-response data. Contexts are replaced after ``max_calls`` calls or
+    once their heap grows past ``max_heap_bytes``, so globals a script
+    leaves behind cannot leak into later scans indefinitely.
+    """
+
+    def __init__(self, max_calls=DEFAULT_MAX_CALLS, max_heap_bytes=DEFAULT_MAX_HEAP_BYTES,
+                 timeout_ms=DEFAULT_TIMEOUT_MS):
+        """
+        Initialize the pool
+
+        Args:
+            max_calls (int): Calls served by a context before it is recycled
+            max_heap_bytes (int): Used heap size that triggers recycling
+            timeout_ms (int): Execution time limit per call
+        """
+        self.max_calls = max_calls
+        self.max_heap_bytes = max_heap_bytes
+        self.timeout_ms = timeout_ms
+        self._local = threading.local()
+
+    def _context(self):
+        context = getattr(self._local, 'context', None)
+        if context is not None and self._expired(context):
+            self._discard()
+            context = None
+        if context is None:
+            context = self._local.context = _Context()
+        return context
+
+    def _discard(self):
+        context = getattr(self._local, 'context', None)
+        self._local.context = None
+        if context is not None:
+            context.close()
+
+    def _expired(self, context):
+        if context.calls >= self.max_calls:
+            return True
+        if context.calls and context.calls % HEAP_CHECK_INTERVAL == 0:
+            used = context.ctx.heap_stats().get('used_heap_size', 0)
+            return used >= self.max_heap_bytes
+        return False
+
+    def call(self, code, template_data):
+        """
+        Run one javascript step.
+
+        Args:
+            code (str): The step's javascript source
+            template_data (dict): Exposed to the script as `template`
+
+        Returns:
+            The script's completion value, converted from JSON
+
+        Raises:
+            JavascriptError: If the script fails or times out
+        """
+        context = self._context()
+        context.calls += 1
+        try:
+            name = context.function_for(code)
+            return context.ctx.call(name, template_data, timeout=self.timeout_ms)
+        except Exception as e:
+            # A failed or interrupted context is not reused
+            self._discard()
+            raise JavascriptError(str(e))
+
+    def warm(self, codes=()):
+        """Start the calling thread's context ahead of its first call and compile the given steps into it"""
+        context = self._context()
+        for code in codes:
+            context.function_for(code)
+
+    def reset(self):
+        """Drop the calling thread's context"""
+        self._discard()
+
+def init_engine():
+    """
+    Load V8 from the calling thread.
+
+    mini-racer 0.7 and later crash when V8 is first started on a thread
+    other than the main one and contexts are then built on several
+    threads, so code running javascript steps on thread pools calls this
+    from the main thread before starting them.
+    """
+    with _create_lock:
+        if init_mini_racer is not None:
+            _start_v8()
+        else:
+            MiniRacer()
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide context pool, creating it on first use"""
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = JsContextPool()
+    return _default_pool
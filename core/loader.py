@@ -1,21 +1,138 @@
-import yaml
+import hashlib
 import logging
 import glob
+import sys
 from typing import List, Dict, Any
 
 logger = logging.getLogger(__name__)
 
+_yaml_loader = None
+
+def _yaml():
+    """
+    Import PyYAML on first parse; templates served from the cache never
+    need it. Returns (yaml module, loader class).
+    """
+    global _yaml_loader
+    import yaml
+    if _yaml_loader is None:
+        # libyaml's parser is several times faster than the pure Python one
+        _yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml, _yaml_loader
+
 class TemplateError(Exception):
     """Custom exception for template-related errors"""
     pass
 
 class Template:
-    def __init__(self, template_id, info, http_steps=None, javascript=None, extractors=None):
-        self.id = template_id
+    def __init__(self, template_id, info, http_steps=None, javascript=None, extractors=None, path=None,
+                 exploit_module=None, variables=None, digest=None):
+        # Every result of the template refers to this one string
+        self.id = sys.intern(template_id) if isinstance(template_id, str) else template_id
         self.info = info
         self.http_steps = http_steps or []
         self.javascript = javascript
         self.extractors = extractors or []
+        self.path = path
+        self.exploit_module = exploit_module
+        self.variables = variables or {}
+        # Hash of the source, so state kept between runs notices edits
+        self.digest = digest
+        self._compiled_steps = None
+
+    def __getstate__(self):
+        # Compiled matchers are rebuilt on demand rather than pickled
+        state = self.__dict__.copy()
+        state['_compiled_steps'] = None
+        return state
+
+    def __setstate__(self, state):
+        # Unpickling does not preserve interning
+        self.__dict__.update(state)
+        if isinstance(self.id, str):
+            self.id = sys.intern(self.id)
+
+    @property
+    def compiled_steps(self):
+        """Pre-conditions, matchers and extractors of every http step, compiled on first use"""
+        if self._compiled_steps is None:
+            from core.matchers import CompiledStep
+            self._compiled_steps = [CompiledStep(step) for step in self.http_steps]
+        return self._compiled_steps
+
+    @property
+    def tags(self):
+        """Template tags as a list, whether declared as a list or a comma string"""
+        tags = self.info.get('tags', [])
+        if isinstance(tags, str):
+            tags = tags.split(',')
+        return [tag.strip() for tag in tags if tag and tag.strip()]
+
+def _check_dsl(http_steps, template_path):
+    """
+    Compile every DSL expression of the http steps so syntax errors surface
+    at load time; the compiled forms stay cached for the scan.
+
+    Raises:
+        TemplateError: If an expression does not parse
+    """
+    from core.dsl import DslError, compile_expression
+    for step in http_steps:
+        for matcher in step.get('pre-condition', []) + step.get('matchers', []):
+            if matcher.get('type') != 'dsl':
+                continue
+            for expression in matcher.get('dsl', []):
+                try:
+                    compile_expression(expression)
+                except DslError as e:
+                    raise TemplateError(f"Template {template_path} has an invalid DSL expression: {str(e)}")
+
+def parse_template(content, template_path):
+    """
+    Build a Template from YAML source.
+
+    Raises:
+        TemplateError: If the YAML is invalid or the template has no id
+    """
+    yaml, loader = _yaml()
+    try:
+        spec = yaml.load(content, Loader=loader)
+    except yaml.YAMLError as e:
+        raise TemplateError(f"Template {template_path} is not valid YAML: {str(e)}")
+    if not isinstance(spec, dict):
+        raise TemplateError(f"Template {template_path} is not a mapping")
+
+    template_id = spec.get('id')
+    if not template_id:
+        raise TemplateError(f"Template {template_path} missing required 'id' field")
+
+    info = spec.get('info', {})
+    http_steps = spec.get('http', [])
+    javascript = spec.get('javascript')
+    extractors = spec.get('extractors', [])
+    exploit_module = spec.get('exploit_module')
+    variables = spec.get('variables') or {}
+    if not isinstance(variables, dict):
+        raise TemplateError(f"Template {template_path} has invalid 'variables'; expected a mapping")
+    _check_dsl(http_steps, template_path)
+
+    return Template(
+        template_id=template_id,
+        info=info,
+        http_steps=http_steps,
+        javascript=javascript,
+        extractors=extractors,
+        path=template_path,
+        exploit_module=exploit_module,
+        variables=variables,
+        digest=template_digest(content),
+    )
+
+def template_digest(content):
+    """Content hash identifying one version of a template's source"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
 
 def load_template(template_path):
     """
@@ -23,34 +140,41 @@ def load_template(template_path):
     Returns a Template object.
     """
     try:
-        with open(template_path, 'r') as f:
-            spec = yaml.safe_load(f)
-            
-        template_id = spec.get('id')
-        if not template_id:
-            raise TemplateError(f"Template {template_path} missing required 'id' field")
-            
-        info = spec.get('info', {})
-        http_steps = spec.get('http', [])
-        javascript = spec.get('javascript')
-        extractors = spec.get('extractors', [])
-        
-        return Template(
-            template_id=template_id,
-            info=info,
-            http_steps=http_steps,
-            javascript=javascript,
-            extractors=extractors
-        )
+        with open(template_path, 'rb') as f:
+            return parse_template(f.read(), template_path)
     except Exception as e:
         logging.error(f"Error loading template {template_path}: {str(e)}")
         return None
 
-def load_templates(template_dir="templates"):
+def filter_templates(templates, tags=None, severity=None):
+    """
+    Keep only templates carrying at least one of the given tags and, if
+    given, one of the given severities. Empty filters keep everything.
+    """
+    templates = list(templates)
+    if tags:
+        wanted = {tag.strip().lower() for tag in tags}
+        templates = [t for t in templates if wanted & {tag.lower() for tag in t.tags}]
+    if severity:
+        wanted = {level.strip().lower() for level in severity}
+        templates = [t for t in templates if str(t.info.get('severity', '')).lower() in wanted]
+    return templates
+
+def load_templates(template_dir="templates", tags=None, severity=None, use_cache=True):
     """
     Load all templates from the specified directory.
     Returns a list of Template objects.
+
+    With use_cache, parsed templates come from the on-disk template cache
+    and only new or modified files are parsed again.
     """
+    if use_cache:
+        from core.template_cache import TemplateCache
+        try:
+            return TemplateCache().load(template_dir).select(tags=tags, severity=severity)
+        except Exception as e:
+            logger.warning(f"Template cache unavailable, parsing templates directly: {str(e)}")
+
     templates = []
     try:
         # Find all YAML files in the template directory
@@ -68,4 +192,4 @@ def load_templates(template_dir="templates"):
     except Exception as e:
         logger.error(f"Error loading templates: {str(e)}")
         
-    return templates
+    return filter_templates(templates, tags, severity)
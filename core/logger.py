@@ -1,54 +1,431 @@
-import json
-import logging
-from datetime import datetime
-from pathlib import Path
-
-logger = logging.getLogger(__name__)
-
-class ResultLogger:
-    def __init__(self, output_dir='results'):
-        """
-        Initialize the result logger
-        
-        Args:
-            output_dir (str): Directory to save results
-        """
-        self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
-    
-    def _generate_filename(self, template_id):
-        """Generate a timestamped filename for results"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        return f"{template_id}_{timestamp}.json"
-    
-    def save_result(self, scan_result, exploit_result=None):
-        """
-        Save scan and exploit results to a JSON file
-        
-        Args:
-            scan_result (dict): Results from the scan
-            exploit_result (dict, optional): Results from the exploit module
-        """
-        try:
-            # Prepare result data
-            result_data = {
-                'scan': scan_result,
-                'timestamp': datetime.now().isoformat(),
-            }
-            
-            if exploit_result:
-                result_data['exploit'] = exploit_result
-            
-            # Generate filename and save
-            filename = self._generate_filename(scan_result['template_id'])
-            output_path = self.output_dir / filename
-            
-            with open(output_path, 'w') as f:
-                json.dump(result_data, f, indent=2)
-            
-            logger.info(f"Results saved to {output_path}")
-            return str(output_path)
-            
-        except Exception as e:
-            logger.error(f"Failed to save results: {str(e)}")
-            return None 
\ No newline at end of file
+import importlib.util
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ('json', 'jsonl')
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_FSYNC_INTERVAL = 5.0
+# Records written per batch; also bounds the queue at a multiple of this
+WRITE_BATCH_SIZE = 256
+# Encoded text collected before it is handed to the (compressing) stream
+WRITE_BUFFER_SIZE = 64 * 1024
+# How often a caller waiting on the writer thread checks that it still runs
+WRITER_POLL_INTERVAL = 0.5
+
+class ResultLogger:
+    def __init__(self, output_dir='results'):
+        """
+        Initialize the result logger
+        
+        Args:
+            output_dir (str): Directory to save results
+        """
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
+    
+    def _generate_filename(self, template_id):
+        """Generate a timestamped filename for results, unique within output_dir"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"{template_id}_{timestamp}.json"
+        counter = 1
+        while (self.output_dir / filename).exists():
+            filename = f"{template_id}_{timestamp}_{counter}.json"
+            counter += 1
+        return filename
+    
+    def save_result(self, scan_result, exploit_result=None):
+        """
+        Save scan and exploit results to a JSON file
+        
+        Args:
+            scan_result (ScanResult or dict): Results from the scan; a
+                ScanResult is closed once written
+            exploit_result (dict, optional): Results from the exploit module
+        """
+        try:
+            # Prepare result data
+            result_data = result_record(scan_result, exploit_result)
+            
+            # Generate filename and save
+            filename = self._generate_filename(result_data['scan']['template_id'])
+            output_path = self.output_dir / filename
+            
+            with metrics.timer('serialize_seconds', format='json'):
+                with open(output_path, 'w') as f:
+                    json.dump(result_data, f, indent=2)
+            if hasattr(scan_result, 'close'):
+                scan_result.close()
+            
+            logger.info(f"Results saved to {output_path}")
+            return str(output_path)
+            
+        except Exception as e:
+            logger.error(f"Failed to save results: {str(e)}")
+            return None
+
+    resumable = False
+
+    def sync(self):
+        """Files are written synchronously; there is no position to report"""
+        return None
+
+    def close(self):
+        """Nothing is buffered in per-file mode"""
+        pass
+
+def result_record(scan_result, exploit_result=None):
+    """The object written for one scan, shared by both output formats"""
+    if hasattr(scan_result, 'to_dict'):
+        scan_result = scan_result.to_dict()
+    record = {
+        'scan': scan_result,
+        'timestamp': datetime.now().isoformat(),
+    }
+    if exploit_result:
+        record['exploit'] = exploit_result
+    return record
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+class _StreamedRecord:
+    """
+    A scan record whose findings are encoded one at a time as it is
+    written, rather than built into one big dict first
+    """
+    __slots__ = ('scan_result', 'exploit_result', 'timestamp')
+
+    def __init__(self, scan_result, exploit_result=None):
+        self.scan_result = scan_result
+        self.exploit_result = exploit_result
+        self.timestamp = datetime.now().isoformat()
+
+    def pieces(self):
+        """The record's JSON text in pieces; the same text _dumps() gives for the full record"""
+        scan = self.scan_result
+        meta = scan.meta()
+        head = _dumps({**meta, 'target': scan.target_url, 'vulnerable': scan.vulnerable})
+        yield '{"scan":' + head[:-1] + ',"results":['
+        separator = ''
+        for finding in scan.results:
+            yield separator + _dumps({**meta, **finding.to_dict()})
+            separator = ','
+        yield ']},"timestamp":' + _dumps(self.timestamp)
+        if self.exploit_result:
+            yield ',"exploit":' + _dumps(self.exploit_result)
+        yield '}'
+
+def _record_pieces(record):
+    if isinstance(record, _StreamedRecord):
+        return record.pieces()
+    return (_dumps(record),)
+
+def _open_stream(path, compress=None, offset=None):
+    """
+    Open a binary output stream, compressed if requested
+
+    Args:
+        path (Path): File to create
+        compress (str, optional): 'gzip' or 'zstd'
+        offset (int, optional): Continue an existing file instead,
+            discarding everything after this byte offset
+
+    Returns:
+        tuple: (stream to write to, underlying file for fsync)
+    """
+    # Checked before the file is created; _compressor() imports it
+    if compress == 'zstd' and importlib.util.find_spec('zstandard') is None:
+        raise ValueError("zstd compression requires the zstandard package")
+    if offset is None:
+        raw = open(path, 'xb')
+    else:
+        raw = open(path, 'r+b')
+        raw.truncate(offset)
+        raw.seek(offset)
+    return _compressor(raw, compress), raw
+
+def _compressor(raw, compress):
+    # Each call starts a new gzip member / zstd frame; readers treat the
+    # concatenation as one stream
+    if compress == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=raw, mode='wb')
+    if compress == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+    return raw
+
+class JsonlResultSink:
+    """
+    Streams results into one newline-delimited JSON file per run.
+
+    save_result() only queues the record; a background thread encodes
+    queued records in batches, appends them as compact single-line JSON
+    objects and fsyncs the file at most every ``fsync_interval`` seconds.
+    sync() reports a position the file can later be cut back to, which is
+    how an interrupted run resumes without duplicate records.
+    """
+
+    resumable = True
+
+    def __init__(self, output_dir='results', compress=None, run_id=None,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, fsync_interval=DEFAULT_FSYNC_INTERVAL,
+                 resume_from=None):
+        """
+        Initialize the sink and start its writer thread
+        
+        Args:
+            output_dir (str): Directory to save results
+            compress (str, optional): 'gzip' or 'zstd'
+            run_id (str, optional): Names the run's file; defaults to a timestamp
+            flush_interval (float): Longest time a record waits in the queue
+            fsync_interval (float): Minimum seconds between fsyncs
+            resume_from (dict, optional): Position returned by sync(); the
+                file is truncated to it and appended to
+        """
+        if compress not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression: {compress}")
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        if resume_from:
+            self.path = Path(resume_from['path'])
+            self.written = resume_from['records']
+            offset = resume_from['offset']
+        else:
+            self.path = self._generate_path(COMPRESSION_SUFFIXES[compress])
+            self.written = 0
+            offset = None
+
+        try:
+            self._stream, self._raw = _open_stream(self.path, compress, offset)
+        except FileNotFoundError:
+            raise ValueError(f"Result file {self.path} no longer exists")
+        self._queue = queue.Queue(maxsize=WRITE_BATCH_SIZE * 16)
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(target=self._write_loop, name='pentoscan-results', daemon=True)
+        self._thread.start()
+
+    def _generate_path(self, suffix):
+        """One file per run, never appending to an earlier run's file"""
+        path = self.output_dir / f"run_{self.run_id}.jsonl{suffix}"
+        counter = 1
+        while path.exists():
+            path = self.output_dir / f"run_{self.run_id}_{counter}.jsonl{suffix}"
+            counter += 1
+        return path
+
+    def save_result(self, scan_result, exploit_result=None):
+        """
+        Queue a scan result for writing
+        
+        Args:
+            scan_result (ScanResult or dict): Results from the scan; a
+                ScanResult is read while it is written, then closed
+            exploit_result (dict, optional): Results from the exploit module
+
+        Returns:
+            str: Path of the run's file, or None if the sink is unusable
+        """
+        if self._closed or self._error:
+            logger.error(f"Failed to save results: sink for {self.path} is closed")
+            return None
+        try:
+            if hasattr(scan_result, 'meta'):
+                record = _StreamedRecord(scan_result, exploit_result)
+            else:
+                record = result_record(scan_result, exploit_result)
+            self._put(record)
+            return str(self.path)
+        except Exception as e:
+            logger.error(f"Failed to save results: {str(e)}")
+            return None
+
+    def _check_writer(self):
+        """Raise the error that stopped the writer thread, if it stopped"""
+        if self._error is not None:
+            raise self._error
+        if not self._thread.is_alive():
+            raise RuntimeError(f"Writer thread for {self.path} has stopped")
+
+    def _put(self, item):
+        """
+        Queue an item for the writer thread. A full queue is only waited
+        on while the writer runs; once it has failed nothing drains it.
+        """
+        while True:
+            self._check_writer()
+            try:
+                self._queue.put(item, timeout=WRITER_POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def _write_loop(self):
+        last_sync = time.monotonic()
+        done = False
+        while not done:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                done = True
+
+            try:
+                records = []
+                for item in batch:
+                    if isinstance(item, _SyncRequest):
+                        self._write(records)
+                        records = []
+                        item.position = self._checkpoint()
+                        item.set()
+                        last_sync = time.monotonic()
+                    else:
+                        records.append(item)
+                self._write(records)
+                if done or (records and time.monotonic() - last_sync >= self.fsync_interval):
+                    self._sync()
+                    last_sync = time.monotonic()
+            except Exception as e:
+                self._error = e
+                logger.error(f"Failed to write results to {self.path}: {str(e)}")
+                for item in batch:
+                    if isinstance(item, _SyncRequest):
+                        item.set()
+                return
+
+    def _write(self, records):
+        if records:
+            with metrics.timer('serialize_seconds', format='jsonl'):
+                buffer, size = [], 0
+                for record in records:
+                    for piece in _record_pieces(record):
+                        buffer.append(piece)
+                        size += len(piece)
+                        if size >= WRITE_BUFFER_SIZE:
+                            self._stream.write(''.join(buffer).encode('utf-8'))
+                            buffer, size = [], 0
+                    buffer.append('\n')
+                    if isinstance(record, _StreamedRecord):
+                        # Encoded; spilled findings need not stay on disk
+                        record.scan_result.close()
+                self._stream.write(''.join(buffer).encode('utf-8'))
+            self.written += len(records)
+
+    def _checkpoint(self):
+        # End the compressed member so the file is complete up to here;
+        # later records go into a new one
+        compressed = self._stream is not self._raw
+        if compressed:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        position = {'path': str(self.path), 'offset': self._raw.tell(), 'records': self.written}
+        if compressed:
+            self._stream = _compressor(self._raw, self.compress)
+        return position
+
+    def _sync(self):
+        self._stream.flush()
+        if self._raw is not self._stream:
+            self._raw.flush()
+        os.fsync(self._raw.fileno())
+
+    def sync(self):
+        """
+        Write and fsync everything queued so far
+
+        Returns:
+            dict: Position to pass back as ``resume_from``, or None if the
+                sink is unusable
+        """
+        if self._closed or self._error:
+            return None
+        request = _SyncRequest()
+        try:
+            self._put(request)
+            while not request.wait(WRITER_POLL_INTERVAL):
+                self._check_writer()
+        except Exception as e:
+            logger.error(f"Failed to sync {self.path}: {str(e)}")
+            return None
+        return request.position
+
+    def close(self):
+        """Write everything still queued, fsync and close the file"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._error is None:
+            try:
+                self._put(None)
+            except Exception:
+                # Already logged by the writer thread
+                pass
+            self._thread.join()
+        try:
+            self._stream.close()
+            if self._raw is not self._stream:
+                self._raw.close()
+        except Exception as e:
+            logger.error(f"Failed to close {self.path}: {str(e)}")
+        logger.info(f"{self.written} results written to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _SyncRequest(threading.Event):
+    """Queued behind pending records; set once they are on disk"""
+    position = None
+
+def create_result_logger(output_dir='results', output_format='json', compress=None, run_id=None,
+                         resume_from=None):
+    """
+    Create the result writer for an output format
+
+    Args:
+        output_dir (str): Directory to save results
+        output_format (str): 'json' for one pretty-printed file per scan,
+            'jsonl' for a single streamed file per run
+        compress (str, optional): Compression for jsonl output; json
+            output cannot be compressed
+        run_id (str, optional): Names the jsonl run file
+        resume_from (dict, optional): Position of an interrupted run's
+            jsonl file to continue from
+
+    Returns:
+        ResultLogger or JsonlResultSink
+
+    Raises:
+        ValueError: For compression with json output, or an unusable file
+    """
+    if compress and output_format != 'jsonl':
+        raise ValueError(f"{compress} compression is only supported for jsonl output")
+    if output_format == 'jsonl':
+        return JsonlResultSink(output_dir, compress=compress, run_id=run_id, resume_from=resume_from)
+    return ResultLogger(output_dir) 
\ No newline at end of file
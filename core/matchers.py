@@ -0,0 +1,544 @@
+import logging
+import re
+import sys
+from core.dsl import compile_expression, compile_string
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+try:
+    import ahocorasick
+except ImportError:  # optional, falls back to per-word substring search
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_RE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+ANY_PLACEHOLDER_RE = re.compile(r"\{\{.+?\}\}")
+
+# Word lists shorter than this are faster to check with plain `in`
+AUTOMATON_MIN_WORDS = 16
+# Literals shorter than this do not filter anything useful
+MIN_LITERAL_LENGTH = 3
+# Lowercased non-ASCII characters that re.IGNORECASE takes for ASCII
+# letters (U+0307 is left over from lowercasing a dotted capital I)
+NON_ASCII_RE = re.compile(r"[^\x00-\x7f]+")
+ASCII_FOLD = str.maketrans({"\u0131": "i", "\u017f": "s", "\u0307": None})
+# Response parts that include the headers
+HEADER_PARTS = ("header", "all")
+# DSL variables that require the body to be downloaded
+DSL_BODY_NAMES = frozenset(("body", "all", "response", "raw", "content_length"))
+
+def response_part(response, part):
+    """Return the text of the response part a matcher or extractor targets."""
+    if part == "header":
+        return response.raw_headers
+    if part == "all":
+        return response_part(response, "header") + "\r\n\r\n" + response.text
+    return response.text
+
+def part_needs_body(part):
+    """Whether response_part(response, part) reads the body: every part but the headers"""
+    return part != "header"
+
+class PartCache:
+    """Build each response part (and its lowercase form) at most once"""
+
+    def __init__(self, response):
+        self.response = response
+        self._parts = {}
+
+    def get(self, part, lower=False):
+        key = (part, lower)
+        if key not in self._parts:
+            text = self.get(part) if lower else response_part(self.response, part)
+            self._parts[key] = text.lower() if lower else text
+        return self._parts[key]
+
+def _required_literals(pattern):
+    """
+    Find literal substrings any match of ``pattern`` must contain.
+
+    Returns (literals, ignorecase). The list is empty when nothing useful can
+    be derived; the pattern is then always run. Case-insensitive literals
+    are lowercase and ASCII only, as Unicode case rules let some
+    non-ASCII characters match more than their lowercase form.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return [], False
+    ignorecase = bool(parsed.state.flags & re.IGNORECASE)
+    runs = []
+
+    def walk(items):
+        current = []
+        for op, arg in items:
+            if op is sre_constants.LITERAL:
+                current.append(chr(arg))
+                continue
+            runs.append("".join(current))
+            current = []
+            if op is sre_constants.SUBPATTERN:
+                _, add_flags, _, sub = arg
+                if add_flags & re.IGNORECASE:
+                    nonlocal ignorecase
+                    ignorecase = True
+                walk(sub)
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and arg[0] >= 1:
+                walk(arg[2])
+        runs.append("".join(current))
+
+    walk(parsed)
+    if ignorecase:
+        runs = [piece.lower() for run in runs for piece in NON_ASCII_RE.split(run)]
+    literals = {run for run in runs if len(run) >= MIN_LITERAL_LENGTH}
+    return sorted(literals, key=lambda run: (-len(run), run)), ignorecase
+
+def _header_map(response):
+    # Headers as DSL variables: Content-Type is read as content_type
+    return {name.lower().replace("-", "_"): value for name, value in response.headers.items()}
+
+# DSL variables describing a response, computed on first reference
+RESPONSE_FIELDS = {
+    "status_code": lambda parts: parts.response.status_code,
+    "body": lambda parts: parts.get("body"),
+    "header": lambda parts: parts.get("header"),
+    "all_headers": lambda parts: parts.get("header"),
+    "all": lambda parts: parts.get("all"),
+    "response": lambda parts: parts.get("all"),
+    "raw": lambda parts: parts.get("all"),
+    "content_length": lambda parts: len(parts.response.content),
+    "duration": lambda parts: parts.response.elapsed,
+}
+
+class ResponseContext:
+    """
+    The variables a dsl matcher sees: response fields, then the request's
+    variables, then response headers by normalized name.
+    """
+
+    def __init__(self, parts, variables):
+        self.parts = parts
+        self.variables = variables
+        self._values = {}
+        self._headers = None
+
+    def __getitem__(self, name):
+        if name in self._values:
+            return self._values[name]
+        field = RESPONSE_FIELDS.get(name)
+        if field is not None:
+            value = field(self.parts)
+        elif name in self.variables:
+            return self.variables[name]
+        else:
+            if self._headers is None:
+                self._headers = _header_map(self.parts.response)
+            value = self._headers[name]
+        self._values[name] = value
+        return value
+
+class _LiteralPresence:
+    """Lazily answers `literal in text`, scanning for each literal at most once"""
+
+    def __init__(self, text):
+        self.text = text
+        self._seen = {}
+
+    def __contains__(self, literal):
+        present = self._seen.get(literal)
+        if present is None:
+            present = self._seen[literal] = literal in self.text
+        return present
+
+class _LiteralFilter:
+    """
+    The distinct literals of a regex set.
+
+    With an automaton all of them are located in a single pass over the
+    text; otherwise each literal is searched for on demand.
+    """
+
+    def __init__(self, literals):
+        self._automaton = None
+        literals = set(literals)
+        if ahocorasick is not None and len(literals) >= AUTOMATON_MIN_WORDS:
+            self._automaton = ahocorasick.Automaton()
+            for literal in literals:
+                self._automaton.add_word(literal, literal)
+            self._automaton.make_automaton()
+
+    def scan(self, text):
+        if self._automaton is None:
+            return _LiteralPresence(text)
+        return {literal for _, literal in self._automaton.iter(text)}
+
+class RegexSet:
+    """
+    A list of regexes compiled once, with a literal prefilter.
+
+    Each pattern only runs when every literal it requires occurs in the
+    text, so a body that cannot match is rejected with one literal scan
+    instead of one full regex pass per pattern.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._compiled = []
+        for pattern in self.patterns:
+            try:
+                compiled = re.compile(pattern)
+            except re.error as e:
+                logger.warning(f"Skipping invalid regex {pattern!r}: {str(e)}")
+                continue
+            literals, ignorecase = _required_literals(pattern)
+            self._compiled.append((pattern, compiled, literals, ignorecase))
+        self._exact = _LiteralFilter(lit for _, _, lits, ic in self._compiled if not ic for lit in lits)
+        self._folded = _LiteralFilter(lit for _, _, lits, ic in self._compiled if ic for lit in lits)
+
+    def __len__(self):
+        return len(self._compiled)
+
+    def _candidates(self, parts, part):
+        text = parts.get(part)
+        exact = folded = None
+        for pattern, compiled, literals, ignorecase in self._compiled:
+            if literals:
+                if ignorecase:
+                    if folded is None:
+                        lowered = parts.get(part, lower=True)
+                        if not lowered.isascii():
+                            lowered = lowered.translate(ASCII_FOLD)
+                        folded = self._folded.scan(lowered)
+                    present = folded
+                else:
+                    if exact is None:
+                        exact = self._exact.scan(text)
+                    present = exact
+                if not all(literal in present for literal in literals):
+                    continue
+            yield pattern, compiled, text
+
+    def first(self, parts, part):
+        """Return the first pattern that matches, or None"""
+        for pattern, compiled, text in self._candidates(parts, part):
+            if compiled.search(text):
+                return pattern
+        return None
+
+    def matching(self, parts, part):
+        """Return every pattern that matches, in declaration order"""
+        return [pattern for pattern, compiled, text in self._candidates(parts, part)
+                if compiled.search(text)]
+
+    def finditer(self, parts, part):
+        """Yield (pattern, match) for every match of every pattern"""
+        for pattern, compiled, text in self._candidates(parts, part):
+            for match in compiled.finditer(text):
+                yield pattern, match
+
+class WordSet:
+    """Static word list searched in one pass when an automaton is available"""
+
+    def __init__(self, words):
+        # An automaton keeps one value per word, so a repeated word would
+        # never count twice and an "and" condition could not be met
+        self.words = list(dict.fromkeys(words))
+        self._automaton = None
+        if ahocorasick is not None and len(self.words) >= AUTOMATON_MIN_WORDS:
+            self._automaton = ahocorasick.Automaton()
+            for index, word in enumerate(self.words):
+                self._automaton.add_word(word, index)
+            self._automaton.make_automaton()
+
+    def found(self, text, stop_after=None):
+        """Return the set of word indexes present in text"""
+        found = set()
+        if self._automaton is not None:
+            for _, index in self._automaton.iter(text):
+                found.add(index)
+                if stop_after and len(found) >= stop_after:
+                    break
+            return found
+        for index, word in enumerate(self.words):
+            if word in text:
+                found.add(index)
+                if stop_after and len(found) >= stop_after:
+                    break
+        return found
+
+class CompiledMatcher:
+    """One template matcher, compiled once and evaluated per response"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.type = spec.get("type")
+        self.name = spec.get("name")
+        self.part = spec.get("part", "body")
+        self.negative = bool(spec.get("negative"))
+        self.require_all = spec.get("condition", "or") == "and"
+        self.status = set(spec.get("status", []))
+        self._words = None
+        self._dynamic_words = None
+        self._regexes = None
+        self._expressions = None
+
+        if self.type == "word":
+            words = spec.get("words", [])
+            if any(ANY_PLACEHOLDER_RE.search(word) for word in words):
+                self._dynamic_words = [compile_string(word) for word in words]
+            else:
+                self._words = WordSet(words)
+        elif self.type == "regex":
+            self._regexes = RegexSet(spec.get("regex", []))
+        elif self.type == "dsl":
+            self._expressions = [compile_expression(expression) for expression in spec.get("dsl", [])]
+        # Shared by every finding this matcher contributes to
+        self.description = sys.intern(self._describe())
+
+    @property
+    def names(self):
+        """Variables the matcher's DSL expressions read"""
+        return frozenset(name for expression in self._expressions or () for name in expression.names)
+
+    @property
+    def needs_body(self):
+        """Whether the matcher can only be decided once the body is read"""
+        if self.type == "status":
+            return False
+        if self.type in ("word", "regex"):
+            return part_needs_body(self.part)
+        if self.type == "dsl":
+            return not self.names.isdisjoint(DSL_BODY_NAMES)
+        return True
+
+    @property
+    def needs_headers(self):
+        """Whether the matcher reads response headers"""
+        if self.type in ("word", "regex"):
+            return self.part in HEADER_PARTS
+        if self.type == "dsl":
+            # Names that are not response fields may be header lookups
+            return any(name not in RESPONSE_FIELDS or name in ("header", "all_headers", "all", "response", "raw")
+                       for name in self.names)
+        return False
+
+    @property
+    def stream_words(self):
+        """
+        Static ASCII body words whose first occurrence alone makes this
+        matcher true, or None when it cannot be decided on a partial body.
+        """
+        if (self.type != "word" or self._words is None or self.negative
+                or self.require_all or self.part != "body"):
+            return None
+        if not all(word.isascii() and word for word in self._words.words):
+            return None
+        return [word.encode() for word in self._words.words]
+
+    def _evaluate(self, parts, variables):
+        if self.type == "status":
+            return parts.response.status_code in self.status
+        if self.type == "word":
+            text = parts.get(self.part)
+            if self._dynamic_words is not None:
+                words = [word.render(variables) for word in self._dynamic_words]
+                check = all if self.require_all else any
+                return check(word in text for word in words)
+            wanted = len(self._words.words)
+            found = self._words.found(text, stop_after=wanted if self.require_all else 1)
+            return len(found) == wanted if self.require_all else bool(found)
+        if self.type == "regex":
+            if self.require_all:
+                return len(self._regexes.matching(parts, self.part)) == len(self._regexes)
+            return self._regexes.first(parts, self.part) is not None
+        if self.type == "dsl":
+            return self.test(ResponseContext(parts, variables))
+        return False
+
+    def match(self, parts, variables=None):
+        """Evaluate against a PartCache; negative matchers are inverted"""
+        matched = self._evaluate(parts, variables or {})
+        return not matched if self.negative else matched
+
+    def test(self, context):
+        """Evaluate the DSL expressions against a mapping of variables"""
+        check = all if self.require_all else any
+        return check(expression.test(context) for expression in self._expressions or ())
+
+    def describe(self):
+        return self.description
+
+    def _describe(self):
+        if self.type == "status":
+            return "Matched status code"
+        if self.type == "dsl":
+            return f"Matched {self.name or 'dsl'} expression"
+        name = self.name or f"{self.type}s"
+        return f"Matched {name} in {self.part}"
+
+class CompiledExtractor:
+    """A named regex extractor compiled once"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec.get("name")
+        self.part = spec.get("part", "body")
+        self.group = spec.get("group", 0)
+        self._regexes = RegexSet(spec.get("regex", [])) if spec.get("type") == "regex" else None
+
+    @property
+    def needs_body(self):
+        return self._regexes is not None and part_needs_body(self.part)
+
+    @property
+    def needs_headers(self):
+        return self._regexes is not None and self.part in HEADER_PARTS
+
+    def extract(self, parts):
+        """Return extracted values in pattern order"""
+        if self._regexes is None:
+            return []
+        values = []
+        for _, match in self._regexes.finditer(parts, self.part):
+            try:
+                values.append(match.group(self.group))
+            except IndexError:
+                values.append(match.group(0))
+        return values
+
+class BodyWatcher:
+    """
+    Watches a streamed body for words, across chunk boundaries.
+
+    The last ``longest word - 1`` bytes of each chunk are carried over, so
+    a word split between two chunks is still found.
+    """
+
+    def __init__(self, words):
+        self.words = words
+        self._overlap = max(len(word) for word in words) - 1
+        self._tail = b""
+
+    def feed(self, chunk):
+        """Return True once any word has been seen"""
+        window = self._tail + chunk
+        if any(word in window for word in self.words):
+            return True
+        self._tail = window[-self._overlap:] if self._overlap else b""
+        return False
+
+class CompiledStep:
+    """All pre-conditions, matchers and extractors of one http step"""
+
+    def __init__(self, step):
+        self.preconditions = []
+        for spec in step.get("pre-condition", []):
+            if spec.get("type") == "dsl":
+                self.preconditions.append(CompiledMatcher(spec))
+            else:
+                logger.warning(f"Ignoring unsupported {spec.get('type')} pre-condition")
+        self.preconditions_require_all = step.get("pre-condition-operator", "and") == "and"
+        self.matchers = [CompiledMatcher(m) for m in step.get("matchers", [])]
+        self.extractors = [CompiledExtractor(e) for e in step.get("extractors", [])]
+        self.require_all = step.get("matchers-condition", "or") == "and"
+        self._extract_needs_body = any(e.needs_body for e in self.extractors)
+        self.needs_headers = any(m.needs_headers for m in self.matchers + self.extractors)
+        self._stream_words = self._find_stream_words()
+
+    @property
+    def precondition_names(self):
+        """Variables the pre-conditions read"""
+        return frozenset(name for matcher in self.preconditions for name in matcher.names)
+
+    def allows(self, variables):
+        """Whether the pre-conditions admit a request with these variables"""
+        if not self.preconditions:
+            return True
+        check = all if self.preconditions_require_all else any
+        return check(matcher.test(variables) != matcher.negative for matcher in self.preconditions)
+
+    def _find_stream_words(self):
+        # Reading can stop at the first hit only if nothing else needs the
+        # rest of the body. Header and status matchers are settled before
+        # the body is read, so the single body matcher decides the step.
+        if self._extract_needs_body:
+            return None
+        body_matchers = [m for m in self.matchers if m.needs_body]
+        if len(body_matchers) != 1:
+            return None
+        return body_matchers[0].stream_words
+
+    def _decide(self, outcomes):
+        """Step outcome from the matchers decided so far, or None if still open"""
+        if self.require_all:
+            if not all(outcomes.values()):
+                return False
+            return True if len(outcomes) == len(self.matchers) else None
+        if any(outcomes.values()):
+            return True
+        return False if len(outcomes) == len(self.matchers) else None
+
+    def _head_outcomes(self, parts, variables):
+        return {i: m.match(parts, variables) for i, m in enumerate(self.matchers) if not m.needs_body}
+
+    def body_needed(self, response, variables=None):
+        """
+        Decide from the status line and headers alone whether the body must
+        be downloaded for this step.
+        """
+        if not self.matchers:
+            return self._extract_needs_body
+        decided = self._decide(self._head_outcomes(PartCache(response), variables))
+        if decided is False:
+            return False
+        if decided is True:
+            return self._extract_needs_body
+        return True
+
+    def body_watcher(self):
+        """A BodyWatcher that may end the download early, or None"""
+        return BodyWatcher(self._stream_words) if self._stream_words else None
+
+    def evaluate(self, response, variables=None):
+        """
+        Apply the step's matchers to a response.
+
+        Matchers that only need the status line and headers run first; body
+        matchers only run if those did not already settle the outcome.
+
+        Returns:
+            tuple: (matched, details, parts) where parts is the PartCache
+                reused for extraction
+        """
+        parts = PartCache(response)
+        if not self.matchers:
+            return False, [], parts
+        outcomes = self._head_outcomes(parts, variables)
+        decided = self._decide(outcomes)
+        if decided is None:
+            for i, matcher in enumerate(self.matchers):
+                if i in outcomes:
+                    continue
+                outcomes[i] = matcher.match(parts, variables)
+                decided = self._decide(outcomes)
+                if decided is not None:
+                    break
+        details = [self.matchers[i].describe() for i in sorted(outcomes) if outcomes[i]]
+        return bool(decided), details, parts
+
+    def extract(self, parts):
+        """Run all extractors, returning their values in extractor order"""
+        values = []
+        for extractor in self.extractors:
+            values.extend(extractor.extract(parts))
+        return values
+
+def compile_matcher(spec):
+    """Compile a single matcher spec"""
+    return CompiledMatcher(spec)
@@ -0,0 +1,395 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds, Prometheus style
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_PROGRESS_INTERVAL = 5.0
+METRIC_PREFIX = 'pentoscan_'
+
+HELP = {
+    'requests_total': 'HTTP requests sent, by host and status',
+    'request_errors_total': 'HTTP requests that failed, by host and error type',
+    'response_bytes_total': 'Response body bytes read, by host',
+    'findings_total': 'Matched requests, by template',
+    'scans_total': 'Completed scans, by template',
+    'request_seconds': 'Time to response headers, by host',
+    'template_request_seconds': 'Time to response headers, by template',
+    'dns_seconds': 'Name resolution time for new connections, by host',
+    'connect_seconds': 'TCP connect time for new connections, by host',
+    'tls_seconds': 'TLS handshake time for new connections, by host',
+    'transfer_seconds': 'Body download time, by host',
+    'match_seconds': 'Matcher and extractor evaluation time, by template',
+    'javascript_seconds': 'Javascript step execution time, by template',
+    'scan_seconds': 'Wall time per scan, by template',
+    'serialize_seconds': 'Result serialization and write time',
+}
+
+class Histogram:
+    """Cumulative-bucket histogram with sum and count"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, total, count):
+        for i, c in enumerate(counts):
+            self.counts[i] += c
+        self.sum += total
+        self.count += count
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, c in zip(LATENCY_BUCKETS + (float('inf'),), self.counts):
+            seen += c
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _label_text(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in key) + '}'
+
+class Metrics:
+    """
+    Process-wide counters and latency histograms.
+
+    Collection is off until enable() is called; every hook first checks
+    ``enabled``, so a disabled registry costs one attribute lookup per call
+    site.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.time()
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the with-block"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def total(self, name, **labels):
+        """Sum of a counter over all label sets matching labels"""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(v for (n, key), v in self._counters.items() if n == name and wanted <= set(key))
+
+    def snapshot(self, reset=False):
+        """Picklable copy of all values, e.g. to send from a worker process"""
+        with self._lock:
+            data = {
+                'counters': [(n, key, v) for (n, key), v in self._counters.items()],
+                'histograms': [(n, key, list(h.counts), h.sum, h.count) for (n, key), h in self._histograms.items()],
+            }
+            if reset:
+                self._counters.clear()
+                self._histograms.clear()
+        return data
+
+    def merge(self, snapshot):
+        """Add a snapshot taken in another process"""
+        with self._lock:
+            for name, key, value in snapshot['counters']:
+                self._counters[(name, key)] = self._counters.get((name, key), 0) + value
+            for name, key, counts, total, count in snapshot['histograms']:
+                histogram = self._histograms.get((name, key))
+                if histogram is None:
+                    histogram = self._histograms[(name, key)] = Histogram()
+                histogram.merge(counts, total, count)
+
+    def to_dict(self):
+        """JSON-friendly form with p50/p99 estimates per histogram"""
+        with self._lock:
+            counters = {}
+            for (name, key), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append({'labels': dict(key), 'value': value})
+            histograms = {}
+            for (name, key), h in sorted(self._histograms.items()):
+                histograms.setdefault(name, []).append({
+                    'labels': dict(key),
+                    'count': h.count,
+                    'sum': round(h.sum, 6),
+                    'p50': h.quantile(0.5),
+                    'p99': h.quantile(0.99),
+                })
+        return {'uptime_seconds': round(time.time() - self.started, 3), 'counters': counters,
+                'histograms': histograms}
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        described = set()
+        for (name, key), value in counters:
+            full = METRIC_PREFIX + name
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {full} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {full} counter")
+            lines.append(f"{full}{_label_text(key)} {value}")
+        for (name, key), h in histograms:
+            full = METRIC_PREFIX + name
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {full} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {full} histogram")
+            cumulative = 0
+            for bound, c in zip(LATENCY_BUCKETS + (float('inf'),), h.counts):
+                cumulative += c
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{full}_bucket{_label_text(key + (('le', le),))} {cumulative}")
+            lines.append(f"{full}_sum{_label_text(key)} {h.sum}")
+            lines.append(f"{full}_count{_label_text(key)} {h.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write a metrics file: JSON for *.json, Prometheus text otherwise"""
+        path = Path(path)
+        content = json.dumps(self.to_dict(), indent=2) if path.suffix == '.json' else self.to_prometheus()
+        tmp_path = path.with_name(path.name + '.tmp')
+        try:
+            tmp_path.write_text(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {path}: {str(e)}")
+
+    def summary(self):
+        """Human-readable end-of-run report, as printed by --stats"""
+        data = self.to_dict()
+        counters = data['counters']
+        elapsed = max(data['uptime_seconds'], 1e-9)
+        requests = sum(c['value'] for c in counters.get('requests_total', []))
+        errors = sum(c['value'] for c in counters.get('request_errors_total', []))
+        body_bytes = sum(c['value'] for c in counters.get('response_bytes_total', []))
+        lines = [
+            "\n=== Run Statistics ===",
+            f"Duration: {elapsed:.2f}s",
+            f"Requests: {requests} ({requests / elapsed:.1f}/s), errors: {errors}, "
+            f"body bytes: {body_bytes}",
+        ]
+        if 'incremental_requests_total' in counters:
+            results = {'unchanged': 0, 'changed': 0, 'new': 0}
+            for c in counters['incremental_requests_total']:
+                result = c['labels'].get('result')
+                if result in results:
+                    results[result] += c['value']
+            lines.append(f"Incremental: {results['unchanged']} unchanged, {results['changed']} changed, "
+                         f"{results['new']} new")
+        by_name = data['histograms']
+        phases = ('dns_seconds', 'connect_seconds', 'tls_seconds', 'request_seconds', 'transfer_seconds',
+                  'match_seconds', 'javascript_seconds', 'serialize_seconds')
+        lines.append("\nPhase                 count      total s     p50 ms     p99 ms")
+        for name in phases:
+            if name not in by_name:
+                continue
+            merged = Histogram()
+            for h in self._histograms_named(name):
+                merged.merge(h.counts, h.sum, h.count)
+            lines.append(f"{name[:-8]:<20} {merged.count:>7} {merged.sum:>12.3f} "
+                         f"{_fmt_ms(merged.quantile(0.5)):>10} {_fmt_ms(merged.quantile(0.99)):>10}")
+        for title, name, label in (('Template', 'scan_seconds', 'template'),
+                                   ('Host', 'request_seconds', 'host')):
+            entries = by_name.get(name)
+            if not entries:
+                continue
+            lines.append(f"\n{title:<32} count      total s     p50 ms     p99 ms")
+            for entry in sorted(entries, key=lambda e: -e['sum'])[:20]:
+                lines.append(f"{str(entry['labels'].get(label, '-'))[:32]:<32} {entry['count']:>5} "
+                             f"{entry['sum']:>12.3f} {_fmt_ms(entry['p50']):>10} {_fmt_ms(entry['p99']):>10}")
+        return '\n'.join(lines)
+
+    def _histograms_named(self, name):
+        with self._lock:
+            return [h for (n, _), h in self._histograms.items() if n == name]
+
+def _fmt_ms(seconds):
+    if seconds is None:
+        return '-'
+    if seconds == float('inf'):
+        return f">{LATENCY_BUCKETS[-1] * 1000:.0f}"
+    return f"<={seconds * 1000:g}"
+
+metrics = Metrics()
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /metrics.json on a local port"""
+
+    def __init__(self, port, host='127.0.0.1', registry=None):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = registry or metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = registry.to_prometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = json.dumps(registry.to_dict()), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name='pentoscan-metrics', daemon=True).start()
+        logger.info(f"Metrics served on http://{host}:{self._httpd.server_address[1]}/metrics")
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+class ProgressReporter:
+    """
+    Background thread printing a progress line every ``interval`` seconds,
+    and rewriting the metrics file if one was requested.
+    """
+
+    def __init__(self, total=None, interval=DEFAULT_PROGRESS_INTERVAL, show=True, metrics_file=None,
+                 registry=None):
+        """
+        Args:
+            total (int, optional): Expected number of scans
+            interval (float): Seconds between updates
+            show (bool): Print progress lines to stderr
+            metrics_file (str, optional): Rewritten on every update
+        """
+        self.total = total
+        self.interval = interval
+        self.show = show
+        self.metrics_file = metrics_file
+        self.registry = registry or metrics
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='pentoscan-progress', daemon=True)
+        self._thread.start()
+
+    def line(self):
+        elapsed = max(time.time() - self.registry.started, 1e-9)
+        scans = self.registry.total('scans_total')
+        requests = self.registry.total('requests_total')
+        errors = self.registry.total('request_errors_total')
+        findings = self.registry.total('findings_total')
+        done = f"{scans}/{self.total}" if self.total else str(scans)
+        return (f"[progress] {elapsed:6.0f}s  scans {done}  requests {requests} "
+                f"({requests / elapsed:.1f}/s)  errors {errors}  findings {findings}")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            if self.show:
+                print(self.line(), file=sys.stderr, flush=True)
+            if self.metrics_file:
+                self.registry.write(self.metrics_file)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        if self.metrics_file:
+            self.registry.write(self.metrics_file)
+
+class TemplateProfiler:
+    """
+    Opt-in cProfile per template, written to <directory>/<template_id>.prof.
+
+    cProfile only sees the calling thread, which is where templates are
+    expanded and responses matched; time spent on the HTTP pool threads
+    shows up in the metrics instead. Profiles accumulate over every scan
+    of a template and the file is rewritten after each one, so it can be
+    opened with pstats or snakeviz at any point.
+    """
+
+    def __init__(self, directory, suffix=''):
+        """
+        Args:
+            directory (str): Where profiles are written
+            suffix (str): Added to file names, e.g. a worker pid
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.suffix = suffix
+        self._profiles = {}
+
+    @contextmanager
+    def profile(self, template_id):
+        import cProfile
+
+        profiler = self._profiles.get(template_id)
+        if profiler is None:
+            profiler = self._profiles[template_id] = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = self.directory / f"{template_id}{self.suffix}.prof"
+            try:
+                profiler.dump_stats(str(path))
+            except OSError as e:
+                logger.warning(f"Could not write profile {path}: {str(e)}")
@@ -1,68 +1,175 @@
-import importlib.util
-import logging
-import sys
-from pathlib import Path
-
-logger = logging.getLogger(__name__)
-
-class ModuleError(Exception):
-    """Custom exception for module-related errors"""
-    pass
-
-def load_module(module_path):
-    """
-    Dynamically load a Python module from file
-    
-    Args:
-        module_path (str): Path to the Python module file
-        
-    Returns:
-        module: Loaded module object
-        
-    Raises:
-        ModuleError: If module cannot be loaded
-    """
-    try:
-        # Convert to absolute path
-        module_path = Path(module_path).resolve()
-        
-        # Check if file exists
-        if not module_path.exists():
-            raise ModuleError(f"Module file not found: {module_path}")
-        
-        # Load module
-        spec = importlib.util.spec_from_file_location(module_path.stem, module_path)
-        if spec is None:
-            raise ModuleError(f"Could not load module spec from {module_path}")
-        
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_path.stem] = module
-        spec.loader.exec_module(module)
-        
-        # Validate module has required interface
-        if not hasattr(module, 'run'):
-            raise ModuleError("Module must have a 'run' function")
-        
-        return module
-        
-    except Exception as e:
-        raise ModuleError(f"Failed to load module: {str(e)}")
-
-def run_exploit(module_path, target_url, scan_result):
-    """
-    Run an exploit module with the given target and scan results
-    
-    Args:
-        module_path (str): Path to the exploit module
-        target_url (str): Target URL
-        scan_result (dict): Results from the scan
-        
-    Returns:
-        dict: Results from the exploit
-    """
-    try:
-        module = load_module(module_path)
-        return module.run(target_url, scan_result)
-    except ModuleError as e:
-        logger.error(f"Exploit failed: {str(e)}")
-        return {'success': False, 'error': str(e)} 
\ No newline at end of file
+import importlib.util
+import inspect
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from pathlib import Path
+
+from core.defaults import DEFAULT_EXPLOIT_TIMEOUT, DEFAULT_EXPLOIT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Loaded modules are registered under this package name, not their bare stem
+MODULE_NAMESPACE = 'pentoscan_modules'
+
+# path -> (mtime_ns, module); a module is executed again only if its file changed
+_module_cache = {}
+_module_lock = threading.Lock()
+
+class ModuleError(Exception):
+    """Custom exception for module-related errors"""
+    pass
+
+def load_module(module_path):
+    """
+    Dynamically load a Python module from file
+    
+    The module is executed and validated once per process and served from
+    a cache afterwards, unless the file has changed since.
+    
+    Args:
+        module_path (str): Path to the Python module file
+        
+    Returns:
+        module: Loaded module object
+        
+    Raises:
+        ModuleError: If module cannot be loaded
+    """
+    try:
+        # Convert to absolute path
+        module_path = Path(module_path).resolve()
+        
+        # Check if file exists
+        if not module_path.exists():
+            raise ModuleError(f"Module file not found: {module_path}")
+        mtime_ns = module_path.stat().st_mtime_ns
+        
+        with _module_lock:
+            cached = _module_cache.get(module_path)
+            if cached and cached[0] == mtime_ns:
+                return cached[1]
+            
+            # Load module
+            name = f"{MODULE_NAMESPACE}.{module_path.stem}"
+            spec = importlib.util.spec_from_file_location(name, module_path)
+            if spec is None:
+                raise ModuleError(f"Could not load module spec from {module_path}")
+            
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[name] = module
+            spec.loader.exec_module(module)
+            
+            # Validate module has required interface
+            if not hasattr(module, 'run'):
+                raise ModuleError("Module must have a 'run' function")
+            
+            _module_cache[module_path] = (mtime_ns, module)
+            return module
+        
+    except Exception as e:
+        raise ModuleError(f"Failed to load module: {str(e)}")
+
+def _call_module(module, target_url, scan_result, client):
+    # Modules get the scan result as a plain dict
+    if hasattr(scan_result, 'to_dict'):
+        scan_result = scan_result.to_dict()
+    if client is not None and 'client' in inspect.signature(module.run).parameters:
+        return module.run(target_url, scan_result, client=client)
+    return module.run(target_url, scan_result)
+
+def run_exploit(module_path, target_url, scan_result, client=None):
+    """
+    Run an exploit module with the given target and scan results
+    
+    Args:
+        module_path (str): Path to the exploit module
+        target_url (str): Target URL
+        scan_result (ScanResult or dict): Results from the scan
+        client (HttpClient, optional): Shared client, passed to modules whose
+            run() accepts a `client` argument so they obey the same per-host
+            rate limits as the scanner
+        
+    Returns:
+        dict: Results from the exploit
+    """
+    try:
+        module = load_module(module_path)
+        return _call_module(module, target_url, scan_result, client)
+    except ModuleError as e:
+        logger.error(f"Exploit failed: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+class ExploitRunner:
+    """
+    Runs exploit modules for many findings in parallel.
+
+    Modules are loaded once (see load_module) and share one HTTP client, so
+    their probes are pooled and rate limited together with the scan. Each
+    run gets ``timeout`` seconds; a run that overstays is reported as
+    failed. Python threads cannot be killed, so it keeps its worker until
+    it returns.
+    """
+
+    def __init__(self, client=None, workers=DEFAULT_EXPLOIT_WORKERS, timeout=DEFAULT_EXPLOIT_TIMEOUT):
+        """
+        Initialize the runner
+        
+        Args:
+            client (HttpClient, optional): Client handed to the modules
+            workers (int): Exploit modules running at the same time
+            timeout (float): Seconds a module may run
+        """
+        self.client = client
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='pentoscan-exploit')
+        self._started = {}
+
+    def submit(self, module_path, target_url, scan_result):
+        """Queue an exploit run and return its Future"""
+        started = {}
+
+        def job():
+            started['at'] = time.monotonic()
+            return run_exploit(module_path, target_url, scan_result, self.client)
+
+        future = self._executor.submit(job)
+        self._started[future] = started
+        return future
+
+    def result(self, future):
+        """
+        Wait for a submitted run
+        
+        The timeout counts from when the module started running, not from
+        when it was queued or when this is called.
+        
+        Returns:
+            dict: The module's result, or a failure once it overran
+        """
+        started = self._started.pop(future, {})
+        while True:
+            at = started.get('at')
+            wait = 0.1 if at is None else max(0.0, self.timeout - (time.monotonic() - at))
+            try:
+                return future.result(timeout=wait)
+            except FutureTimeout:
+                if at is None:
+                    continue
+                logger.error(f"Exploit timed out after {self.timeout}s")
+                return {'success': False, 'error': f"Timed out after {self.timeout}s"}
+            except Exception as e:
+                logger.error(f"Exploit failed: {str(e)}")
+                return {'success': False, 'error': str(e)}
+
+    def close(self):
+        """Stop accepting work; runs still going are abandoned"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,126 @@
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+ATTACK_TYPES = ('batteringram', 'pitchfork', 'clusterbomb')
+
+class PayloadError(Exception):
+    """Custom exception for payload-related errors"""
+    pass
+
+class Wordlist:
+    """
+    A payload file streamed line by line.
+
+    Iterating re-reads the file, so a wordlist can be walked many times
+    (e.g. as the inner loop of a clusterbomb) without ever holding it in
+    memory.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._length = None
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if line:
+                    yield line
+
+    def __len__(self):
+        if self._length is None:
+            self._length = sum(1 for _ in self)
+        return self._length
+
+def resolve_payload_file(source, template_path=None):
+    """Find a payload file relative to the cwd or to the template's directory"""
+    candidates = [Path(source)]
+    if template_path:
+        candidates.append(Path(template_path).parent / source)
+    for candidate in candidates:
+        if candidate.is_file():
+            return candidate
+    return None
+
+def payload_source(source, template_path=None):
+    """
+    Turn one `payloads` entry into a re-iterable source.
+
+    Lists are used as-is; strings name a wordlist file, streamed lazily.
+    """
+    if isinstance(source, (list, tuple)):
+        return [str(value) for value in source]
+    if isinstance(source, str):
+        path = resolve_payload_file(source, template_path)
+        if path is None:
+            raise PayloadError(f"Payload file not found: {source}")
+        return Wordlist(path)
+    return [str(source)]
+
+def _batteringram(names, sources):
+    # The same value goes into every position
+    for source in sources:
+        for value in source:
+            yield {name: value for name in names}
+
+def _pitchfork(names, sources):
+    # Walk all sources in lockstep, stopping at the shortest
+    for values in zip(*sources):
+        yield dict(zip(names, values))
+
+def _clusterbomb(names, sources, prefix=None):
+    # Nested loops rather than itertools.product, which would materialize
+    # every source in memory first
+    prefix = prefix or {}
+    if not sources:
+        yield dict(prefix)
+        return
+    for value in sources[0]:
+        prefix[names[0]] = value
+        yield from _clusterbomb(names[1:], sources[1:], prefix)
+    prefix.pop(names[0], None)
+
+def expand_payloads(payloads, attack=None, template_path=None):
+    """
+    Lazily yield one dict of payload values per request combination.
+
+    Args:
+        payloads (dict): The step's `payloads` mapping
+        attack (str, optional): batteringram (default), pitchfork or clusterbomb
+        template_path (str, optional): Used to resolve relative wordlist paths
+
+    Yields:
+        dict: Payload name -> value
+    """
+    if not payloads:
+        yield {}
+        return
+    attack = (attack or 'batteringram').lower()
+    if attack not in ATTACK_TYPES:
+        raise PayloadError(f"Unknown attack type: {attack}")
+
+    names = list(payloads)
+    sources = [payload_source(payloads[name], template_path) for name in names]
+    if attack == 'pitchfork':
+        yield from _pitchfork(names, sources)
+    elif attack == 'clusterbomb':
+        yield from _clusterbomb(names, sources)
+    else:
+        yield from _batteringram(names, sources)
+
+def count_combinations(payloads, attack=None, template_path=None):
+    """Number of combinations expand_payloads will yield, without expanding them"""
+    if not payloads:
+        return 1
+    attack = (attack or 'batteringram').lower()
+    sizes = [len(payload_source(source, template_path)) for source in payloads.values()]
+    if attack == 'pitchfork':
+        return min(sizes)
+    if attack == 'clusterbomb':
+        total = 1
+        for size in sizes:
+            total *= size
+        return total
+    return sum(sizes)
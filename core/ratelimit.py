@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INITIAL_RATE = 20.0
+MIN_RATE = 0.5
+MIN_CONCURRENCY = 1.0
+INITIAL_CONCURRENCY = 2
+# Healthy windows grow the rate by this factor (SLOW_START_GROWTH until the
+# first backoff); throttling multiplies window and rate by BACKOFF
+SLOW_START_GROWTH = 2.0
+RATE_GROWTH = 1.05
+BACKOFF = 0.5
+# Latency counts as degraded above TOLERANCE x baseline (and at least SLACK seconds over it)
+LATENCY_TOLERANCE = 2.0
+LATENCY_SLACK = 0.05
+EWMA_ALPHA = 0.2
+MAX_RETRY_AFTER = 300.0
+THROTTLE_STATUSES = frozenset((429, 503))
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        delay = float(value)
+    else:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        delay = (when - (now or datetime.now(timezone.utc))).total_seconds()
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+class HostLimiter:
+    """
+    Token bucket plus concurrency window for one host.
+
+    In adaptive mode both limits follow AIMD: each healthy response grows
+    the window by 1/window (one slot per round trip) and the rate by a few
+    percent per window, while throttling responses, errors and latency
+    well above the observed baseline halve both. Until the first backoff
+    the limits double every window instead (slow start), so a fast target
+    is reached quickly. A Retry-After header pauses the host entirely
+    until it expires.
+    """
+
+    def __init__(self, max_concurrency, initial_rate=DEFAULT_INITIAL_RATE, max_rate=None, adaptive=True):
+        """
+        Initialize the limiter
+
+        Args:
+            max_concurrency (int): Upper bound for requests in flight
+            initial_rate (float): Starting requests per second (adaptive mode)
+            max_rate (float, optional): Upper bound for requests per second
+            adaptive (bool): Adjust limits from responses; otherwise the
+                window stays at max_concurrency and the rate at max_rate
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_rate = max_rate
+        self.adaptive = adaptive
+        if adaptive:
+            # Start small and let healthy responses open the window up
+            self.window = float(min(INITIAL_CONCURRENCY, self.max_concurrency))
+            self.rate = min(initial_rate, max_rate) if max_rate else initial_rate
+        else:
+            self.window = float(self.max_concurrency)
+            self.rate = max_rate
+        self.tokens = 1.0
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.latency = None
+        self.baseline = None
+        self._slow_start = adaptive
+        self._last_backoff = 0.0
+        self._refilled = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        if self.rate:
+            # Allow a burst of up to one window's worth of requests
+            self.tokens = min(max(self.window, 1.0), self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def acquire(self):
+        """Block until a request may be sent to this host"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    timeout = self.paused_until - now
+                elif self.in_flight >= int(self.window):
+                    timeout = None
+                elif self.rate and self.tokens < 1.0:
+                    timeout = (1.0 - self.tokens) / self.rate
+                else:
+                    if self.rate:
+                        self.tokens -= 1.0
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout)
+
+    def release(self, status_code=None, latency=None, error=False, retry_after=None):
+        """
+        Return the slot taken by acquire() and feed the outcome back
+
+        Args:
+            status_code (int, optional): Response status
+            latency (float, optional): Seconds until the response headers arrived
+            error (bool): The request failed (timeout, connection error)
+            retry_after (float, optional): Seconds the server asked us to wait
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            if self.adaptive:
+                if error or status_code in THROTTLE_STATUSES:
+                    self._back_off(now)
+                elif latency is not None:
+                    self._observe(now, latency)
+            self._cond.notify_all()
+
+    def _observe(self, now, latency):
+        self.latency = latency if self.latency is None else (
+            EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency)
+        if self.baseline is None or self.latency < self.baseline:
+            self.baseline = self.latency
+        if self.latency > max(self.baseline * LATENCY_TOLERANCE, self.baseline + LATENCY_SLACK):
+            self._back_off(now)
+            return
+        step = 1.0 if self._slow_start else 1.0 / self.window
+        self.window = min(float(self.max_concurrency), self.window + step)
+        # Only grow the rate while it could still be the binding limit:
+        # past twice what the window can carry at this latency it is moot
+        ceiling = 2 * self.window / max(self.latency, 0.001)
+        if self.rate is not None and self.rate < ceiling:
+            growth = SLOW_START_GROWTH if self._slow_start else RATE_GROWTH
+            self.rate *= growth ** (1.0 / self.window)
+            if self.max_rate:
+                self.rate = min(self.rate, self.max_rate)
+
+    def _back_off(self, now):
+        # Responses to requests sent before the last backoff reflect the old
+        # limits; cutting again for each of them would collapse to the minimum
+        if now - self._last_backoff < max(self.latency or 0.0, 0.1):
+            return
+        self._last_backoff = now
+        self._slow_start = False
+        self.window = max(MIN_CONCURRENCY, self.window * BACKOFF)
+        if self.rate is not None:
+            self.rate = max(MIN_RATE, self.rate * BACKOFF)
+        # Let the baseline drift up so a permanently slower target is not
+        # treated as degraded forever
+        if self.baseline is not None and self.latency is not None:
+            self.baseline = (self.baseline + self.latency) / 2
+        logger.debug(f"Backing off: window {self.window:.1f}, rate {self.rate or 0:.1f}/s")
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'window': round(self.window, 2),
+                'rate': round(self.rate, 2) if self.rate else None,
+                'in_flight': self.in_flight,
+                'latency': round(self.latency, 4) if self.latency is not None else None,
+            }
+
+class RateController:
+    """
+    Per-host limiters shared by everything that sends requests in a process:
+    the scanner's HttpClient and the exploit modules.
+    """
+
+    def __init__(self, per_host, initial_rate=DEFAULT_INITIAL_RATE, max_rate=None, adaptive=True):
+        """
+        Initialize the controller
+
+        Args:
+            per_host (int): Maximum requests in flight per host
+            initial_rate (float): Starting requests per second per host
+            max_rate (float, optional): Requests per second cap per host
+            adaptive (bool): Adapt window and rate to each host's responses
+        """
+        self.per_host = per_host
+        self.initial_rate = initial_rate
+        self.max_rate = max_rate
+        self.adaptive = adaptive
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, key):
+        """Return the limiter for a scheme://host:port key"""
+        with self._lock:
+            limiter = self._hosts.get(key)
+            if limiter is None:
+                limiter = HostLimiter(self.per_host, self.initial_rate, self.max_rate, self.adaptive)
+                self._hosts[key] = limiter
+            return limiter
+
+    def snapshot(self):
+        """Current limits per host"""
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {key: limiter.snapshot() for key, limiter in hosts.items()}
@@ -0,0 +1,141 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Methods whose responses are shared between templates
+CACHEABLE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'TRACE'))
+# Rough per-entry bookkeeping cost added to the body and header sizes
+ENTRY_OVERHEAD = 512
+
+def normalize_url(url):
+    """Lowercase scheme and host, drop default ports and empty paths"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and not ((scheme == 'http' and parts.port == 80) or (scheme == 'https' and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+def request_key(method, url, headers=None, data=None, allow_redirects=False):
+    """Cache key for a request: everything that can change the response"""
+    header_items = tuple(sorted((k.lower(), str(v)) for k, v in (headers or {}).items()))
+    return (method.upper(), normalize_url(url), header_items, data, bool(allow_redirects))
+
+def _entry_size(response):
+    header_bytes = sum(len(k) + len(v) for k, v in response.header_list)
+    return len(response.content) + header_bytes + ENTRY_OVERHEAD
+
+def _usable(response, read_body):
+    """Whether a stored response can answer a request with this body policy"""
+    if response.body_read and not response.partial:
+        return True
+    # Only the head was kept; fine if this request can do without the body
+    return read_body is not None and not read_body(response)
+
+class ResponseCache:
+    """
+    Per-run cache of responses shared by all templates.
+
+    Entries are kept in LRU order and evicted once their combined size
+    passes ``max_bytes``. Identical requests that are already on the wire
+    are coalesced: later callers wait for the first one instead of sending
+    their own.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, methods=CACHEABLE_METHODS):
+        """
+        Initialize the response cache
+
+        Args:
+            max_bytes (int): Size budget for stored responses
+            methods (iterable): HTTP methods whose responses are cached
+        """
+        self.max_bytes = max_bytes
+        self.methods = frozenset(m.upper() for m in methods)
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def cacheable(self, method):
+        return method.upper() in self.methods
+
+    def fetch(self, key, send, read_body=None):
+        """
+        Return the response for key, calling send() only if no stored or
+        in-flight response can be used.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and _usable(entry, read_body):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                flight = self._in_flight.get(key)
+                owner = flight is None
+                if owner:
+                    flight = self._in_flight[key] = Future()
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+
+            if not owner:
+                response = flight.result()
+                if _usable(response, read_body):
+                    return response
+                # The shared response lacks the body this caller needs
+                continue
+
+            try:
+                response = send()
+            except BaseException as e:
+                flight.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+            self._store(key, response)
+            flight.set_result(response)
+            return response
+
+    def _store(self, key, response):
+        size = _entry_size(response)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= _entry_size(old)
+            self._entries[key] = response
+            self.size += size
+            while self.size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= _entry_size(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        """Counters for reporting"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
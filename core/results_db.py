@@ -0,0 +1,389 @@
+import gzip
+import io
+import json
+import logging
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_NAME = 'index.sqlite'
+SCHEMA_VERSION = 1
+# Rows are written in transactions of this many records
+INGEST_BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY,
+    template_id TEXT UNIQUE NOT NULL,
+    name TEXT,
+    severity TEXT,
+    tags TEXT
+);
+CREATE TABLE IF NOT EXISTS targets (
+    id INTEGER PRIMARY KEY,
+    url TEXT UNIQUE NOT NULL,
+    host TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    template_ref INTEGER NOT NULL REFERENCES templates(id),
+    target_ref INTEGER REFERENCES targets(id),
+    vulnerable INTEGER NOT NULL,
+    timestamp TEXT
+);
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    scan_id INTEGER NOT NULL REFERENCES scans(id),
+    url TEXT,
+    method TEXT,
+    status_code INTEGER,
+    details TEXT
+);
+CREATE TABLE IF NOT EXISTS extracted (
+    finding_id INTEGER NOT NULL REFERENCES findings(id),
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS scans_template ON scans(template_ref, timestamp);
+CREATE INDEX IF NOT EXISTS scans_target ON scans(target_ref, timestamp);
+CREATE INDEX IF NOT EXISTS scans_timestamp ON scans(timestamp);
+CREATE INDEX IF NOT EXISTS scans_source ON scans(source_id);
+CREATE INDEX IF NOT EXISTS templates_severity ON templates(severity);
+CREATE INDEX IF NOT EXISTS targets_host ON targets(host);
+CREATE INDEX IF NOT EXISTS findings_scan ON findings(scan_id);
+CREATE INDEX IF NOT EXISTS extracted_finding ON extracted(finding_id);
+"""
+
+# Columns --count-by can group on
+GROUP_COLUMNS = {
+    'template': 't.template_id',
+    'host': 'g.host',
+    'target': 'g.url',
+    'severity': 't.severity',
+    'day': 'substr(s.timestamp, 1, 10)',
+}
+
+RELATIVE_TIME_RE = re.compile(r'^(\d+)([mhdw])$')
+RELATIVE_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+class ResultsDbError(Exception):
+    """Custom exception for results index errors"""
+    pass
+
+def parse_time(value, now=None):
+    """
+    Turn an ISO date/time or a relative age such as '7d' or '12h' into the
+    ISO timestamp format results are stored with
+    """
+    if not value:
+        return None
+    match = RELATIVE_TIME_RE.match(value.strip().lower())
+    if match:
+        delta = timedelta(**{RELATIVE_UNITS[match.group(2)]: int(match.group(1))})
+        return ((now or datetime.now()) - delta).isoformat()
+    try:
+        return datetime.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        raise ResultsDbError(f"Invalid time: {value} (use an ISO date or e.g. 7d, 12h)")
+
+def _scan_target(scan):
+    """Target of a scan; older result files only carry it per request"""
+    target = scan.get('target')
+    if not target and scan.get('results'):
+        target = scan['results'][0].get('target_url')
+    return target
+
+def _host(url):
+    parts = urlsplit(url if '://' in url else f"//{url}")
+    return (parts.netloc or url).lower()
+
+def _is_compressed(path):
+    return path.suffix in ('.gz', '.zst')
+
+def _open_text(path):
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.suffix == '.zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise ResultsDbError(f"Reading {path} requires the zstandard package")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True),
+                                encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+class ResultsIndex:
+    """
+    SQLite index over saved scan results.
+
+    Ingestion is incremental: per-scan JSON files are indexed once and only
+    re-read when their size or mtime changes, and JSONL run files resume
+    from the last complete line read (plain files by byte offset,
+    compressed ones by record count).
+    """
+
+    def __init__(self, db_path):
+        """
+        Open or create the index
+
+        Args:
+            db_path (str): SQLite database file
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=OFF')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise ResultsDbError(f"Unsupported results index version {version} in {db_path}")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self._template_refs = {}
+        self._target_refs = {}
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _template_ref(self, scan):
+        template_id = scan.get('template_id') or 'unknown'
+        ref = self._template_refs.get(template_id)
+        if ref is None:
+            tags = scan.get('tags', '')
+            if isinstance(tags, (list, tuple)):
+                tags = ','.join(tags)
+            self.conn.execute(
+                'INSERT OR IGNORE INTO templates (template_id, name, severity, tags) VALUES (?, ?, ?, ?)',
+                (template_id, scan.get('template_name', ''), str(scan.get('severity', '')).lower(), tags),
+            )
+            ref = self.conn.execute('SELECT id FROM templates WHERE template_id = ?', (template_id,)).fetchone()[0]
+            self._template_refs[template_id] = ref
+        return ref
+
+    def _target_ref(self, url):
+        if not url:
+            return None
+        ref = self._target_refs.get(url)
+        if ref is None:
+            self.conn.execute('INSERT OR IGNORE INTO targets (url, host) VALUES (?, ?)', (url, _host(url)))
+            ref = self.conn.execute('SELECT id FROM targets WHERE url = ?', (url,)).fetchone()[0]
+            self._target_refs[url] = ref
+        return ref
+
+    def _add_record(self, source_id, record):
+        scan = record.get('scan')
+        if not isinstance(scan, dict):
+            return False
+        cursor = self.conn.execute(
+            'INSERT INTO scans (source_id, template_ref, target_ref, vulnerable, timestamp) VALUES (?, ?, ?, ?, ?)',
+            (source_id, self._template_ref(scan), self._target_ref(_scan_target(scan)),
+             int(bool(scan.get('vulnerable'))), record.get('timestamp')),
+        )
+        scan_id = cursor.lastrowid
+        for result in scan.get('results', []):
+            if not result.get('vulnerable'):
+                continue
+            cursor = self.conn.execute(
+                'INSERT INTO findings (scan_id, url, method, status_code, details) VALUES (?, ?, ?, ?, ?)',
+                (scan_id, result.get('target_url'), result.get('method'), result.get('status_code'),
+                 json.dumps(result.get('match_details', []))),
+            )
+            values = result.get('extracted_data') or []
+            if values:
+                self.conn.executemany(
+                    'INSERT INTO extracted (finding_id, value) VALUES (?, ?)',
+                    [(cursor.lastrowid, str(value)) for value in values],
+                )
+        return True
+
+    def _forget(self, source_id):
+        """Drop everything indexed from a source before re-reading it"""
+        scans = 'SELECT id FROM scans WHERE source_id = ?'
+        findings = f'SELECT id FROM findings WHERE scan_id IN ({scans})'
+        self.conn.execute(f'DELETE FROM extracted WHERE finding_id IN ({findings})', (source_id,))
+        self.conn.execute(f'DELETE FROM findings WHERE scan_id IN ({scans})', (source_id,))
+        self.conn.execute('DELETE FROM scans WHERE source_id = ?', (source_id,))
+
+    def _source(self, path, stat):
+        """Return (source id, resume position), or None if path is up to date"""
+        row = self.conn.execute('SELECT id, size, mtime_ns, position FROM sources WHERE path = ?',
+                                (str(path),)).fetchone()
+        if row is None:
+            cursor = self.conn.execute('INSERT INTO sources (path, size, mtime_ns) VALUES (?, ?, ?)',
+                                       (str(path), stat.st_size, stat.st_mtime_ns))
+            return cursor.lastrowid, 0
+        if row['size'] == stat.st_size and row['mtime_ns'] == stat.st_mtime_ns:
+            return None
+        if path.name.endswith('.json') or stat.st_size < row['size']:
+            # Rewritten rather than appended to
+            self._forget(row['id'])
+            return row['id'], 0
+        return row['id'], row['position']
+
+    def _ingest_json(self, path, source_id):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable result file {path}: {str(e)}")
+            return 0, 0
+        return int(self._add_record(source_id, record)), 0
+
+    def _ingest_jsonl(self, path, source_id, position):
+        """Read complete lines after position. Returns (records, new position)"""
+        added = 0
+        if _is_compressed(path):
+            # Compressed streams cannot seek: skip the records already read
+            consumed = 0
+            try:
+                with _open_text(path) as f:
+                    for line in f:
+                        if not line.endswith('\n'):
+                            break
+                        consumed += 1
+                        if consumed > position:
+                            added += self._add_line(source_id, line, path)
+            except (EOFError, OSError) as e:
+                # Still being written by a running scan
+                logger.debug(f"Stopped reading {path}: {str(e)}")
+            return added, max(consumed, position)
+
+        with open(path, 'rb') as f:
+            f.seek(position)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                position += len(line)
+                added += self._add_line(source_id, line, path)
+        return added, position
+
+    def _add_line(self, source_id, line, path):
+        try:
+            return int(self._add_record(source_id, json.loads(line)))
+        except ValueError as e:
+            logger.warning(f"Skipping malformed line in {path}: {str(e)}")
+            return 0
+
+    def ingest(self, results_dir='results'):
+        """
+        Index new and changed result files below results_dir
+
+        Returns:
+            int: Number of scan records added
+        """
+        total = pending = 0
+        results_dir = Path(results_dir)
+        if not results_dir.is_dir():
+            return 0
+        paths = sorted(p for p in results_dir.rglob('*')
+                       if p.is_file() and (p.name.endswith('.json') or '.jsonl' in p.name))
+        with self.conn:
+            for path in paths:
+                stat = path.stat()
+                source = self._source(path, stat)
+                if source is None:
+                    continue
+                source_id, position = source
+                if path.name.endswith('.json'):
+                    added, position = self._ingest_json(path, source_id)
+                else:
+                    added, position = self._ingest_jsonl(path, source_id, position)
+                self.conn.execute('UPDATE sources SET size = ?, mtime_ns = ?, position = ? WHERE id = ?',
+                                  (stat.st_size, stat.st_mtime_ns, position, source_id))
+                total += added
+                pending += added
+                if pending >= INGEST_BATCH_SIZE:
+                    self.conn.commit()
+                    pending = 0
+        if total:
+            logger.info(f"Indexed {total} scan results from {results_dir}")
+        return total
+
+    def _where(self, template=None, host=None, severity=None, since=None, until=None, vulnerable=True):
+        clauses, params = [], []
+        for column, values in (('t.template_id', template), ('g.host', host), ('t.severity', severity)):
+            if values:
+                values = [v.lower() if column != 't.template_id' else v for v in values]
+                clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+        if since:
+            clauses.append('s.timestamp >= ?')
+            params.append(since)
+        if until:
+            clauses.append('s.timestamp < ?')
+            params.append(until)
+        if vulnerable:
+            clauses.append('s.vulnerable = 1')
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    _FROM = (' FROM scans s JOIN templates t ON t.id = s.template_ref'
+             ' LEFT JOIN targets g ON g.id = s.target_ref')
+
+    def query(self, limit=100, **filters):
+        """
+        Matching scans, newest first
+
+        Args:
+            limit (int): Maximum rows returned
+            **filters: template, host and severity (lists), since and until
+                (ISO timestamps), vulnerable (bool, default True)
+
+        Returns:
+            list: sqlite3.Row objects with scan_id, timestamp, template_id,
+                severity, target, host and vulnerable
+        """
+        where, params = self._where(**filters)
+        sql = ('SELECT s.id AS scan_id, s.timestamp, t.template_id, t.severity, g.url AS target,'
+               ' g.host, s.vulnerable' + self._FROM + where +
+               ' ORDER BY s.timestamp DESC LIMIT ?')
+        return self.conn.execute(sql, params + [limit]).fetchall()
+
+    def count_by(self, group, **filters):
+        """
+        Number of matching scans per template, host, target, severity or day
+
+        Returns:
+            list: (key, count) tuples, largest first
+        """
+        if group not in GROUP_COLUMNS:
+            raise ResultsDbError(f"Cannot group by {group}")
+        where, params = self._where(**filters)
+        sql = (f'SELECT {GROUP_COLUMNS[group]} AS key, COUNT(*) AS count' + self._FROM + where +
+               ' GROUP BY key ORDER BY count DESC, key')
+        return [tuple(row) for row in self.conn.execute(sql, params)]
+
+    def findings(self, scan_id):
+        """Matched requests of one scan with their extracted data"""
+        rows = self.conn.execute(
+            'SELECT id, url, method, status_code, details FROM findings WHERE scan_id = ?', (scan_id,)
+        ).fetchall()
+        findings = []
+        for row in rows:
+            values = [r[0] for r in self.conn.execute('SELECT value FROM extracted WHERE finding_id = ?', (row['id'],))]
+            findings.append({
+                'url': row['url'],
+                'method': row['method'],
+                'status_code': row['status_code'],
+                'match_details': json.loads(row['details'] or '[]'),
+                'extracted_data': values,
+            })
+        return findings
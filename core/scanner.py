@@ -1,39 +1,90 @@
 import logging
-import requests
 import re
-import json
-from urllib.parse import urljoin, urlparse, parse_qs, urlencode
-from typing import Dict, Any, List, Tuple
-from py_mini_racer import MiniRacer
+import time
+from itertools import islice
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode, quote
+from core.http_client import HttpClient
+from core.dsl import evaluate_variables, render
+from core.findings import Finding, FindingLog
+from core.matchers import PLACEHOLDER_RE, PartCache, compile_matcher
+from core.payloads import expand_payloads
+from core.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
-def execute_javascript(template, response):
+class ScanResult:
+    """Outcome of running one template against one target"""
+
+    def __init__(self, template, target_url):
+        self.template_id = template.id
+        self.info = template.info
+        self.target_url = target_url
+        self.results = FindingLog()
+
+    @property
+    def vulnerable(self):
+        return bool(self.results)
+
+    def meta(self):
+        """Template fields repeated in every serialized finding"""
+        return {
+            'template_id': self.template_id,
+            'template_name': self.info.get('name', ''),
+            'author': self.info.get('author', ''),
+            'description': self.info.get('description', ''),
+            'severity': self.info.get('severity', ''),
+            'references': self.info.get('reference', []),
+            'tags': self.info.get('tags', ''),
+        }
+
+    def to_dict(self):
+        """Serializable form, as written by ResultLogger"""
+        meta = self.meta()
+        return {
+            **meta,
+            'target': self.target_url,
+            'vulnerable': self.vulnerable,
+            'results': [{**meta, **finding.to_dict()} for finding in self.results],
+        }
+
+    def to_partial(self):
+        """
+        The findings without the template fields, for the parts of a split
+        scan to be merged again (see add_partial)
+        """
+        return {'vulnerable': self.vulnerable, 'results': [finding.to_dict() for finding in self.results]}
+
+    def add_partial(self, partial):
+        """Append the findings of another part of the same scan, from to_partial() or to_dict()"""
+        for data in partial['results']:
+            self.results.append(Finding.from_dict(data))
+
+    def close(self):
+        """Release the findings, including any spilled to disk"""
+        self.results.close()
+
+def execute_javascript(template, response, pool=None):
     """Execute JavaScript code from template against response."""
     if not template.javascript:
         return None
-        
+
     try:
         # Get raw headers as string
-        raw_headers = "\r\n".join(f"{k}: {v}" for k, v in response.headers.items())
-        
-        # Create V8 context
-        ctx = MiniRacer()
-        
-        # Prepare JavaScript code with headers
-        js_code = f"""
-        var template = {{ http_all_headers: {json.dumps(raw_headers)} }};
-        {template.javascript[0]["code"]}
-        """
-        
-        # Execute the JavaScript code
-        cookie_names = ctx.eval(js_code)
-        
-        # Apply extractors if any
+        raw_headers = response.raw_headers
+        if pool is None:
+            # V8 is only loaded once a template with javascript runs
+            from core.javascript import get_pool
+            pool = get_pool()
+
         findings = []
-        if template.extractors:
+        for step in template.javascript:
+            # Run the step in a pooled V8 context
+            with metrics.timer("javascript_seconds", template=template.id):
+                cookie_names = pool.call(step["code"], {"http_all_headers": raw_headers}) or []
+
+            # Apply the step's extractors, falling back to template-level ones
             for cookie in cookie_names:
-                for extractor in template.extractors:
+                for extractor in step.get("extractors") or template.extractors:
                     if extractor["type"] == "regex":
                         for pattern in extractor["regex"]:
                             if re.match(pattern, cookie):
@@ -42,55 +93,314 @@ def execute_javascript(template, response):
                                     "cookie_name": cookie,
                                     "pattern": pattern
                                 })
-        
+
         return findings
     except Exception as e:
         logging.error(f"Error executing JavaScript: {str(e)}")
         return None
 
-def match_response(response, matcher):
+def base_variables(target_url):
+    """Variables every template can reference, derived from the target URL."""
+    parts = urlsplit(target_url)
+    return {
+        "BaseURL": target_url.rstrip("/"),
+        "RootURL": f"{parts.scheme}://{parts.netloc}",
+        "Hostname": parts.netloc,
+        "Host": parts.hostname or "",
+        "Port": parts.port or (443 if parts.scheme == "https" else 80),
+        "Path": parts.path,
+        "Scheme": parts.scheme,
+    }
+
+def match_response(response, matcher, variables=None):
     """Match response against the given matcher."""
-    if matcher["type"] == "word":
-        return any(word in response.text for word in matcher["words"])
-    elif matcher["type"] == "status":
-        return response.status_code in matcher["status"]
-    elif matcher["type"] == "regex":
-        return any(re.search(pattern, response.text) for pattern in matcher["regex"])
-    return False
-
-def run_scan(target_url: str, template: Dict[str, Any]) -> Dict[str, Any]:
-    """Run a scan using the provided template."""
-    results = []
-    
+    return compile_matcher(matcher).match(PartCache(response), variables)
+
+# Characters left unescaped when a payload is placed into a URL path
+PATH_SAFE = "/:@!$&'()*+,;="
+
+def _mutate(original, value, fuzz_type):
+    if fuzz_type == "prefix":
+        return value + original
+    if fuzz_type == "replace":
+        return value
+    if fuzz_type == "infix":
+        middle = len(original) // 2
+        return original[:middle] + value + original[middle:]
+    return original + value
+
+def _apply_fuzz(url, rule, value):
+    """Return the URLs produced by applying one fuzz value to one rule's part."""
+    parts = urlsplit(url)
+    fuzz_type = rule.get("type", "postfix")
+    part = rule.get("part", "query")
+
+    if part == "path":
+        path = _mutate(parts.path or "/", quote(value, safe=PATH_SAFE), fuzz_type)
+        return [urlunsplit(parts._replace(path=path))]
+    if part == "query":
+        # Targets without parameters get a single generic one to inject into
+        params = parse_qsl(parts.query, keep_blank_values=True) or [("q", "")]
+        if rule.get("mode", "single") == "multiple":
+            fuzzed = [[(k, _mutate(v, value, fuzz_type)) for k, v in params]]
+        else:
+            fuzzed = [
+                [(k, _mutate(v, value, fuzz_type) if i == target else v) for i, (k, v) in enumerate(params)]
+                for target in range(len(params))
+            ]
+        return [urlunsplit(parts._replace(query=urlencode(query))) for query in fuzzed]
+    if part == "request":
+        return [url + quote(value, safe=PATH_SAFE)]
+
+    logger.debug(f"Unsupported fuzzing part: {part}")
+    return [url]
+
+def _fuzz_groups(rules):
+    """
+    Group fuzzing rules by the payloads they reference.
+
+    Rules fed by the same payloads are alternative injection points and
+    produce separate requests; groups fed by different payloads are
+    combined into the same request (e.g. a path plus an injection).
+    """
+    groups = {}
+    for rule in rules or []:
+        names = frozenset(name for fuzz in rule.get("fuzz", []) for name in PLACEHOLDER_RE.findall(fuzz))
+        groups.setdefault(names, []).append(rule)
+    return list(groups.values())
+
+def _fuzz_urls(url, groups, context):
+    urls = [url]
+    for group in groups:
+        fuzzed = []
+        for rule in group:
+            for fuzz in rule.get("fuzz", []):
+                value = render(fuzz, context)
+                for base in urls:
+                    fuzzed.extend(_apply_fuzz(base, rule, value))
+        urls = fuzzed
+    return urls
+
+def _body_policy(compiled_step, variables, url=None, profile=None):
+    """
+    Bind a step's header-only body decision to one request's variables.
+
+    With a baseline ``profile`` whose target has a soft-404 page, bodies
+    that could be that page are read too, so is_soft_404 can tell.
+    """
+    if profile is not None and profile.signatures:
+        return lambda head: profile.needs_body(url, head) or compiled_step.body_needed(head, variables)
+    return lambda head: compiled_step.body_needed(head, variables)
+
+def _response_length(response):
+    """
+    Body size of a response, or None when it is not known
+
+    Bodies that were skipped, cut at the size limit or left partly unread
+    only have the length the server announced in Content-Length.
+    """
+    if response.body_read and not response.truncated and not response.partial:
+        return len(response.content)
+    length = response.headers.get("Content-Length", "").strip()
+    return int(length) if length.isdigit() else None
+
+def _target_context(target_url, profile=None):
+    variables = base_variables(target_url)
+    if profile is not None:
+        variables.update(profile.variables())
+    return variables
+
+def template_variables(target_url, template, profile=None):
+    """
+    Evaluate a template's ``variables`` for one target, as build_requests
+    does, e.g. to give every part of a split scan the same random values.
+    """
+    return evaluate_variables(template.variables, _target_context(target_url, profile))
+
+def build_requests(target_url, template, steps=None, stopped=None, payloads=None, profile=None,
+                   fixed_variables=None):
+    """
+    Lazily expand http steps of a template into concrete request specs.
+
+    Specs are produced in template order, so evaluating responses in the
+    same order keeps matching deterministic. ``steps`` optionally restricts
+    expansion to the given step indexes and ``payloads`` to a (start, end)
+    range of payload indexes; once a step index is added to the
+    ``stopped`` set no further specs are generated for it.
+
+    Template variables are evaluated once per call, so a random value is
+    the same in every request and in the matchers checking its response.
+    Requests failing the step's pre-conditions are not generated; with a
+    baseline ``profile`` of the target, pre-conditions can also test what
+    it found (see TargetProfile.variables). ``fixed_variables`` replace
+    the values of template variables of the same name, e.g. with the ones
+    other parts of the same scan use (see template_variables) or the random
+    values a recorded scan used.
+    """
+    variables = _target_context(target_url, profile)
+    values = evaluate_variables(template.variables, variables)
+    if fixed_variables:
+        values.update((name, value) for name, value in fixed_variables.items() if name in values)
+    variables.update(values)
+    soft_404 = profile is not None and bool(profile.signatures)
+    for index, step in enumerate(template.http_steps):
+        if steps is not None and index not in steps:
+            continue
+        method = step.get("method", "GET")
+        paths = step.get("path") or ["{{BaseURL}}"]
+        groups = _fuzz_groups(step.get("fuzzing"))
+        headers = step.get("headers", {})
+        compiled_step = template.compiled_steps[index]
+        step_context = {**variables, "method": method}
+        # Pre-conditions that do not read payloads are settled once per step
+        per_request = not compiled_step.precondition_names.isdisjoint(step.get("payloads") or {})
+        if not per_request and not compiled_step.allows(step_context):
+            continue
+        combinations = enumerate(expand_payloads(step.get("payloads"), step.get("attack"), template.path))
+        if payloads is not None:
+            combinations = islice(combinations, *payloads)
+        for payload_index, values in combinations:
+            if stopped is not None and index in stopped:
+                break
+            # Payload values may themselves hold placeholders, e.g. {{first}}
+            values = {name: render(value, variables) if isinstance(value, str) else value
+                      for name, value in values.items()}
+            context = {**step_context, **values}
+            if per_request and not compiled_step.allows(context):
+                continue
+            for path in paths:
+                base = urljoin(target_url, render(path, context))
+                for url in _fuzz_urls(base, groups, context):
+                    yield {
+                        "step": index,
+                        "payload_index": payload_index,
+                        "method": method,
+                        "url": url,
+                        "headers": {k: render(str(v), context) for k, v in headers.items()},
+                        "data": render(step["body"], context) if step.get("body") else None,
+                        "allow_redirects": bool(step.get("host-redirects") or step.get("redirects")),
+                        "variables": context,
+                        "read_body": _body_policy(compiled_step, context, url, profile),
+                        # A body cut short once the words were seen cannot be
+                        # compared with the soft-404 page
+                        "watch": None if soft_404 else compiled_step.body_watcher,
+                    }
+
+def run_scan(target_url: str, template, client: HttpClient = None, steps=None, payloads=None,
+             validators=None, profile=None, variables=None) -> ScanResult:
+    """
+    Run a scan using the provided template.
+
+    Requests are sent concurrently through ``client`` (a temporary one is
+    created if none is given) while responses are matched in template order.
+    ``steps`` limits the scan to a subset of the template's http step indexes
+    and ``payloads`` to a (start, end) range of their payload indexes.
+    A scan split up that way should pass every part the same template
+    ``variables`` (see template_variables), or each evaluates its own.
+
+    With ``validators`` (a ValidatorStore), requests answered last run with
+    an ETag or Last-Modified are sent conditionally and a 304 reuses the
+    previous outcome instead of matching again. Templates running
+    javascript always get full responses.
+
+    With a baseline ``profile`` (a TargetProfile), responses to probed
+    paths that are just the target's soft-404 page are dropped unmatched.
+
+    A client recording to an archive also records the scan and the values
+    its template variables took; a ReplayClient's scan reuses those values,
+    so requests carrying random values match the recorded ones.
+    """
+    scan_result = ScanResult(template, target_url)
+    started = time.perf_counter()
+    own_client = client is None
+    client = client or HttpClient()
+    stopped_steps = set()
+    archive = getattr(client, "archive", None)
+    used_variables = None
+
     try:
-        # Handle HTTP requests
-        if "http" in template:
-            for http_req in template["http"]:
-                method = http_req.get("method", "GET")
-                paths = http_req.get("path", [])
-                
-                for path in paths:
-                    url = urljoin(target_url, path)
-                    response = requests.request(method, url)
-                    
-                    # Execute JavaScript if present
-                    if "javascript" in template:
-                        js_findings = execute_javascript(template, response)
-                        if js_findings:
-                            results.extend(js_findings)
-                    
-                    # Check matchers
-                    if "matchers" in http_req:
-                        for matcher in http_req["matchers"]:
-                            if match_response(response, matcher):
-                                results.append({
-                                    "template_id": template["id"],
-                                    "url": url,
-                                    "status": response.status_code,
-                                    "matcher": matcher
-                                })
-                                
+        step_count = len(steps) if steps is not None else len(template.http_steps)
+        fixed = variables
+        if archive is not None and not archive.recording:
+            fixed = archive.variables(target_url, template.id)
+        specs = build_requests(target_url, template, steps, stopped=stopped_steps, payloads=payloads,
+                               profile=profile, fixed_variables=fixed)
+        if template.javascript:
+            validators = None
+        if validators is not None:
+            specs = validators.conditional(template, specs)
+        stopped = lambda spec: spec["step"] in stopped_steps
+        for spec, response, error in client.map(specs, skip=stopped):
+            step_index = spec["step"]
+            if step_index in stopped_steps:
+                continue
+            step = template.http_steps[step_index]
+            if used_variables is None:
+                used_variables = {name: spec["variables"].get(name) for name in template.variables}
+
+            if error is not None:
+                logger.debug(f"Request to {spec['url']} failed: {error}")
+                continue
+
+            # Execute JavaScript if present
+            if template.javascript:
+                js_findings = execute_javascript(template, response)
+                for finding in js_findings or []:
+                    scan_result.results.append(Finding(
+                        spec["url"],
+                        spec["method"],
+                        response.status_code,
+                        [f"Matched javascript pattern {finding['pattern']}"],
+                        [finding["cookie_name"]],
+                        transport=response.transport,
+                    ))
+
+            metrics.observe("template_request_seconds", response.elapsed, template=template.id)
+            if validators is not None and validators.unchanged_response(spec, response):
+                # Same response as last run, so the same outcome
+                finding = spec["previous"].finding
+            elif profile is not None and profile.is_soft_404(spec["url"], response):
+                metrics.inc("soft_404_total", template=template.id)
+                finding = None
+            else:
+                compiled_step = template.compiled_steps[step_index]
+                with metrics.timer("match_seconds", template=template.id):
+                    matched, details, parts = compiled_step.evaluate(response, spec["variables"])
+                    extracted = compiled_step.extract(parts) if matched else None
+                finding = None
+                if matched:
+                    finding = Finding(
+                        spec["url"],
+                        spec["method"],
+                        response.status_code,
+                        details,
+                        extracted,
+                        _response_length(response),
+                        # Only kept when something in the step looks at headers
+                        dict(response.headers) if compiled_step.needs_headers else None,
+                        response.transport,
+                    )
+            if validators is not None:
+                validators.record(template, spec, response, finding)
+            if finding is not None:
+                scan_result.results.append(finding)
+                if step.get("stop-at-first-match"):
+                    stopped_steps.add(step_index)
+                    if len(stopped_steps) == step_count:
+                        break
+
     except Exception as e:
         logging.error(f"Error during scan: {str(e)}")
-        
-    return results
+    finally:
+        if own_client:
+            client.close()
+        if validators is not None:
+            validators.flush()
+        if archive is not None and archive.recording:
+            archive.record_scan(target_url, template.id, used_variables)
+            archive.flush()
+
+    metrics.inc("scans_total", template=template.id)
+    metrics.inc("findings_total", len(scan_result.results), template=template.id)
+    metrics.observe("scan_seconds", time.perf_counter() - started, template=template.id)
+    return scan_result
@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import pickle
+from pathlib import Path
+
+from core.loader import TemplateError, parse_template, template_digest
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 4
+DEFAULT_CACHE_DIR = Path('.cache')
+
+class CacheEntry:
+    """Parsed template plus the file identity it was parsed from"""
+
+    __slots__ = ('mtime_ns', 'size', 'digest', 'template', 'error')
+
+    def __init__(self, mtime_ns, size, digest, template=None, error=None):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.template = template
+        self.error = error
+
+    def __getstate__(self):
+        return (self.mtime_ns, self.size, self.digest, self.template, self.error)
+
+    def __setstate__(self, state):
+        self.mtime_ns, self.size, self.digest, self.template, self.error = state
+
+class TemplateIndex:
+    """Templates indexed by id, tag and severity"""
+
+    def __init__(self, templates):
+        self.templates = sorted(templates, key=lambda t: t.path)
+        self.by_id = {}
+        self.by_tag = {}
+        self.by_severity = {}
+        for template in self.templates:
+            self.by_id[template.id] = template
+            for tag in template.tags:
+                self.by_tag.setdefault(tag.lower(), []).append(template)
+            severity = str(template.info.get('severity', '')).lower()
+            self.by_severity.setdefault(severity, []).append(template)
+
+    def select(self, tags=None, severity=None, ids=None):
+        """
+        Return templates matching any of the tags, any of the severities and
+        any of the ids. Omitted filters match everything.
+        """
+        selected = None
+        for index, keys in ((self.by_tag, tags), (self.by_severity, severity)):
+            if not keys:
+                continue
+            paths = {t.path for key in keys for t in index.get(key.strip().lower(), [])}
+            selected = paths if selected is None else selected & paths
+        if ids:
+            paths = {self.by_id[i].path for i in ids if i in self.by_id}
+            selected = paths if selected is None else selected & paths
+        if selected is None:
+            return list(self.templates)
+        return [t for t in self.templates if t.path in selected]
+
+class TemplateCache:
+    """
+    On-disk cache of parsed templates for one template directory.
+
+    Entries are keyed by path and revalidated by mtime and size; when those
+    changed, the content hash decides whether the file needs parsing again.
+    The cache and its index are stored with pickle and rewritten atomically
+    only when something changed.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        """
+        Initialize the template cache
+
+        Args:
+            cache_dir (str): Directory holding cache files
+        """
+        self.cache_dir = Path(cache_dir)
+
+    def _cache_file(self, template_dir):
+        key = hashlib.sha1(str(Path(template_dir).resolve()).encode()).hexdigest()[:12]
+        return self.cache_dir / f"templates-{key}.pickle"
+
+    def _read(self, cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') == CACHE_VERSION:
+                return data
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable template cache {cache_file}: {str(e)}")
+        return {'version': CACHE_VERSION, 'entries': {}, 'index': None}
+
+    def _write(self, cache_file, data):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix('.tmp')
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.warning(f"Could not write template cache {cache_file}: {str(e)}")
+
+    def _scan(self, template_dir):
+        """Yield (path, stat) for every template file below template_dir"""
+        for root, dirs, files in os.walk(template_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.yaml'):
+                    path = os.path.join(root, name)
+                    yield path, os.stat(path)
+
+    def _refresh(self, path, stat, entry):
+        """Return an up-to-date entry for path and whether it changed"""
+        if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            return entry, False
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = template_digest(content)
+        if entry and entry.digest == digest:
+            # Touched but unchanged: keep the parsed template
+            return CacheEntry(stat.st_mtime_ns, stat.st_size, digest, entry.template, entry.error), True
+
+        try:
+            template = parse_template(content, path)
+            return CacheEntry(stat.st_mtime_ns, stat.st_size, digest, template), True
+        except TemplateError as e:
+            return CacheEntry(stat.st_mtime_ns, stat.st_size, digest, error=str(e)), True
+
+    def load(self, template_dir="templates"):
+        """
+        Load all templates below template_dir, parsing only changed files.
+
+        Returns:
+            TemplateIndex: Index over the valid templates
+        """
+        cache_file = self._cache_file(template_dir)
+        data = self._read(cache_file)
+        old_entries = data['entries']
+        entries = {}
+        dirty = False
+
+        for path, stat in self._scan(template_dir):
+            entry, changed = self._refresh(path, stat, old_entries.get(path))
+            entries[path] = entry
+            dirty = dirty or changed
+            if entry.error:
+                logger.error(f"Error loading template {path}: {entry.error}")
+
+        dirty = dirty or len(entries) != len(old_entries)
+        index = data.get('index')
+        if dirty or index is None:
+            index = TemplateIndex(e.template for e in entries.values() if e.template)
+            self._write(cache_file, {'version': CACHE_VERSION, 'entries': entries, 'index': index})
+        return index
+
+    def clear(self, template_dir="templates"):
+        """Remove the cache file for template_dir"""
+        try:
+            self._cache_file(template_dir).unlink()
+        except FileNotFoundError:
+            pass
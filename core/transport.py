@@ -0,0 +1,733 @@
+import importlib.util
+import logging
+import select
+import socket
+import ssl
+import threading
+import time
+import zlib
+from collections import deque
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTS = ('auto', 'pooled', 'http2', 'pipeline')
+DEFAULT_TRANSPORT = 'auto'
+# Most requests written ahead of their responses on one pipelined connection
+DEFAULT_PIPELINE_DEPTH = 32
+# Pipeline depth for a host until its timings are known
+INITIAL_PIPELINE_DEPTH = 4
+# Waiting this long behind other requests is preferred to another connection
+QUEUE_ALLOWANCE = 0.01
+EWMA_ALPHA = 0.2
+# Only requests that are safe to send twice go over a pipeline, since a
+# connection lost mid-pipeline means re-sending what it had not answered
+PIPELINE_METHODS = frozenset(('GET', 'HEAD'))
+PIPELINE_ATTEMPTS = 3
+# Unread pipelined bodies up to this size are read and dropped so the
+# responses behind them stay readable; longer ones cost the connection
+PIPELINE_DRAIN_LIMIT = 256 * 1024
+MAX_LINE = 65536
+MAX_HEADERS = 200
+READ_SIZE = 64 * 1024
+NO_BODY_STATUSES = frozenset((204, 304))
+
+# Names reported per result for the way a response arrived
+HTTP2 = 'h2'
+HTTP11 = 'http/1.1'
+HTTP11_PIPELINED = 'http/1.1-pipelined'
+HTTP10 = 'http/1.0'
+
+
+class TransportError(Exception):
+    """Custom exception for transport-related errors"""
+    pass
+
+
+class _ConnectionLost(Exception):
+    """A pipelined connection went away before answering a request"""
+    pass
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    port = parts.port or (443 if scheme == 'https' else 80)
+    return scheme, (parts.hostname or '').lower(), port
+
+
+def _load_httpx():
+    """httpx with its HTTP/2 support, or None when either is missing"""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    # httpx only negotiates HTTP/2 when h2 is installed; it imports h2 itself
+    if importlib.util.find_spec('h2') is None:
+        return None
+    return httpx
+
+
+class _PooledResponse:
+    """A streamed requests response, in the shape HttpClient reads"""
+
+    def __init__(self, response):
+        self._response = response
+        self.url = response.url
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.header_list = list(response.raw.headers.iteritems())
+        self.encoding = response.encoding
+        self.elapsed = response.elapsed.total_seconds()
+        self.protocol = HTTP10 if getattr(response.raw, 'version', 11) == 10 else HTTP11
+
+    def iter_content(self, chunk_size):
+        return self._response.iter_content(chunk_size=chunk_size)
+
+    def discard(self, drain_limit):
+        # Draining a short body keeps the connection reusable; closing a long
+        # one is cheaper than downloading it
+        length = self.headers.get('Content-Length', '')
+        if length.isdigit() and int(length) <= drain_limit:
+            try:
+                self._response.raw.drain_conn()
+                self._response.raw.release_conn()
+            except Exception:
+                pass
+
+    def close(self):
+        self._response.close()
+
+
+class PooledTransport:
+    """HTTP/1.1 over a requests session with a keep-alive connection pool"""
+
+    def __init__(self, timeout, verify, pool_connections, pool_maxsize, headers=None, adapter_class=HTTPAdapter):
+        self.timeout = timeout
+        self.verify = verify
+        self.session = requests.Session()
+        # Scans must be stateless: never carry cookies from one request to the next
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        if headers:
+            self.session.headers.update(headers)
+        adapter = adapter_class(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send(self, method, url, headers=None, data=None, allow_redirects=False):
+        response = self.session.request(
+            method, url,
+            headers=headers,
+            data=data,
+            timeout=self.timeout,
+            verify=self.verify,
+            allow_redirects=allow_redirects,
+            stream=True,
+        )
+        return _PooledResponse(response)
+
+    def close(self):
+        self.session.close()
+
+
+class _Http2Response:
+    """A streamed httpx response, in the shape HttpClient reads"""
+
+    def __init__(self, response, elapsed):
+        self._response = response
+        self.url = str(response.url)
+        self.status_code = response.status_code
+        self.header_list = response.headers.multi_items()
+        self.headers = CaseInsensitiveDict(response.headers)
+        self.encoding = get_encoding_from_headers(self.headers)
+        self.elapsed = elapsed
+        self.protocol = HTTP2 if response.http_version == 'HTTP/2' else HTTP11
+
+    def iter_content(self, chunk_size):
+        return self._response.iter_bytes(chunk_size=chunk_size)
+
+    def discard(self, drain_limit):
+        # Closing an HTTP/2 stream resets only that stream
+        pass
+
+    def close(self):
+        self._response.close()
+
+
+class Http2Transport:
+    """
+    HTTP/2 via httpx, negotiated with ALPN.
+
+    Concurrent requests to one origin share a single connection as
+    separate streams. Origins that do not offer h2 are answered over
+    HTTP/1.1 by httpx; the dispatcher then moves them to another transport.
+    """
+
+    def __init__(self, httpx, timeout, verify, max_connections, headers=None):
+        connect_timeout, read_timeout = timeout
+        self._httpx = httpx
+        jar = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        self.client = httpx.Client(
+            http2=True,
+            verify=verify,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            cookies=httpx.Cookies(jar),
+            # Connection management headers are not allowed in HTTP/2
+            headers={k: v for k, v in (headers or {}).items() if k.lower() != 'connection'},
+        )
+
+    def send(self, method, url, headers=None, data=None, allow_redirects=False):
+        httpx = self._httpx
+        started = time.perf_counter()
+        try:
+            request = self.client.build_request(method, url, headers=headers, content=data)
+            response = self.client.send(request, stream=True, follow_redirects=allow_redirects)
+        except httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(str(e))
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(str(e))
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        return _Http2Response(response, time.perf_counter() - started)
+
+    def close(self):
+        self.client.close()
+
+
+class _BodyDecoder:
+    """Undo gzip or deflate content encoding, as requests does"""
+
+    def __init__(self, encoding):
+        encoding = (encoding or '').strip().lower()
+        if encoding in ('gzip', 'x-gzip'):
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decoder = zlib.decompressobj()
+        else:
+            self._decoder = None
+        self._first = True
+
+    def decode(self, data):
+        if self._decoder is None:
+            return data
+        try:
+            return self._decoder.decompress(data)
+        except zlib.error:
+            if self._first and self._decoder.unused_data == b'':
+                # Some servers send raw deflate without the zlib header
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                self._first = False
+                return self._decoder.decompress(data)
+            raise
+        finally:
+            self._first = False
+
+    def flush(self):
+        return self._decoder.flush() if self._decoder is not None else b''
+
+
+class _PipelinedConnection:
+    """
+    One HTTP/1.1 connection carrying several requests at once.
+
+    Requests are written as soon as they are submitted; responses come back
+    in the same order, and each sender waits its turn before reading its
+    own. If the connection dies, every request still waiting on it is told
+    so it can be sent again elsewhere.
+    """
+
+    def __init__(self, scheme, host, port, timeout, ssl_context=None):
+        connect_timeout, read_timeout = timeout
+        label = f"{host}:{port}"
+        started = time.perf_counter()
+        try:
+            sock = socket.create_connection((host, port), timeout=connect_timeout)
+        except socket.timeout as e:
+            raise requests.exceptions.ConnectTimeout(f"Connection to {label} timed out: {e}")
+        except OSError as e:
+            raise requests.exceptions.ConnectionError(f"Cannot connect to {label}: {e}")
+        metrics.observe('connect_seconds', time.perf_counter() - started, host=label)
+        if scheme == 'https':
+            handshake = time.perf_counter()
+            try:
+                sock = ssl_context.wrap_socket(sock, server_hostname=host)
+            except ssl.SSLError as e:
+                sock.close()
+                raise requests.exceptions.SSLError(f"TLS handshake with {label} failed: {e}")
+            except OSError as e:
+                sock.close()
+                raise requests.exceptions.ConnectionError(f"TLS handshake with {label} failed: {e}")
+            metrics.observe('tls_seconds', time.perf_counter() - handshake, host=label)
+        sock.settimeout(read_timeout)
+        self.sock = sock
+        self.reader = sock.makefile('rb', buffering=READ_SIZE)
+        self.answered = 0
+        self.closed = False
+        # No new requests once the server said it will close
+        self.draining = False
+        self._write_lock = threading.Lock()
+        self._turn = threading.Condition()
+        self._queue = deque()
+
+    @property
+    def outstanding(self):
+        return len(self._queue)
+
+    @property
+    def usable(self):
+        return not self.closed and not self.draining
+
+    def submit(self, data):
+        """
+        Write a request
+
+        Returns:
+            tuple: (ticket to wait on for the response, requests ahead of it)
+        """
+        ticket = object()
+        with self._write_lock:
+            with self._turn:
+                if not self.usable:
+                    raise _ConnectionLost()
+                ahead = len(self._queue)
+                self._queue.append(ticket)
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.fail()
+                raise _ConnectionLost()
+        return ticket, ahead
+
+    def wait_turn(self, ticket):
+        with self._turn:
+            while not self.closed and self._queue and self._queue[0] is not ticket:
+                self._turn.wait()
+            if self.closed or not self._queue or self._queue[0] is not ticket:
+                raise _ConnectionLost()
+
+    def done(self, ticket):
+        """The response for ``ticket`` has been read completely"""
+        with self._turn:
+            if self._queue and self._queue[0] is ticket:
+                self._queue.popleft()
+            self.answered += 1
+            self._turn.notify_all()
+            if self.draining and not self._queue:
+                self._close()
+
+    def fail(self):
+        """Drop the connection; requests still waiting on it are sent again"""
+        with self._turn:
+            self._close()
+            self._queue.clear()
+            self._turn.notify_all()
+
+    def _close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.reader.close()
+                self.sock.close()
+            except OSError:
+                pass
+
+    def arrived(self):
+        """Whether response bytes are already waiting to be read"""
+        if isinstance(self.sock, ssl.SSLSocket) and self.sock.pending():
+            return True
+        try:
+            return bool(select.select([self.sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return False
+
+    def readline(self):
+        line = self.reader.readline(MAX_LINE + 1)
+        if len(line) > MAX_LINE:
+            raise requests.exceptions.ConnectionError("Response line too long")
+        return line
+
+
+class _PipelinedResponse:
+    """A response read off a pipelined connection, body still on the wire"""
+
+    def __init__(self, transport, connection, ticket, url, method, version, status_code, header_list, elapsed):
+        self._transport = transport
+        self._connection = connection
+        self._ticket = ticket
+        self.url = url
+        self.status_code = status_code
+        self.header_list = header_list
+        self.headers = CaseInsensitiveDict(header_list)
+        self.encoding = get_encoding_from_headers(self.headers)
+        self.elapsed = elapsed
+        self.protocol = HTTP11_PIPELINED
+        self._finished = False
+
+        connection_header = self.headers.get('Connection', '').lower()
+        keep_alive = version == 'HTTP/1.1' and 'close' not in connection_header
+        if not keep_alive:
+            connection.draining = True
+            if connection.answered == 0:
+                # The first answer already ends the connection: this host
+                # gains nothing from pipelining
+                transport.unsupported(url)
+
+        encoding = self.headers.get('Transfer-Encoding', '').lower()
+        length = self.headers.get('Content-Length', '')
+        if method == 'HEAD' or status_code in NO_BODY_STATUSES or 100 <= status_code < 200:
+            self._remaining, self._chunked = 0, False
+        elif 'chunked' in encoding:
+            self._remaining, self._chunked = None, True
+        elif length.strip().isdigit():
+            self._remaining, self._chunked = int(length), False
+        else:
+            # Delimited by the connection closing
+            self._remaining, self._chunked = None, False
+            connection.draining = True
+        self._chunk_left = 0
+        self._decoder = _BodyDecoder(self.headers.get('Content-Encoding'))
+        if self._remaining == 0:
+            self._finish()
+
+    def _raw_chunks(self, size):
+        """Yield the body as sent, before content decoding"""
+        reader = self._connection.reader
+        try:
+            if self._chunked:
+                while True:
+                    if self._chunk_left == 0:
+                        line = self._connection.readline()
+                        if not line:
+                            raise _ConnectionLost()
+                        chunk_size = int(line.split(b';', 1)[0].strip() or b'0', 16)
+                        if chunk_size == 0:
+                            # Trailers end with an empty line
+                            while self._connection.readline() not in (b'\r\n', b'\n', b''):
+                                pass
+                            return
+                        self._chunk_left = chunk_size
+                    data = reader.read(min(size, self._chunk_left))
+                    if not data:
+                        raise _ConnectionLost()
+                    self._chunk_left -= len(data)
+                    if self._chunk_left == 0:
+                        reader.readline()
+                    yield data
+            elif self._remaining is None:
+                while True:
+                    data = reader.read1(size)
+                    if not data:
+                        return
+                    yield data
+            else:
+                while self._remaining > 0:
+                    data = reader.read1(min(size, self._remaining))
+                    if not data:
+                        raise _ConnectionLost()
+                    self._remaining -= len(data)
+                    yield data
+        except (_ConnectionLost, OSError, ValueError) as e:
+            self._connection.fail()
+            self._finished = True
+            raise requests.exceptions.ChunkedEncodingError(f"Connection broken while reading {self.url}: {e!r}")
+
+    def iter_content(self, chunk_size):
+        if self._finished:
+            return
+        for data in self._raw_chunks(chunk_size):
+            decoded = self._decoder.decode(data)
+            if decoded:
+                yield decoded
+        tail = self._decoder.flush()
+        self._finish()
+        if tail:
+            yield tail
+
+    def discard(self, drain_limit):
+        # The body has to leave the connection before the next response
+        # can be read; close() takes care of it
+        pass
+
+    def close(self):
+        if self._finished:
+            return
+        drained = 0
+        try:
+            for data in self._raw_chunks(READ_SIZE):
+                drained += len(data)
+                if drained > PIPELINE_DRAIN_LIMIT:
+                    self._connection.fail()
+                    self._finished = True
+                    return
+        except requests.RequestException:
+            return
+        self._finish()
+
+    def _finish(self):
+        if not self._finished:
+            self._finished = True
+            self._connection.done(self._ticket)
+
+
+class _PipelineStats:
+    """
+    How deep pipelines to one host should be.
+
+    A request with nothing queued ahead of it takes a full round trip plus
+    the server's work. For one queued behind others, the time spent waiting
+    for its response once it is next in line is the server's work on it
+    alone (none, if the server was quicker than we were). Their ratio is
+    how many requests fit into one round trip. Servers answer one connection's requests one at a time, so
+    a host that spends its time working rather than waiting on the network
+    gets short pipelines over more connections. Nearby hosts may queue up
+    to QUEUE_ALLOWANCE seconds before another connection is worth opening.
+    """
+
+    def __init__(self):
+        self.latency = None
+        self.interval = None
+
+    def observe_latency(self, seconds):
+        self.latency = seconds if self.latency is None else self.latency + EWMA_ALPHA * (seconds - self.latency)
+
+    def observe_interval(self, seconds):
+        self.interval = seconds if self.interval is None else self.interval + EWMA_ALPHA * (seconds - self.interval)
+
+    def depth(self, limit):
+        if self.latency is None or self.interval is None:
+            return min(limit, INITIAL_PIPELINE_DEPTH)
+        if self.interval <= 0:
+            return limit
+        return max(1, min(limit, int(max(self.latency, QUEUE_ALLOWANCE) / self.interval)))
+
+
+class PipelineTransport:
+    """
+    HTTP/1.1 pipelining for GET and HEAD requests.
+
+    Requests are packed onto as few connections per host as will carry
+    them: a connection takes new requests while fewer than the host's
+    pipeline depth (see _PipelineStats, at most ``depth``) are waiting on
+    it, and only then is another one opened, up to ``connections``. A far
+    away host is kept busy without a socket per request in flight.
+    """
+
+    def __init__(self, timeout, verify, headers=None, depth=DEFAULT_PIPELINE_DEPTH, connections=6):
+        self.timeout = timeout
+        self.depth = max(1, depth)
+        self.connections = max(1, connections)
+        self.headers = dict(headers or {})
+        # Only encodings _BodyDecoder can undo
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.headers['Connection'] = 'keep-alive'
+        self._ssl_context = ssl.create_default_context()
+        if not verify:
+            self._ssl_context.check_hostname = False
+            self._ssl_context.verify_mode = ssl.CERT_NONE
+        self._ssl_context.set_alpn_protocols(['http/1.1'])
+        self._pools = {}
+        self._stats = {}
+        self._origin_locks = {}
+        self._lock = threading.Lock()
+        self._unsupported = set()
+        self._closed = False
+
+    def supports(self, url):
+        """Whether pipelining is still worth trying for the url's host"""
+        return _origin(url) not in self._unsupported
+
+    def unsupported(self, url):
+        origin = _origin(url)
+        if origin not in self._unsupported:
+            self._unsupported.add(origin)
+            logger.info(f"{origin[1]}:{origin[2]} does not keep connections open; not pipelining to it")
+
+    def _connection(self, origin):
+        with self._lock:
+            if self._closed:
+                raise TransportError("Transport is closed")
+            pool = self._pools.setdefault(origin, [])
+            stats = self._stats.setdefault(origin, _PipelineStats())
+            origin_lock = self._origin_locks.setdefault(origin, threading.Lock())
+        # Connecting to one host does not hold up the others
+        with origin_lock:
+            pool[:] = [c for c in pool if not c.closed]
+            usable = [c for c in pool if c.usable]
+            depth = stats.depth(self.depth)
+            for connection in usable:
+                if connection.outstanding < depth:
+                    return connection
+            if usable and len(pool) >= self.connections:
+                return min(usable, key=lambda c: c.outstanding)
+            scheme, host, port = origin
+            connection = _PipelinedConnection(scheme, host, port, self.timeout, self._ssl_context)
+            pool.append(connection)
+            return connection
+
+    def _encode(self, method, url, headers):
+        parts = urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        merged = CaseInsensitiveDict(self.headers)
+        merged.update(headers or {})
+        merged['Host'] = parts.netloc
+        lines = [f"{method} {target} HTTP/1.1"]
+        lines.extend(f"{name}: {value}" for name, value in merged.items() if value is not None)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', errors='replace')
+
+    def send(self, method, url, headers=None, data=None, allow_redirects=False):
+        """
+        Send a GET or HEAD request over a shared connection
+
+        Raises:
+            TransportError: When the host keeps dropping pipelined requests;
+                the caller sends it another way
+            requests.RequestException: On connection or timeout errors
+        """
+        origin = _origin(url)
+        request = self._encode(method, url, headers)
+        for _ in range(PIPELINE_ATTEMPTS):
+            connection = self._connection(origin)
+            started = time.perf_counter()
+            try:
+                ticket, ahead = connection.submit(request)
+                connection.wait_turn(ticket)
+            except _ConnectionLost:
+                continue
+            # A response already sent cost the server nothing we waited for
+            turn = None if ahead == 0 or connection.arrived() else time.perf_counter()
+            try:
+                head = self._read_head(connection)
+            except _ConnectionLost:
+                connection.fail()
+                continue
+            except socket.timeout as e:
+                connection.fail()
+                raise requests.exceptions.ReadTimeout(f"Read timed out for {url}: {e}")
+            except (OSError, ValueError) as e:
+                connection.fail()
+                raise requests.exceptions.ConnectionError(f"Bad response from {url}: {e}")
+            now = time.perf_counter()
+            stats = self._stats[origin]
+            if ahead == 0:
+                stats.observe_latency(now - started)
+            else:
+                stats.observe_interval(0.0 if turn is None else now - turn)
+            version, status_code, header_list = head
+            return _PipelinedResponse(self, connection, ticket, url, method, version, status_code, header_list,
+                                      now - started)
+        self.unsupported(url)
+        raise TransportError(f"Pipelined requests to {url} keep failing")
+
+    def _read_head(self, connection):
+        while True:
+            line = connection.readline()
+            if not line:
+                raise _ConnectionLost()
+            version, _, rest = line.decode('latin-1').strip().partition(' ')
+            if not version.startswith('HTTP/'):
+                raise ValueError(f"Malformed status line {line[:40]!r}")
+            status_code = int(rest.split(' ', 1)[0])
+            header_list = []
+            while True:
+                line = connection.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                if len(header_list) >= MAX_HEADERS:
+                    raise ValueError("Too many response headers")
+                name, _, value = line.decode('latin-1').partition(':')
+                header_list.append((name.strip(), value.strip()))
+            # Interim responses (100 Continue) precede the real one
+            if 100 <= status_code < 200 and status_code != 101:
+                continue
+            return version, status_code, header_list
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for connection in pool:
+                connection.fail()
+
+
+class Transport:
+    """
+    Picks how each request travels, per host.
+
+    Modes:
+        pooled: HTTP/1.1 on a keep-alive connection pool, one request per
+            connection at a time
+        http2: HTTP/2 where the host offers it over TLS, otherwise pooled
+        pipeline: HTTP/2 where offered, otherwise HTTP/1.1 pipelining for
+            GET and HEAD, and pooled for everything else
+        auto: the same as http2
+
+    HTTP/2 needs the optional httpx and h2 packages; without them the
+    other transports are used.
+    """
+
+    def __init__(self, mode=DEFAULT_TRANSPORT, timeout=(5.0, 15.0), verify=True, concurrency=20, per_host=6,
+                 headers=None, adapter_class=HTTPAdapter, pipeline_depth=DEFAULT_PIPELINE_DEPTH):
+        if mode not in TRANSPORTS:
+            raise ValueError(f"Unknown transport: {mode}")
+        self.mode = mode
+        self.pooled = PooledTransport(timeout, verify, concurrency, per_host, headers, adapter_class)
+        # Every transport sends the same default headers
+        default_headers = dict(self.pooled.session.headers)
+        self.http2 = None
+        if mode != 'pooled':
+            httpx = _load_httpx()
+            if httpx is not None:
+                self.http2 = Http2Transport(httpx, timeout, verify, concurrency, default_headers)
+            elif mode == 'http2':
+                logger.warning("HTTP/2 needs the httpx and h2 packages (pip install 'httpx[http2]'); using HTTP/1.1")
+        self.pipeline = None
+        if mode == 'pipeline':
+            # Never more sockets per host than the pool would open
+            self.pipeline = PipelineTransport(timeout, verify, default_headers, pipeline_depth, per_host)
+        # Hosts known not to speak HTTP/2
+        self._http1_hosts = set()
+
+    @property
+    def session(self):
+        return self.pooled.session
+
+    def send(self, method, url, headers=None, data=None, allow_redirects=False):
+        """
+        Send a request and return a streamed response
+
+        Raises:
+            requests.RequestException: On connection or timeout errors
+        """
+        origin = _origin(url)
+        if self.http2 is not None and origin[0] == 'https' and origin not in self._http1_hosts:
+            response = self.http2.send(method, url, headers, data, allow_redirects)
+            if response.protocol != HTTP2:
+                self._http1_hosts.add(origin)
+                logger.debug(f"{origin[1]}:{origin[2]} does not offer HTTP/2")
+            return response
+        if (self.pipeline is not None and method in PIPELINE_METHODS and not data and not allow_redirects
+                and self.pipeline.supports(url)):
+            try:
+                return self.pipeline.send(method, url, headers)
+            except TransportError:
+                pass
+        return self.pooled.send(method, url, headers, data, allow_redirects)
+
+    def close(self):
+        if self.pipeline is not None:
+            self.pipeline.close()
+        if self.http2 is not None:
+            self.http2.close()
+        self.pooled.close()
@@ -1,6 +1,7 @@
 import logging
 import sys
 from datetime import datetime
+from pathlib import Path
 
 def setup_logger(log_level=logging.INFO):
     """
@@ -25,6 +26,7 @@ def setup_logger(log_level=logging.INFO):
     logger.addHandler(console_handler)
 
     # Create file handler
+    Path('logs').mkdir(exist_ok=True)
     log_filename = f"logs/pentoscan_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
     file_handler = logging.FileHandler(log_filename)
     file_handler.setFormatter(file_formatter)
@@ -1,15 +1,20 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
 import logging
 import os
+import signal
 import sys
-from datetime import datetime
 from pathlib import Path
-from core.scanner import run_scan
+# Only light modules at import time: the HTTP stack, YAML and V8 are
+# imported by the commands that need them, so `list` and `--help` stay fast
+from core.defaults import (DEFAULT_CHECKPOINT_INTERVAL, DEFAULT_COORDINATOR_PORT, DEFAULT_DAEMON_ADDRESS,
+                           DEFAULT_EXPLOIT_TIMEOUT, DEFAULT_EXPLOIT_WORKERS, DEFAULT_JOB_SLOTS,
+                           DEFAULT_LEASE_SIZE, DEFAULT_LEASE_TTL, DEFAULT_STATE_DB, DEFAULT_WORKER_SLOTS)
 from core.loader import load_template, load_templates
-from core.logger import ResultLogger
-from core.module_loader import run_exploit
+from core.logger import OUTPUT_FORMATS, create_result_logger
+from core.metrics import DEFAULT_PROGRESS_INTERVAL, metrics
 
 # Configure logging
 logging.basicConfig(
@@ -18,11 +23,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def setup_directories():
-    """Ensure all required directories exist"""
-    directories = ['results', 'templates', 'modules', 'core', 'logs']
-    for directory in directories:
-        Path(directory).mkdir(exist_ok=True)
+def add_stats_arguments(parser):
+    """Metrics and profiling options shared by scan and batch"""
+    parser.add_argument('--stats', action='store_true', help='Print timing and request statistics at the end')
+    parser.add_argument('--progress', type=float, nargs='?', const=DEFAULT_PROGRESS_INTERVAL,
+                        help='Print a progress line every N seconds (default: %(const)s)')
+    parser.add_argument('--metrics-file', help='Keep metrics in this file (.json, otherwise Prometheus text)')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this local port')
+    parser.add_argument('--profile', metavar='DIR', help='Write a cProfile file per template to DIR')
+
+def add_exploit_arguments(parser):
+    """Exploit module options shared by scan and batch"""
+    parser.add_argument('--exploit-workers', type=int, default=DEFAULT_EXPLOIT_WORKERS,
+                        help='Exploit modules running at the same time')
+    parser.add_argument('--exploit-timeout', type=float, default=DEFAULT_EXPLOIT_TIMEOUT,
+                        help='Seconds an exploit module may run')
+
+def add_transport_arguments(parser):
+    """Connection options, part of the client options"""
+    parser.add_argument('--transport', choices=['auto', 'pooled', 'http2', 'pipeline'], default='auto',
+                        help="'auto'/'http2': HTTP/2 where a TLS host offers it (needs httpx[http2]), "
+                             "otherwise pooled HTTP/1.1; 'pipeline': also pipeline GET/HEAD over "
+                             "HTTP/1.1; 'pooled': HTTP/1.1 only (default: auto)")
+
+def add_client_arguments(parser, scope=None, cache_scope=None):
+    """
+    HTTP client options shared by everything that sends scan requests;
+    scope and cache_scope name what the limits and the cache apply to
+    when that is not the whole process
+    """
+    per = f" per {scope}" if scope else ''
+    per_host = f" per host and {scope}" if scope else ' per host'
+    parser.add_argument('-c', '--concurrency', type=int, default=20, help=f'Maximum requests in flight{per}')
+    parser.add_argument('--per-host', type=int, default=6, help=f'Maximum requests in flight{per_host}')
+    parser.add_argument('--rate-limit', type=float, help=f'Maximum requests per second{per_host}')
+    parser.add_argument('--no-adaptive', action='store_true',
+                        help='Keep per-host limits fixed instead of adapting to throttling and latency')
+    parser.add_argument('--timeout', type=float, default=15.0, help='Read timeout in seconds')
+    parser.add_argument('--connect-timeout', type=float, default=5.0, help='Connect timeout in seconds')
+    parser.add_argument('--max-body-size', type=int, default=8 * 1024 * 1024,
+                        help='Maximum response body bytes to read')
+    cache_per = f" per {cache_scope}" if cache_scope else ''
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help=f'Response cache size{cache_per} in MB (0 disables)')
+    add_transport_arguments(parser)
+
+def add_incremental_arguments(parser):
+    """Options for re-scanning with the previous run's responses"""
+    parser.add_argument('--incremental', metavar='DB', nargs='?', const=str(DEFAULT_STATE_DB),
+                        help='Send conditional requests and reuse the previous outcome of unchanged '
+                             'responses; state is kept in DB (default: %(const)s)')
+
+def add_baseline_arguments(parser):
+    """Options for the per-target baseline taken before templates run"""
+    parser.add_argument('--no-baseline', action='store_true',
+                        help='Do not fingerprint targets first; run every template in full and match '
+                             'soft-404 pages too')
+
+def add_archive_arguments(parser):
+    """Options for recording a run's traffic and matching against a recording instead of the network"""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='DIR',
+                       help='Keep every request and its full response in the archive DIR')
+    group.add_argument('--replay', metavar='DIR',
+                       help='Send nothing: answer requests from the archive DIR; no baseline, exploits '
+                            'or incremental state')
+
+def add_daemon_client_arguments(parser):
+    """Where the client finds the serve daemon"""
+    parser.add_argument('--daemon', default=os.environ.get('PENTOSCAN_DAEMON', DEFAULT_DAEMON_ADDRESS),
+                        help="Daemon address, 'http://host:port' or 'unix:PATH' "
+                             "(default: $PENTOSCAN_DAEMON or %(default)s)")
+    parser.add_argument('--token', default=os.environ.get('PENTOSCAN_TOKEN'),
+                        help='Shared secret of the daemon (default: $PENTOSCAN_TOKEN)')
 
 def parse_args():
     """Parse command line arguments"""
@@ -32,16 +105,340 @@ def parse_args():
     # Scan command
     scan_parser = subparsers.add_parser('scan', help='Run a scan')
     scan_parser.add_argument('-t', '--target', required=True, help='Target URL')
-    scan_parser.add_argument('-template', '--template', required=True, help='Path to scan template')
+    scan_parser.add_argument('-template', '--template', required=True, help='Path to scan template or template directory')
     scan_parser.add_argument('-o', '--output', help='Output directory for results')
+    scan_parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='json',
+                             help="'json': one file per scan, 'jsonl': one streamed file per run (default: json)")
+    scan_parser.add_argument('--compress', choices=['gzip', 'zstd'], help='Compress jsonl output')
     scan_parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
     scan_parser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
+    add_client_arguments(scan_parser)
+    add_incremental_arguments(scan_parser)
+    add_baseline_arguments(scan_parser)
+    add_archive_arguments(scan_parser)
+    add_exploit_arguments(scan_parser)
+    add_stats_arguments(scan_parser)
+    
+    # Batch command
+    batch_parser = subparsers.add_parser('batch', help='Scan many targets with many templates')
+    batch_parser.add_argument('-l', '--targets',
+                              help="File with one target per line, or '-' for stdin (default with --replay: "
+                                   "the archive's targets)")
+    batch_parser.add_argument('--templates', default='templates', help='Template directory')
+    batch_parser.add_argument('--tags', help='Comma-separated tags; only templates with one of them run')
+    batch_parser.add_argument('--severity', help='Comma-separated severities; only templates with one of them run')
+    batch_parser.add_argument('--no-cache', action='store_true', help='Parse templates without the template cache')
+    batch_parser.add_argument('-w', '--workers', type=int, help='Worker processes (default: CPU count)')
+    batch_parser.add_argument('-o', '--output', help='Output directory for results')
+    batch_parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='jsonl',
+                              help="'json': one file per scan, 'jsonl': one streamed file per run (default: jsonl)")
+    batch_parser.add_argument('--compress', choices=['gzip', 'zstd'], help='Compress jsonl output')
+    batch_parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    batch_parser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
+    add_client_arguments(batch_parser, scope='worker')
+    add_incremental_arguments(batch_parser)
+    add_baseline_arguments(batch_parser)
+    add_archive_arguments(batch_parser)
+    batch_parser.add_argument('--checkpoint-interval', type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                              help='Seconds between progress checkpoints (0 disables)')
+    batch_parser.add_argument('--resume', metavar='RUN_ID', help='Continue an interrupted run from its checkpoint')
+    add_exploit_arguments(batch_parser)
+    add_stats_arguments(batch_parser)
+    
+    # Coordinator command
+    coordinator_parser = subparsers.add_parser('coordinator', help='Hand a batch out to remote workers')
+    coordinator_parser.add_argument('-l', '--targets', required=True,
+                                    help="File with one target per line, or '-' for stdin")
+    coordinator_parser.add_argument('--templates', default='templates', help='Template directory')
+    coordinator_parser.add_argument('--tags', help='Comma-separated tags; only templates with one of them run')
+    coordinator_parser.add_argument('--severity',
+                                    help='Comma-separated severities; only templates with one of them run')
+    coordinator_parser.add_argument('--no-cache', action='store_true', help='Parse templates without the template cache')
+    coordinator_parser.add_argument('-o', '--output', help='Output directory for results')
+    coordinator_parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='jsonl',
+                                    help="'json': one file per scan, 'jsonl': one streamed file per run (default: jsonl)")
+    coordinator_parser.add_argument('--compress', choices=['gzip', 'zstd'], help='Compress jsonl output')
+    coordinator_parser.add_argument('--bind', default='127.0.0.1', help='Address to listen on')
+    coordinator_parser.add_argument('--port', type=int, default=DEFAULT_COORDINATOR_PORT, help='Port to listen on')
+    coordinator_parser.add_argument('--lease-size', type=int, default=DEFAULT_LEASE_SIZE,
+                                    help='Maximum work units per lease')
+    coordinator_parser.add_argument('--lease-ttl', type=float, default=DEFAULT_LEASE_TTL,
+                                    help='Seconds without a heartbeat before a lease is re-issued')
+    coordinator_parser.add_argument('--token', default=os.environ.get('PENTOSCAN_TOKEN'),
+                                    help='Shared secret workers must present (default: $PENTOSCAN_TOKEN)')
+    coordinator_parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    coordinator_parser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
+    add_stats_arguments(coordinator_parser)
+
+    # Worker command
+    worker_parser = subparsers.add_parser('worker', help='Scan work handed out by a coordinator')
+    worker_parser.add_argument('--coordinator', required=True, help='Coordinator URL, e.g. http://10.0.0.1:8600')
+    worker_parser.add_argument('--templates', default='templates',
+                               help='Template directory holding the same templates as the coordinator')
+    worker_parser.add_argument('--no-cache', action='store_true', help='Parse templates without the template cache')
+    worker_parser.add_argument('--slots', type=int, default=DEFAULT_WORKER_SLOTS,
+                               help='Hosts scanned at the same time')
+    worker_parser.add_argument('--id', help='Worker name shown by the coordinator (default: hostname-pid)')
+    worker_parser.add_argument('--token', default=os.environ.get('PENTOSCAN_TOKEN'),
+                               help='Shared secret of the coordinator (default: $PENTOSCAN_TOKEN)')
+    worker_parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    worker_parser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
+    add_client_arguments(worker_parser)
+    add_incremental_arguments(worker_parser)
+    add_baseline_arguments(worker_parser)
+    
+    # Serve command
+    serve_parser = subparsers.add_parser('serve', help='Run a scan daemon taking jobs over a local API')
+    serve_parser.add_argument('--templates', default='templates', help='Template directory jobs choose from')
+    serve_parser.add_argument('--no-cache', action='store_true', help='Parse templates without the template cache')
+    serve_parser.add_argument('--listen', default=DEFAULT_DAEMON_ADDRESS,
+                              help="Address to listen on, 'http://host:port' or 'unix:PATH' (default: %(default)s)")
+    serve_parser.add_argument('--jobs', type=int, default=DEFAULT_JOB_SLOTS, help='Jobs running at the same time')
+    serve_parser.add_argument('--token', default=os.environ.get('PENTOSCAN_TOKEN'),
+                              help='Shared secret clients must present (default: $PENTOSCAN_TOKEN)')
+    serve_parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    serve_parser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
+    add_client_arguments(serve_parser, cache_scope='job')
+    add_incremental_arguments(serve_parser)
+    add_exploit_arguments(serve_parser)
+    add_stats_arguments(serve_parser)
+
+    # Client command
+    client_parser = subparsers.add_parser('client', help='Send scan jobs to a serve daemon')
+    client_actions = client_parser.add_subparsers(dest='action', required=True, help='Actions')
+    client_scan = client_actions.add_parser('scan', help='Submit a job and print its findings as they arrive')
+    client_scan.add_argument('-t', '--target', action='append', default=[], help='Target URL (repeatable)')
+    client_scan.add_argument('-l', '--targets', help="File with one target per line, or '-' for stdin")
+    client_scan.add_argument('--template-id', help='Comma-separated ids of daemon templates (default: all)')
+    client_scan.add_argument('--tags', help='Comma-separated tags; only templates with one of them run')
+    client_scan.add_argument('--severity', help='Comma-separated severities; only templates with one of them run')
+    client_scan.add_argument('--no-baseline', action='store_true', help='Do not fingerprint targets first')
+    client_scan.add_argument('--no-exploit', action='store_true', help='Do not run exploit modules')
+    client_scan.add_argument('--detach', action='store_true', help='Print the job id and return at once')
+    client_scan.add_argument('--json', action='store_true', help='Print result records as JSON lines')
+    client_scan.add_argument('--fail-on-findings', action='store_true',
+                             help='Exit with status 2 when anything was found')
+    add_daemon_client_arguments(client_scan)
+    client_results = client_actions.add_parser('results', help="Follow a job's findings until it ends")
+    client_results.add_argument('job', help='Job id')
+    client_results.add_argument('--json', action='store_true', help='Print result records as JSON lines')
+    client_results.add_argument('--fail-on-findings', action='store_true',
+                                help='Exit with status 2 when anything was found')
+    add_daemon_client_arguments(client_results)
+    client_status = client_actions.add_parser('status', help='Show the daemon, or one job')
+    client_status.add_argument('job', nargs='?', help='Job id')
+    add_daemon_client_arguments(client_status)
+    client_cancel = client_actions.add_parser('cancel', help='Cancel a job')
+    client_cancel.add_argument('job', help='Job id')
+    add_daemon_client_arguments(client_cancel)
+    client_reload = client_actions.add_parser('reload', help='Make the daemon load changed templates')
+    add_daemon_client_arguments(client_reload)
+    
+    # Results command
+    results_parser = subparsers.add_parser('results', help='Query saved results')
+    results_parser.add_argument('--dir', default='results', help='Results directory to index')
+    results_parser.add_argument('--db', help='Index database (default: <dir>/index.sqlite)')
+    results_parser.add_argument('--template', help='Comma-separated template ids')
+    results_parser.add_argument('--host', help='Comma-separated hosts (host or host:port)')
+    results_parser.add_argument('--severity', help='Comma-separated severities')
+    results_parser.add_argument('--since', help="ISO date/time or age such as '7d' or '12h'")
+    results_parser.add_argument('--until', help="ISO date/time or age such as '1d'")
+    results_parser.add_argument('--all', action='store_true', help='Include scans that found nothing')
+    results_parser.add_argument('--count-by', choices=['template', 'host', 'target', 'severity', 'day'],
+                                help='Print counts per group instead of rows')
+    results_parser.add_argument('--details', action='store_true', help='Show matched requests and extracted data')
+    results_parser.add_argument('--limit', type=int, default=50, help='Maximum rows to print')
+    results_parser.add_argument('--no-ingest', action='store_true', help='Query without indexing new files first')
     
     # List command
     list_parser = subparsers.add_parser('list', help='List available templates')
+    list_parser.add_argument('--templates', default='templates', help='Template directory')
+    list_parser.add_argument('--tags', help='Comma-separated tags to filter on')
+    list_parser.add_argument('--severity', help='Comma-separated severities to filter on')
+    list_parser.add_argument('--no-cache', action='store_true', help='Parse templates without the template cache')
     
     return parser.parse_args()
 
+def split_csv(value):
+    """Split a comma-separated CLI value, returning None when empty"""
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+def start_metrics(args, total=None):
+    """
+    Enable metrics collection when any stats output was requested
+
+    Returns:
+        callable: Stops reporting and prints the --stats summary
+    """
+    if not (args.stats or args.progress or args.metrics_file or args.metrics_port):
+        return lambda: None
+    from core.metrics import MetricsServer, ProgressReporter
+
+    metrics.enable()
+    server = MetricsServer(args.metrics_port) if args.metrics_port else None
+    reporter = None
+    if args.progress or args.metrics_file:
+        reporter = ProgressReporter(
+            total,
+            interval=args.progress or DEFAULT_PROGRESS_INTERVAL,
+            show=bool(args.progress),
+            metrics_file=args.metrics_file,
+        )
+
+    def stop():
+        if reporter is not None:
+            reporter.close()
+        if server is not None:
+            server.close()
+        if args.stats:
+            print(metrics.summary())
+
+    return stop
+
+def open_result_logger(args, run_id=None, resume_from=None):
+    """Create the result writer selected on the command line"""
+    try:
+        return create_result_logger(args.output or 'results', args.output_format, args.compress,
+                                    run_id=run_id, resume_from=resume_from)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def open_validator_store(args):
+    """Open the --incremental state, or return None for a full scan"""
+    if not args.incremental:
+        return None
+    from core.incremental import StateError, ValidatorStore
+    try:
+        return ValidatorStore(args.incremental)
+    except StateError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def close_validator_store(validators):
+    """Report what an incremental run saved, forget stale state and close"""
+    if validators is None:
+        return
+    stats = validators.stats()
+    if any(stats.values()):
+        logger.info(
+            f"Incremental: {stats['unchanged']} unchanged responses reused, "
+            f"{stats['changed']} changed, {stats['new']} new"
+        )
+    validators.prune()
+    validators.close()
+
+def check_archive_options(args):
+    """Reject combinations that would record or replay the wrong responses"""
+    if args.incremental and (args.record or args.replay):
+        print("Error: --incremental cannot be combined with --record or --replay")
+        sys.exit(1)
+
+def open_archive_writer(args):
+    """Open the --record archive, or return None"""
+    if not args.record:
+        return None
+    from core.archive import ArchiveError, ArchiveWriter
+    try:
+        return ArchiveWriter(args.record)
+    except ArchiveError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def close_archive_writer(recorder):
+    """Report what a recording stored and close it"""
+    if recorder is None:
+        return
+    recorder.close()
+    stats = recorder.stats()
+    logger.info(
+        f"Archive {recorder.path}: {stats['responses']} responses recorded, {stats['bodies']} new bodies, "
+        f"{stats['body_bytes'] / 1048576:.1f} MB stored as {stats['stored_bytes'] / 1048576:.1f} MB"
+    )
+
+def client_options(args):
+    """HttpClient keyword arguments for the client options on the command line"""
+    return {
+        'concurrency': args.concurrency,
+        'per_host': args.per_host,
+        'connect_timeout': args.connect_timeout,
+        'read_timeout': args.timeout,
+        'max_body_size': args.max_body_size,
+        'transport': args.transport,
+    }
+
+def make_client(args, **overrides):
+    """
+    Build an HttpClient from the client options
+
+    Args:
+        args: Parsed arguments of a command with add_client_arguments
+        **overrides: HttpClient keyword arguments to set or replace; without
+            a rate_controller the client gets one of its own
+
+    Returns:
+        HttpClient: The new client
+    """
+    from core.http_client import HttpClient
+    from core.ratelimit import RateController
+
+    options = {**client_options(args), **overrides}
+    if options.get('rate_controller') is None:
+        options['rate_controller'] = RateController(
+            args.per_host,
+            max_rate=args.rate_limit,
+            adaptive=not args.no_adaptive,
+        )
+    return HttpClient(**options)
+
+def open_exploit_runner(args, client=None):
+    """
+    Run exploit modules on a client of their own that, as exploits always
+    have, does not verify TLS certificates, so they work against
+    self-signed targets. It shares per-host limits with the scan's client.
+    """
+    from core.module_loader import ExploitRunner
+
+    rate_controller = client.rate_controller if client is not None else None
+    exploit_client = make_client(args, verify=False, rate_controller=rate_controller)
+    return ExploitRunner(exploit_client, workers=args.exploit_workers, timeout=args.exploit_timeout)
+
+def close_exploit_runner(runner):
+    """Abandon unfinished exploit runs and close their client"""
+    if runner is None:
+        return
+    runner.close()
+    runner.client.close()
+
+def open_replay_client(path):
+    """A client answering from the archive at path instead of the network"""
+    from core.archive import ArchiveError, ReplayClient, ResponseArchive
+    try:
+        return ReplayClient(ResponseArchive(path))
+    except ArchiveError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def fingerprint_targets(args, targets):
+    """
+    Take the baseline of every target before the batch starts
+
+    Returns:
+        dict: Target -> TargetProfile
+    """
+    from core.baseline import ProfileCache
+
+    client = make_client(args)
+    print(f"[*] Fingerprinting {len(targets)} targets")
+    try:
+        profiles = ProfileCache(client).prefetch(targets)
+    finally:
+        client.close()
+    unreachable = sum(1 for p in profiles.values() if not p.reachable)
+    soft_404 = sum(1 for p in profiles.values() if p.signatures)
+    print(f"[*] Baseline: {unreachable} unreachable, {soft_404} answering missing paths with a soft-404 page")
+    return profiles
+
 def print_scan_result(result):
     """Print scan results in a formatted way"""
     print("\n=== Scan Results ===")
@@ -54,69 +451,588 @@ def print_scan_result(result):
     
     if result.vulnerable:
         print("\nDetailed Results:")
-        for req_result in result.results:
-            print(f"\nRequest: {req_result['request']['method']} {req_result['request']['url']}")
-            print("Status Code:", req_result['response']['status_code'])
-            print("Response Headers:")
-            for header, value in req_result['response']['headers'].items():
-                print(f"  {header}: {value}")
+        for finding in result.results:
+            print(f"\nRequest: {finding.method} {finding.target_url}")
+            print("Status Code:", finding.status_code)
+            for detail in finding.match_details:
+                print(f"  {detail}")
+            if finding.response_headers:
+                print("Response Headers:")
+                for header, value in finding.response_headers.items():
+                    print(f"  {header}: {value}")
             
-            if 'extracted_data' in req_result:
+            if finding.extracted_data:
                 print("\nExtracted Data:")
-                for data in req_result['extracted_data']:
+                for data in finding.extracted_data:
                     print(f"  - {data}")
 
+def run_batch(args):
+    """Run every selected template against every target in one process pool"""
+    from core.batch import BatchScheduler, read_targets
+    from core.checkpoint import Checkpoint, CheckpointError, new_run_id
+
+    check_archive_options(args)
+    output_dir = args.output or 'results'
+    checkpoint = None
+    if args.resume:
+        try:
+            checkpoint = Checkpoint.load(output_dir, args.resume, interval=args.checkpoint_interval)
+            targets = checkpoint.targets()
+        except CheckpointError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        # A resumed run keeps its original selection and output
+        for name in ('templates', 'tags', 'severity', 'output_format', 'compress'):
+            setattr(args, name, checkpoint.spec[name])
+        run_id = args.resume
+    elif args.targets:
+        targets = read_targets(args.targets)
+        run_id = new_run_id(output_dir)
+    elif args.replay:
+        # Everything the archive holds responses for
+        with open_replay_client(args.replay) as replay_client:
+            targets = replay_client.archive.targets()
+        run_id = new_run_id(output_dir)
+    else:
+        print("Error: --targets is required unless resuming a run")
+        sys.exit(1)
+
+    templates = load_templates(
+        args.templates,
+        tags=split_csv(args.tags),
+        severity=split_csv(args.severity),
+        use_cache=not args.no_cache,
+    )
+    if not targets or not templates:
+        print("Error: No targets or no matching templates")
+        sys.exit(1)
+
+    scheduler = BatchScheduler(
+        targets,
+        templates,
+        workers=args.workers,
+        client_options={
+            **client_options(args),
+            'cache_size': args.cache_size * 1024 * 1024,
+            'max_rate': args.rate_limit,
+            'adaptive': not args.no_adaptive,
+            'metrics': metrics.enabled,
+            'profile_dir': args.profile,
+            'incremental': args.incremental,
+            'record': args.record,
+            'replay': args.replay,
+        },
+    )
+    if checkpoint is not None:
+        if checkpoint.spec['queue'] != scheduler.fingerprint():
+            print(f"Error: Templates or payloads changed since run {run_id} started; it cannot be resumed")
+            sys.exit(1)
+        print(f"[*] Resuming run {run_id}: {len(checkpoint.completed)}/{scheduler.total_units} work units done, "
+              f"{checkpoint.emitted} findings saved")
+        result_logger = open_result_logger(args, run_id=run_id, resume_from=checkpoint.results)
+    else:
+        result_logger = open_result_logger(args, run_id=run_id)
+        if args.checkpoint_interval > 0:
+            spec = {name: getattr(args, name) for name in ('templates', 'tags', 'severity', 'output_format', 'compress')}
+            spec['queue'] = scheduler.fingerprint()
+            checkpoint = Checkpoint.create(output_dir, run_id, spec, targets, interval=args.checkpoint_interval)
+    if checkpoint is not None:
+        checkpoint.sink = result_logger
+        checkpoint.save()
+
+    # Workers keep their own connections; this one checks the state opens
+    # and prunes it once the run is over
+    validators = open_validator_store(args)
+    print(f"[*] Batch {run_id}: {len(targets)} targets x {len(templates)} templates")
+    units_left = scheduler.total_units - (len(checkpoint.completed) if checkpoint is not None else 0)
+    stop_metrics = start_metrics(args, total=units_left)
+    findings = 0
+
+    # Exploits run here in the parent, on one client shared by all modules
+    exploit_modules = {} if args.replay else {t.id: t.exploit_module for t in templates if t.exploit_module}
+    runner = open_exploit_runner(args) if exploit_modules else None
+    pending = []
+
+    def save(scan_result, exploit_result=None):
+        result_logger.save_result(scan_result, exploit_result)
+        if checkpoint is not None:
+            checkpoint.finding_emitted()
+
+    def save_exploits(wait=False):
+        # Results are written from this thread only; finished runs first
+        for item in list(pending):
+            key, scan_result, future = item
+            if wait or future.done():
+                pending.remove(item)
+                exploit_result = runner.result(future)
+                if checkpoint is not None:
+                    checkpoint.deferred.pop(key, None)
+                save(scan_result, exploit_result)
+
+    def submit_exploit(target, template_id, scan_result):
+        module_path = exploit_modules.get(template_id)
+        if not module_path:
+            save(scan_result)
+            return
+        # Kept in the checkpoint until saved, so an interrupted exploit reruns
+        key = (target, template_id)
+        if checkpoint is not None:
+            checkpoint.deferred[key] = scan_result
+        pending.append((key, scan_result, runner.submit(module_path, target, scan_result)))
+
+    def on_result(target, scan_result):
+        nonlocal findings
+        if scan_result.vulnerable:
+            findings += 1
+            print(f"[+] {scan_result.template_id} matched {target}")
+            submit_exploit(target, scan_result.template_id, scan_result)
+        else:
+            scan_result.close()
+        save_exploits()
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    # A preempted box gets SIGTERM; treat it like Ctrl-C so progress is saved
+    previous_handler = signal.signal(signal.SIGTERM, terminate)
+    try:
+        if checkpoint is not None:
+            for (target, template_id), scan_result in list(checkpoint.deferred.items()):
+                submit_exploit(target, template_id, scan_result)
+        profiles = None if args.no_baseline or args.replay else fingerprint_targets(args, targets)
+        units = scheduler.run(on_result, checkpoint=checkpoint, profiles=profiles)
+        save_exploits(wait=True)
+        if checkpoint is not None:
+            checkpoint.finish()
+    except KeyboardInterrupt:
+        if checkpoint is not None:
+            output = f" -o {args.output}" if args.output else ""
+            print(f"\n[!] Interrupted; continue with: batch --resume {run_id}{output}")
+        else:
+            print("\n[!] Interrupted")
+        sys.exit(130)
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        if checkpoint is not None and not checkpoint.complete:
+            checkpoint.save()
+        close_exploit_runner(runner)
+        result_logger.close()
+        close_validator_store(validators)
+        stop_metrics()
+    print(f"[*] Batch complete: {units} work units, {findings} vulnerable target/template pairs")
+
+def run_coordinator(args):
+    """Serve a batch's work queue to remote workers and collect their findings"""
+    from core.batch import read_targets
+    from core.distributed import Coordinator
+
+    targets = read_targets(args.targets)
+    templates = load_templates(
+        args.templates,
+        tags=split_csv(args.tags),
+        severity=split_csv(args.severity),
+        use_cache=not args.no_cache,
+    )
+    if not targets or not templates:
+        print("Error: No targets or no matching templates")
+        sys.exit(1)
+    if not args.token and args.bind not in ('127.0.0.1', 'localhost', '::1'):
+        logger.warning("Coordinator reachable from the network without --token; anyone can fetch or submit work")
+
+    result_logger = open_result_logger(args)
+    findings = 0
+
+    def on_result(target, scan_result):
+        nonlocal findings
+        if scan_result.vulnerable:
+            findings += 1
+            print(f"[+] {scan_result.template_id} matched {target}")
+            result_logger.save_result(scan_result)
+        else:
+            scan_result.close()
+
+    try:
+        coordinator = Coordinator(
+            targets,
+            templates,
+            on_result,
+            host=args.bind,
+            port=args.port,
+            lease_size=args.lease_size,
+            lease_ttl=args.lease_ttl,
+            token=args.token,
+        )
+    except OSError as e:
+        result_logger.close()
+        print(f"Error: Cannot listen on {args.bind}:{args.port}: {e}")
+        sys.exit(1)
+
+    stop_metrics = start_metrics(args, total=coordinator.total_units)
+    print(f"[*] Coordinator on {coordinator.url}: {len(targets)} targets x {len(templates)} templates, "
+          f"{coordinator.total_units} work units")
+    try:
+        with coordinator:
+            coordinator.wait()
+    except KeyboardInterrupt:
+        print("\n[!] Interrupted")
+        sys.exit(130)
+    finally:
+        result_logger.close()
+        stop_metrics()
+    print(f"[*] Distributed batch complete: {coordinator.finished_units} work units, "
+          f"{findings} vulnerable target/template pairs")
+
+def run_worker(args):
+    """Scan the leases a coordinator hands out until it has none left"""
+    from core.baseline import ProfileCache
+    from core.distributed import DistributedError, Worker
+    from core.response_cache import ResponseCache
+
+    templates = load_templates(args.templates, use_cache=not args.no_cache)
+    cache = ResponseCache(args.cache_size * 1024 * 1024) if args.cache_size > 0 else None
+    client = make_client(args, cache=cache)
+    validators = open_validator_store(args)
+    profiles = None if args.no_baseline else ProfileCache(client)
+    worker = Worker(args.coordinator, templates, client, slots=args.slots, token=args.token, worker_id=args.id,
+                    validators=validators, profiles=profiles)
+    print(f"[*] Worker {worker.id} connecting to {args.coordinator}")
+    try:
+        units = worker.run()
+    except DistributedError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n[!] Interrupted")
+        sys.exit(130)
+    finally:
+        client.close()
+        close_validator_store(validators)
+    print(f"[*] Worker done: {units} work units")
+
+def run_serve(args):
+    """Keep templates, V8 contexts and connections warm and scan whatever clients submit"""
+    from core.daemon import DaemonError, ScanDaemon, parse_address
+
+    kind, *where = parse_address(args.listen)
+    if not args.token and kind == 'tcp' and where[0] not in ('127.0.0.1', 'localhost', '::1'):
+        logger.warning("Daemon reachable from the network without --token; anyone can submit scans")
+    # Metrics must be on before the client is built to time connections
+    stop_metrics = start_metrics(args)
+    client = make_client(args)
+    validators = open_validator_store(args)
+    runner = open_exploit_runner(args, client)
+    try:
+        daemon = ScanDaemon(
+            args.templates,
+            client,
+            address=args.listen,
+            slots=args.jobs,
+            token=args.token,
+            use_cache=not args.no_cache,
+            cache_size=args.cache_size * 1024 * 1024,
+            validators=validators,
+            exploits=runner,
+        )
+    except DaemonError as e:
+        close_exploit_runner(runner)
+        client.close()
+        close_validator_store(validators)
+        stop_metrics()
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    previous_handler = signal.signal(signal.SIGTERM, terminate)
+    print(f"[*] Daemon on {daemon.url}: {len(daemon.templates)} templates, {daemon.slots} job slots")
+    try:
+        with daemon:
+            daemon.wait()
+    except KeyboardInterrupt:
+        print("\n[!] Stopping")
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        close_exploit_runner(runner)
+        client.close()
+        close_validator_store(validators)
+        stop_metrics()
+
+def print_record(record, as_json=False):
+    """Print one result record streamed by the daemon"""
+    if as_json:
+        print(json.dumps(record, separators=(',', ':')), flush=True)
+        return
+    scan = record['scan']
+    print(f"[+] {scan['template_id']} matched {scan['target']}")
+    for finding in scan['results']:
+        print(f"    {finding.get('method', '')} {finding.get('target_url', '')} -> {finding.get('status_code')}")
+        for detail in finding.get('match_details') or ():
+            print(f"      {detail}")
+        for value in finding.get('extracted_data') or ():
+            print(f"      extracted: {value}")
+    if 'exploit' in record:
+        status = 'succeeded' if record['exploit'].get('success') else 'failed'
+        print(f"    exploit {status}")
+    sys.stdout.flush()
+
+def follow_job(client, job_id, args):
+    """
+    Print a job's records until it ends; Ctrl-C cancels the job
+
+    Returns:
+        dict: The job's final status
+    """
+    try:
+        for item in client.results(job_id):
+            if 'record' in item:
+                print_record(item['record'], as_json=args.json)
+            else:
+                return item['job']
+    except KeyboardInterrupt:
+        client.cancel(job_id)
+        print(f"\n[!] Interrupted; job {job_id} cancelled")
+        sys.exit(130)
+
+def run_client(args):
+    """Talk to a running serve daemon"""
+    from core.daemon import DaemonClient, DaemonError
+
+    client = DaemonClient(args.daemon, token=args.token)
+    try:
+        if args.action == 'scan':
+            targets = list(args.target)
+            if args.targets:
+                from core.batch import read_targets
+                targets += read_targets(args.targets)
+            if not targets:
+                print("Error: --target or --targets is required")
+                sys.exit(1)
+            job = client.submit(
+                targets,
+                templates=split_csv(args.template_id),
+                tags=split_csv(args.tags),
+                severity=split_csv(args.severity),
+                baseline=not args.no_baseline,
+                exploit=not args.no_exploit,
+            )
+            if args.detach:
+                print(job['id'])
+                return
+            job = follow_job(client, job['id'], args)
+        elif args.action == 'results':
+            job = follow_job(client, args.job, args)
+        elif args.action == 'status':
+            status = client.job(args.job) if args.job else client.status()
+            print(json.dumps(status, indent=2))
+            return
+        elif args.action == 'cancel':
+            job = client.cancel(args.job)
+            print(f"[*] Job {job['id']} {'cancelled' if job['state'] in ('queued', 'running') else job['state']}")
+            return
+        else:
+            print(f"[*] Daemon loaded {client.reload()} templates")
+            return
+    except DaemonError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+    elapsed = (job['finished'] or 0) - (job['started'] or job['created'])
+    if not args.json:
+        print(f"[*] Job {job['id']} {job['state']}: {job['finished_scans']}/{job['total_scans']} scans "
+              f"({job['skipped_scans']} skipped), {job['findings']} vulnerable in {max(elapsed, 0):.2f}s")
+    if job['state'] == 'failed':
+        print(f"Error: {job['error']}")
+    if job['state'] != 'done':
+        sys.exit(1)
+    if args.fail_on_findings and job['findings']:
+        sys.exit(2)
+
+def run_results(args):
+    """Index new result files, then answer the query"""
+    from core.results_db import DEFAULT_DB_NAME, ResultsDbError, ResultsIndex, parse_time
+
+    try:
+        filters = {
+            'template': split_csv(args.template),
+            'host': split_csv(args.host),
+            'severity': split_csv(args.severity),
+            'since': parse_time(args.since),
+            'until': parse_time(args.until),
+            'vulnerable': not args.all,
+        }
+        with ResultsIndex(args.db or Path(args.dir) / DEFAULT_DB_NAME) as index:
+            if not args.no_ingest:
+                index.ingest(args.dir)
+
+            if args.count_by:
+                for key, count in index.count_by(args.count_by, **filters):
+                    print(f"{count:>8}  {key}")
+                return
+
+            for row in index.query(limit=args.limit, **filters):
+                status = 'vulnerable' if row['vulnerable'] else 'clean'
+                print(f"{row['timestamp'] or '-':<26} {row['severity'] or '-':<8} "
+                      f"{row['template_id']:<32} {row['target'] or '-'} [{status}]")
+                if args.details:
+                    for finding in index.findings(row['scan_id']):
+                        print(f"    {finding['method']} {finding['url']} -> {finding['status_code']}")
+                        for detail in finding['match_details']:
+                            print(f"      {detail}")
+                        for value in finding['extracted_data']:
+                            print(f"      extracted: {value}")
+    except ResultsDbError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def run_scan_command(args):
+    """Run one template, or every template in a directory, against one target"""
+    from core.baseline import fingerprint
+    from core.metrics import TemplateProfiler
+    from core.response_cache import ResponseCache
+    from core.scanner import run_scan
+
+    logger.info(f"Starting scan against {args.target} using template {args.template}")
+    print(f"[*] Loading template: {args.template}")
+    
+    if os.path.isdir(args.template):
+        templates = load_templates(args.template)
+    else:
+        templates = [t for t in [load_template(args.template)] if t]
+    if not templates:
+        print(f"Error: Failed to load template {args.template}")
+        sys.exit(1)
+
+    check_archive_options(args)
+    # Metrics must be on before the client is built to time connections
+    stop_metrics = start_metrics(args, total=len(templates))
+    profiler = TemplateProfiler(args.profile) if args.profile else None
+
+    cache = None
+    recorder = None
+    if args.replay:
+        # The baseline's random paths and the exploits' requests were never recorded
+        client = open_replay_client(args.replay)
+        print(f"[*] Replaying responses from {args.replay}; nothing is sent")
+    else:
+        # One cache for the whole run, so templates share identical requests
+        cache = ResponseCache(args.cache_size * 1024 * 1024) if args.cache_size > 0 else None
+        recorder = open_archive_writer(args)
+        client = make_client(args, cache=cache, archive=recorder)
+
+    validators = open_validator_store(args)
+    # Initialize result logger
+    result_logger = open_result_logger(args)
+    # Exploits run alongside the remaining templates and are saved at the end
+    runner = None if args.replay else open_exploit_runner(args, client)
+    pending = []
+
+    try:
+        profile = None
+        if not args.no_baseline and not args.replay:
+            # Its requests go through the cache, so templates reuse the root page
+            profile = fingerprint(args.target, client)
+            if profile.technologies:
+                print(f"[*] Target runs {', '.join(sorted(profile.technologies))}")
+            if profile.signatures:
+                print("[*] Target answers missing paths with a soft-404 page; such responses are not matched")
+        for template in templates:
+            reason = profile.skip_reason(template) if profile is not None else None
+            if reason:
+                print(f"[-] Skipping {template.id}: target {reason}")
+                continue
+            print(f"[*] Scanning {args.target} using {template.info.get('name', 'Unknown')}...")
+            if profiler is not None:
+                with profiler.profile(template.id):
+                    scan_result = run_scan(args.target, template, client=client, validators=validators,
+                                           profile=profile)
+            else:
+                scan_result = run_scan(args.target, template, client=client, validators=validators,
+                                       profile=profile)
+
+            # Print results
+            print_scan_result(scan_result)
+
+            # Run exploit if vulnerable
+            if scan_result.vulnerable and template.exploit_module and runner is not None:
+                print(f"[*] Running exploit module {template.exploit_module}...")
+                pending.append((scan_result, runner.submit(template.exploit_module, args.target, scan_result)))
+                continue
+
+            # Save results
+            output_file = result_logger.save_result(scan_result)
+            if output_file:
+                print(f"[+] Results saved to {output_file}")
+
+        for scan_result, future in pending:
+            exploit_result = runner.result(future)
+            status = 'succeeded' if exploit_result.get('success') else 'failed'
+            print(f"[*] Exploit for {scan_result.template_id} {status}")
+            output_file = result_logger.save_result(scan_result, exploit_result)
+            if output_file:
+                print(f"[+] Results saved to {output_file}")
+    finally:
+        close_exploit_runner(runner)
+        if args.replay:
+            stats = client.archive.stats()
+            logger.info(f"Archive {args.replay}: {stats['hits']} responses replayed, {stats['misses']} not recorded")
+        client.close()
+        close_archive_writer(recorder)
+        result_logger.close()
+        close_validator_store(validators)
+        stop_metrics()
+
+    if cache is not None:
+        stats = cache.stats()
+        logger.info(
+            f"Response cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['coalesced']} coalesced, {stats['evictions']} evictions"
+        )
+
 def main():
     """Main entry point"""
-    setup_directories()
     args = parse_args()
     
     # Setup logging level based on verbosity
-    if args.debug:
+    if getattr(args, 'debug', False):
         logging.getLogger().setLevel(logging.DEBUG)
-    elif args.verbose:
+    elif getattr(args, 'verbose', False):
         logging.getLogger().setLevel(logging.INFO)
     
-    if args.command == 'list':
-        templates = load_templates()
+    if args.command == 'results':
+        run_results(args)
+
+    elif args.command == 'list':
+        templates = load_templates(
+            args.templates,
+            tags=split_csv(args.tags),
+            severity=split_csv(args.severity),
+            use_cache=not args.no_cache,
+        )
         print("\nAvailable Templates:")
         for template in templates:
             print(f"\nID: {template.id}")
             print(f"Name: {template.info.get('name', 'N/A')}")
             print(f"Author: {template.info.get('author', 'N/A')}")
             print(f"Severity: {template.info.get('severity', 'N/A')}")
-            print(f"Tags: {', '.join(template.info.get('tags', []))}")
+            print(f"Tags: {', '.join(template.tags)}")
             print(f"Reference: {template.info.get('reference', 'N/A')}")
             print("-" * 50)
     
     elif args.command == 'scan':
-        logger.info(f"Starting scan against {args.target} using template {args.template}")
-        print(f"[*] Loading template: {args.template}")
-        
-        template = load_template(args.template)
-        if not template:
-            print(f"Error: Failed to load template {args.template}")
-            sys.exit(1)
-
-        print(f"[*] Scanning {args.target} using {template.info.get('name', 'Unknown')}...")
-        scan_result = run_scan(args.target, template)
-
-        # Print results
-        print_scan_result(scan_result)
-
-        # Initialize result logger
-        result_logger = ResultLogger(args.output or 'results')
-        
-        # Run exploit if vulnerable
-        exploit_result = None
-        if scan_result.vulnerable and hasattr(template, 'exploit_module'):
-            print("[*] Running exploit module...")
-            exploit_result = run_exploit(template.exploit_module, args.target, scan_result)
-
-        # Save results
-        output_file = result_logger.save_result(scan_result, exploit_result)
-        if output_file:
-            print(f"[+] Results saved to {output_file}")
+        run_scan_command(args)
+    elif args.command == 'batch':
+        run_batch(args)
+    elif args.command == 'coordinator':
+        run_coordinator(args)
+    elif args.command == 'worker':
+        run_worker(args)
+    elif args.command == 'serve':
+        run_serve(args)
+    elif args.command == 'client':
+        run_client(args)
     else:
         logger.error("No command specified")
         sys.exit(1)
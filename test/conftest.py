@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.loader import load_template
+
+TWO_STEPS = """
+id: two-steps
+info:
+  name: Two steps sharing a random value
+  author: test
+  severity: info
+variables:
+  marker: "{{rand_int(100000, 999999)}}"
+http:
+  - method: GET
+    path:
+      - "{{BaseURL}}/?step=0&m={{marker}}"
+    matchers:
+      - type: word
+        part: body
+        words:
+          - "m={{marker}}"
+  - method: GET
+    path:
+      - "{{BaseURL}}/?step=1&m={{marker}}"
+    matchers:
+      - type: word
+        part: body
+        words:
+          - "m={{marker}}"
+"""
+
+PAYLOADS = """
+id: many-payloads
+info:
+  name: Many payloads
+  author: test
+  severity: info
+http:
+  - method: GET
+    path:
+      - "{{BaseURL}}/?p={{value}}"
+    payloads:
+      value:
+{values}
+{stop}    matchers:
+      - type: word
+        part: body
+        words:
+          - "p=7"
+"""
+
+@pytest.fixture
+def write_template(tmp_path):
+    """Write template text to a file in tmp_path and load it from there"""
+    def write(name, text):
+        path = tmp_path / name
+        path.write_text(text)
+        return load_template(str(path))
+    return write
+
+@pytest.fixture
+def two_steps_template(write_template):
+    """Two steps whose requests and matchers share one random marker"""
+    return write_template('two-steps.yaml', TWO_STEPS)
+
+@pytest.fixture
+def payloads_template(write_template):
+    """Factory for a one-step template with payloads "0" to "count - 1", matching "p=7" """
+    def make(count, stop_at_first_match=False):
+        values = ''.join(f"        - \"{n}\"\n" for n in range(count))
+        stop = '    stop-at-first-match: true\n' if stop_at_first_match else ''
+        return write_template('payloads.yaml', PAYLOADS.replace('{values}', values).replace('{stop}', stop))
+    return make
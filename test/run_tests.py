@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
-import os
 import sys
 import subprocess
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.loader import load_template
+from core.scanner import run_scan
+
 def setup_test_env():
     """Setup test environment"""
     # Create test directories
@@ -17,22 +22,9 @@ def setup_test_env():
         with open(template_path, 'r') as src, open(test_template_path, 'w') as dst:
             dst.write(src.read())
 
-def run_php_server():
-    """Start PHP development server"""
-    php_path = 'php'  # Make sure PHP is in your PATH
-    server_cmd = [php_path, '-S', 'localhost:8000', '-t', 'test']
-    
-    try:
-        # Start PHP server in background
-        server = subprocess.Popen(
-            server_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        return server
-    except Exception as e:
-        print(f"Failed to start PHP server: {e}")
-        sys.exit(1)
+def run_test_server():
+    """Start the in-process target server"""
+    return BenchServer(port=8000).start()
 
 def run_pentoscan():
     """Run PentoScan against test server"""
@@ -59,33 +51,25 @@ def run_pentoscan():
     except Exception as e:
         print(f"Failed to run PentoScan: {e}")
 
-def test_cookies_without_secure(tmp_path, httpserver):
+def test_cookies_without_secure():
     """Test detection of cookies without Secure attribute."""
-    # Set up test server with both secure and non-secure cookies
-    httpserver.expect_request("/").respond_with_data(
-        "", headers=[
-            ("Set-Cookie", "foo=bar"),
-            ("Set-Cookie", "secure=1; Secure")
-        ]
-    )
-    
-    # Run scan
-    results = run_scan(
-        target=httpserver.url,
-        template_path="templates/cookies-without-secure.yaml"
-    )
+    # The test server sets one cookie without and one with the Secure flag
+    with BenchServer() as server:
+        template = load_template("templates/cookies-without-secure.yaml")
+        result = run_scan(server.url, template)
     
     # Verify results
-    cookie_names = [r["cookie_name"] for r in results]
-    assert "foo" in cookie_names, "Should detect non-secure cookie"
-    assert "secure" not in cookie_names, "Should not detect secure cookie"
+    cookie_names = [name for r in result.results for name in r.get("extracted_data", [])]
+    assert result.vulnerable, "Should flag the response"
+    assert "session" in cookie_names, "Should detect non-secure cookie"
+    assert "csrf" not in cookie_names, "Should not detect secure cookie"
 
 def main():
     print("Setting up test environment...")
     setup_test_env()
     
-    print("\nStarting PHP test server...")
-    server = run_php_server()
+    print("\nStarting test server...")
+    server = run_test_server()
     
     try:
         print("\nRunning PentoScan...")
@@ -93,9 +77,8 @@ def main():
         
         print("\nTest completed. Check test/results/ for output files.")
     finally:
-        print("\nStopping PHP server...")
-        server.terminate()
-        server.wait()
+        print("\nStopping test server...")
+        server.stop()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
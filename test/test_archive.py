@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.archive import ArchiveError, ArchiveMiss, ArchiveWriter, ReplayClient, ResponseArchive
+from core.http_client import HttpClient, HttpResponse
+from core.scanner import run_scan
+
+def response(url, body, status=200):
+    return HttpResponse(url, status, {'Content-Type': 'text/html'}, body,
+                        header_list=[('Content-Type', 'text/html'), ('Set-Cookie', 'a=1'), ('Set-Cookie', 'b=2')],
+                        transport='http/1.1')
+
+def test_recorded_scan_replays_without_the_network(tmp_path, two_steps_template):
+    template = two_steps_template
+    archive = tmp_path / 'archive'
+    with BenchServer() as server:
+        target = server.url.rstrip('/')
+        with ArchiveWriter(archive) as writer, HttpClient(archive=writer) as client:
+            recorded = run_scan(target, template, client=client)
+        sent = server.requests
+    assert recorded.vulnerable and writer.stats()['responses'] == sent == 2
+
+    # The server is gone; the random marker comes back from the archive
+    with ReplayClient(ResponseArchive(archive)) as client:
+        assert client.archive.targets() == [target]
+        marker = client.archive.variables(target, template.id)['marker']
+        replayed = run_scan(target, template, client=client)
+        assert client.archive.stats() == {'hits': 2, 'misses': 0}
+    urls = [f.target_url for f in replayed.results]
+    assert urls == [f.target_url for f in recorded.results]
+    assert urls == [f"{target}/?step={step}&m={marker}" for step in (0, 1)]
+
+def test_responses_round_trip(tmp_path):
+    with ArchiveWriter(tmp_path) as writer:
+        writer.record('get', 'http://a/x', {'X-A': '1'}, None, False, response('http://a/x', b'page' * 100))
+        writer.record('GET', 'http://a/y', None, None, False, response('http://a/y', b'page' * 100, status=404))
+        skipped = response('http://a/z', b'')
+        skipped.body_read = False
+        writer.record('GET', 'http://a/z', None, None, False, skipped)
+    # Identical bodies are stored once, compressed
+    stats = writer.stats()
+    assert (stats['responses'], stats['bodies'], stats['body_bytes']) == (3, 1, 400)
+    assert stats['stored_bytes'] < 400
+
+    with ResponseArchive(tmp_path) as archive:
+        # Requests are keyed like the response cache: case and header spelling do not matter
+        replayed = archive.response('GET', 'http://A/x', {'x-a': '1'})
+        assert (replayed.status_code, replayed.content, replayed.transport) == (200, b'page' * 100, 'http/1.1')
+        assert [v for k, v in replayed.header_list if k == 'Set-Cookie'] == ['a=1', 'b=2']
+        head = archive.response('GET', 'http://a/y', read_body=lambda head: head.status_code != 404)
+        assert head.status_code == 404 and not head.body_read
+        assert not archive.response('GET', 'http://a/z').body_read
+        with pytest.raises(ArchiveMiss):
+            archive.response('GET', 'http://a/x')
+        assert archive.stats() == {'hits': 3, 'misses': 1}
+
+def test_writers_share_an_archive(tmp_path):
+    def record(name):
+        with ArchiveWriter(tmp_path) as writer:
+            for n in range(600):
+                writer.record('GET', f"http://{name}/{n}", None, None, False,
+                              response(f"http://{name}/{n}", f"{name} {n % 10}".encode()))
+    threads = [threading.Thread(target=record, args=(name,)) for name in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with ResponseArchive(tmp_path) as archive:
+        assert archive.response('GET', 'http://a/599').content == b'a 9'
+        assert archive.response('GET', 'http://b/0').content == b'b 0'
+        assert len(list((tmp_path / 'segments').iterdir())) == 2
+
+def test_archive_errors(tmp_path):
+    with pytest.raises(ArchiveError, match='No archive'):
+        ResponseArchive(tmp_path / 'missing')
+    ArchiveWriter(tmp_path).close()
+    conn = sqlite3.connect(str(tmp_path / 'index.sqlite'))
+    conn.execute('PRAGMA user_version=99')
+    conn.close()
+    with pytest.raises(ArchiveError, match='Unsupported archive version 99'):
+        ResponseArchive(tmp_path)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import socket
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.baseline import ProfileCache, Soft404Signature, TargetProfile, detect_technologies, fingerprint
+from core.http_client import HttpClient, HttpResponse
+from core.scanner import run_scan
+
+PROBE = """
+id: admin-panel
+info:
+  name: Admin panel
+  author: test
+  severity: info
+http:
+  - method: GET
+    path:
+      - "{{BaseURL}}/admin"
+      - "{{BaseURL}}/swagger-ui.html"
+    matchers:
+      - type: status
+        status:
+          - 200
+"""
+
+def page(body, status=200, content_type='text/html'):
+    return HttpResponse('http://a/', status, {'Content-Type': content_type}, body.encode())
+
+def test_missing_pages_that_answer_200_are_learned():
+    with BenchServer(catch_all=True) as server, HttpClient() as client:
+        profile = fingerprint(server.url, client)
+        missing = client.request('GET', f"{server.url}admin")
+        swagger = client.request('GET', f"{server.url}swagger-ui.html")
+        root = client.request('GET', server.url)
+    [signature] = profile.signatures
+    assert (signature.status_code, signature.content_type) == (200, 'text/html')
+    assert profile.variables()['soft_404'] is True
+    assert profile.is_soft_404(f"{server.url}admin", missing)
+    assert not profile.is_soft_404(f"{server.url}swagger-ui.html", swagger)
+    # The target's own page is never a soft 404
+    assert not profile.is_soft_404(server.url, root)
+
+def test_real_404s_leave_no_signature():
+    with BenchServer() as server, HttpClient() as client:
+        profile = fingerprint(server.url, client)
+        missing = client.request('GET', f"{server.url}admin")
+    assert profile.reachable and profile.signatures == []
+    assert not profile.is_soft_404(f"{server.url}admin", missing)
+    assert 'TRACE' in profile.allowed_methods
+    # http.server names itself in the Server header
+    assert 'python' in profile.technologies
+
+def test_soft_404_responses_are_not_matched(write_template):
+    template = write_template('admin.yaml', PROBE)
+    with BenchServer(catch_all=True) as server, HttpClient() as client:
+        profile = fingerprint(server.url, client)
+        unfiltered = run_scan(server.url, template, client=client)
+        filtered = run_scan(server.url, template, client=client, profile=profile)
+    assert sorted(f.target_url.rsplit('/', 1)[1] for f in unfiltered.results) == ['admin', 'swagger-ui.html']
+    assert [f.target_url.rsplit('/', 1)[1] for f in filtered.results] == ['swagger-ui.html']
+
+def test_signatures_echoing_the_path_or_a_varying_value():
+    signature = Soft404Signature(200, 'text/html')
+    signature.add(page('<p>No page /abc123xyz here, id 1</p>'), '/abc123xyz')
+    assert signature.matches(page('<p>No page /admin here, id 1</p>'), '/admin')
+    assert not signature.matches(page('<p>No page /admin here, id 12</p>'), '/admin')
+    assert not signature.matches(page('<p>No page /admin here, id 1</p>', status=404), '/admin')
+    assert not signature.matches(page('{}', content_type='application/json'), '/admin')
+    # Probes that differ from each other allow bodies of a similar length
+    signature.add(page('<p>No page /qwe987rty here, id 1234</p>'), '/qwe987rty')
+    assert signature.matches(page('<p>No page /admin here, id 12</p>'), '/admin')
+    assert not signature.matches(page('<p>Welcome to the admin console of this site</p>'), '/admin')
+
+def test_skip_reasons():
+    profile = TargetProfile('http://a')
+    profile.technologies = frozenset(detect_technologies(
+        HttpResponse('http://a/', 200, {}, b'', header_list=[('Set-Cookie', 'PHPSESSID=1; Path=/')])))
+    assert profile.technologies == {'php'}
+    assert profile.skip_reason(SimpleNamespace(tags=['aspnet', 'rce'])) == 'runs php, not asp.net'
+    assert profile.skip_reason(SimpleNamespace(tags=['php'])) is None
+    # Servers do not rule each other out: a proxy may sit in front
+    assert profile.skip_reason(SimpleNamespace(tags=['nginx'])) is None
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    with HttpClient() as client:
+        closed = fingerprint(f"http://127.0.0.1:{port}", client)
+    assert not closed.reachable
+    assert closed.skip_reason(SimpleNamespace(tags=[])) == 'unreachable (ConnectionError)'
+
+def test_targets_are_fingerprinted_once():
+    with BenchServer() as server, HttpClient() as client:
+        cache = ProfileCache(client)
+        profiles = cache.prefetch([server.url, server.url])
+        sent = server.requests
+        assert cache.get(server.url) is profiles[server.url]
+        assert server.requests == sent == 4
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.batch import BatchScheduler, build_work_queue, payload_chunks, read_targets
+
+def test_read_targets(tmp_path):
+    source = tmp_path / 'targets.txt'
+    source.write_text("# comment\nexample.com\n\nhttp://example.com\nhttps://other.test/app\nexample.com\n")
+    assert read_targets(str(source)) == ['http://example.com', 'https://other.test/app']
+
+def test_payload_chunks_split_large_steps(payloads_template):
+    template = payloads_template(10)
+    assert payload_chunks(template, chunk_size=4) == [[(0, 4), (4, 8), (8, 10)]]
+    assert payload_chunks(template, chunk_size=10) == [[None]]
+
+def test_work_queue_spreads_targets(payloads_template):
+    template = payloads_template(4)
+    plan = {template.path: payload_chunks(template, chunk_size=2)}
+    units = list(build_work_queue(['http://a', 'http://b'], [template], plan))
+    assert units == [
+        ('http://a', template.path, 0, (0, 2)),
+        ('http://b', template.path, 0, (0, 2)),
+        ('http://a', template.path, 0, (2, 4)),
+        ('http://b', template.path, 0, (2, 4)),
+    ]
+
+def test_chunked_scan_merges_into_one_result(payloads_template):
+    template = payloads_template(10)
+    results = []
+    with BenchServer() as server:
+        scheduler = BatchScheduler([server.url], [template], workers=2, chunk_size=3)
+        executed = scheduler.run(lambda target, result: results.append(result))
+    assert executed == 4
+    [result] = results
+    assert result.vulnerable
+    assert [finding.target_url for finding in result.results] == [f"{server.url}?p=7"]
+
+def test_units_of_a_pair_share_template_variables(two_steps_template):
+    template = two_steps_template
+    results = []
+    with BenchServer() as server:
+        scheduler = BatchScheduler([server.url], [template], workers=2)
+        assert scheduler.total_units == 2
+        scheduler.run(lambda target, result: results.append(result))
+    [result] = results
+    markers = {re.search(r'm=(\d+)', finding.target_url).group(1) for finding in result.results}
+    assert len(result.results) == 2
+    assert len(markers) == 1, "Both steps should send the same random value"
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+from argparse import Namespace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.run_bench import bench_matchers, bench_template_load, bench_templates, compare, percentile
+from bench.server import BenchServer
+from core.http_client import HttpClient
+from core.loader import load_template
+
+TEMPLATES = Path(__file__).resolve().parent.parent / 'templates'
+
+def test_server_answers_what_templates_probe():
+    with BenchServer(body_size=1000) as server, HttpClient() as client:
+        root = client.request('GET', server.url)
+        assert root.status_code == 200 and len(root.content) == 1000
+        assert [v for k, v in root.header_list if k == 'Set-Cookie'][1].endswith('Secure')
+        assert client.request('GET', f"{server.url}?id=1'").status_code == 500
+        assert b'SQL syntax' in client.request('GET', f"{server.url}?id=1'").content
+        assert b'Swagger UI' in client.request('GET', f"{server.url}swagger-ui.html").content
+        assert client.request('GET', f"{server.url}?file=../etc/passwd").content.startswith(b'root:x:0:0')
+        assert client.request('TRACE', server.url).text.startswith('TRACE / HTTP/1.1')
+        assert 'TRACE' in client.request('OPTIONS', server.url).headers['Allow']
+        assert client.request('GET', f"{server.url}missing").status_code == 404
+        assert server.requests == 8
+
+    with BenchServer(catch_all=True, cookies=False, sql_errors=False) as server, HttpClient() as client:
+        page = client.request('GET', f"{server.url}missing")
+        assert page.status_code == 200 and 'Set-Cookie' not in page.headers
+        assert client.request('GET', f"{server.url}?id=1'").status_code == 200
+
+def test_benchmark_sections_report_numbers(tmp_path, capsys):
+    assert percentile([], 50) is None
+    assert percentile(list(range(1, 101)), 50) == 50
+    assert percentile(list(range(1, 101)), 99) == 99
+
+    templates = [load_template(str(TEMPLATES / 'sqli-error-based.yaml'))]
+    with BenchServer() as server:
+        results = bench_templates(server, templates, Namespace(rounds=2, concurrency=4))
+    [(template_id, result)] = results.items()
+    assert template_id == 'sqli-error-based'
+    assert result['vulnerable'] and result['requests'] > 0 and result['p99_ms'] >= result['p50_ms']
+
+    matchers = bench_matchers(str(TEMPLATES / 'sqli-error-based.yaml'), 1024, 5)
+    assert set(matchers) == {'match', 'no_match'}
+    load = bench_template_load(20)
+    assert load['templates'] == 20 and load['warm_cache_ms'] >= 0
+
+    current = {'templates': results, 'matchers': matchers, 'template_load': load, 'peak_rss_mb': 100.0}
+    earlier = tmp_path / 'earlier.json'
+    halved = {'templates': {template_id: {**result, 'requests_per_sec': result['requests_per_sec'] / 2}},
+              'matchers': matchers, 'template_load': load, 'peak_rss_mb': 90.0, 'commit': 'abc123'}
+    earlier.write_text(json.dumps(halved))
+    compare(current, str(earlier))
+    out = capsys.readouterr().out
+    assert '(abc123)' in out
+    assert 'req/s +100.0%' in out
+    assert '+10.0 MB' in out
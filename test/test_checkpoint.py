@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import json
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.batch import BatchScheduler
+from core.checkpoint import Checkpoint, CheckpointError, RangeSet, checkpoint_path, new_run_id
+
+def test_range_set_merges_adjacent_and_overlapping_ranges():
+    ranges = RangeSet()
+    for value in (5, 0, 1, 3, 2, 9):
+        ranges.add(value)
+    assert ranges.to_list() == [[0, 4], [5, 6], [9, 10]]
+    ranges.add_range(4, 9)
+    assert ranges.to_list() == [[0, 10]]
+    ranges.add_range(12, 15)
+    ranges.add_range(11, 13)
+    assert ranges.to_list() == [[0, 10], [11, 15]]
+    assert len(ranges) == 14
+    assert 9 in ranges and 14 in ranges
+    assert 10 not in ranges and 15 not in ranges and -1 not in ranges
+    assert RangeSet(ranges.to_list()).to_list() == ranges.to_list()
+
+def test_save_and_load_round_trip(tmp_path):
+    spec = {'queue': 'abc', 'templates': 'templates'}
+    checkpoint = Checkpoint.create(tmp_path, 'run1', spec, ['http://a', 'http://b'])
+    key = ('http://a', 'templates/x.yaml')
+    finding = {'target_url': 'http://a/?m=1', 'method': 'GET', 'status_code': 200}
+    checkpoint.completed.add_range(0, 3)
+    checkpoint.partial[key] = {'vulnerable': True, 'results': [finding]}
+    checkpoint.partial[('http://b', 'templates/x.yaml')] = {'vulnerable': False, 'results': []}
+    checkpoint.stopped.add(key + (0,))
+    checkpoint.variables[key] = {'marker': '123456'}
+    checkpoint.deferred[('http://b', 'y')] = {'target': 'http://b', 'template_id': 'y', 'vulnerable': True}
+    checkpoint.emitted = 2
+    checkpoint.save()
+    assert new_run_id(tmp_path) != 'run1'
+
+    loaded = Checkpoint.load(tmp_path, 'run1')
+    assert loaded.spec == spec
+    assert loaded.targets() == ['http://a', 'http://b']
+    assert loaded.completed.to_list() == [[0, 3]]
+    # Pairs without findings are not kept
+    assert loaded.partial == {key: {'vulnerable': True, 'results': [finding]}}
+    assert loaded.stopped == {key + (0,)}
+    assert loaded.variables == {key: {'marker': '123456'}}
+    assert loaded.deferred == checkpoint.deferred
+    assert loaded.emitted == 2
+
+    loaded.finish()
+    with pytest.raises(CheckpointError, match='already completed'):
+        Checkpoint.load(tmp_path, 'run1')
+    assert not loaded.targets_path.exists()
+
+def test_unusable_checkpoints_are_refused(tmp_path):
+    with pytest.raises(CheckpointError, match='No checkpoint'):
+        Checkpoint.load(tmp_path, 'missing')
+    Checkpoint.create(tmp_path, 'old', {}, []).save()
+    with pytest.raises(CheckpointError, match='already has a checkpoint'):
+        Checkpoint.create(tmp_path, 'old', {}, [])
+    path = checkpoint_path(tmp_path, 'old')
+    state = json.loads(path.read_text())
+    path.write_text(json.dumps({**state, 'version': 1}))
+    with pytest.raises(CheckpointError, match='incompatible version'):
+        Checkpoint.load(tmp_path, 'old')
+
+def test_resumed_pair_keeps_its_template_variables(tmp_path, two_steps_template):
+    template = two_steps_template
+    results = []
+    with BenchServer() as server:
+        scheduler = BatchScheduler([server.url], [template], workers=1)
+        # Interrupted after step 0 matched with the random value 123456
+        checkpoint = Checkpoint.create(tmp_path, 'run', {'queue': scheduler.fingerprint()}, [server.url])
+        key = (server.url, template.path)
+        checkpoint.completed.add(0)
+        checkpoint.partial[key] = {'vulnerable': True, 'results': [
+            {'target_url': f"{server.url}/?step=0&m=123456", 'method': 'GET', 'status_code': 200}]}
+        checkpoint.variables[key] = {'marker': '123456'}
+        checkpoint.save()
+
+        resumed = Checkpoint.load(tmp_path, 'run')
+        assert scheduler.run(lambda target, result: results.append(result), checkpoint=resumed) == 1
+    [result] = results
+    assert [re.search(r'step=(\d)&m=(\d+)', f.target_url).groups() for f in result.results] == [
+        ('0', '123456'), ('1', '123456')]
+    assert resumed.variables == {}
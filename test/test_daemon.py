@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.daemon import DaemonClient, DaemonError, ScanDaemon
+from core.http_client import HttpClient
+
+TEMPLATES = Path(__file__).resolve().parent.parent / 'templates'
+
+@pytest.fixture
+def template_dir(tmp_path):
+    directory = tmp_path / 'templates'
+    directory.mkdir()
+    # One javascript template, so job slots warm V8 contexts at start-up
+    for name in ('cookies-without-secure.yaml', 'sqli-error-based.yaml'):
+        shutil.copy(TEMPLATES / name, directory / name)
+    return directory
+
+def run_job(daemon, target, **kwargs):
+    with DaemonClient(daemon.url, token=daemon.token, timeout=30) as client:
+        job = client.submit([target], **kwargs)
+        items = list(client.results(job['id']))
+    return [item['record'] for item in items[:-1]], items[-1]['job']
+
+@pytest.mark.parametrize('kind', ['tcp', 'unix'])
+def test_daemon_runs_a_job(template_dir, tmp_path, kind):
+    address = 'http://127.0.0.1:0' if kind == 'tcp' else f"unix:{tmp_path / 'daemon.sock'}"
+    with BenchServer() as server, HttpClient() as client, \
+            ScanDaemon(str(template_dir), client, address=address, slots=2, use_cache=False) as daemon:
+        records, job = run_job(daemon, server.url, baseline=False)
+
+    assert job['state'] == 'done'
+    assert job['finished_scans'] == job['total_scans'] == 2
+    matched = {record['scan']['template_id'] for record in records}
+    assert matched == {'cookies-without-secure', 'sqli-error-based'}
+    cookies = next(r for r in records if r['scan']['template_id'] == 'cookies-without-secure')
+    # Only the cookie without the Secure attribute is reported
+    assert [v for f in cookies['scan']['results'] for v in f['extracted_data']] == ['session']
+
+def test_daemon_job_selection_and_token(template_dir):
+    with BenchServer() as server, HttpClient() as client, \
+            ScanDaemon(str(template_dir), client, address='http://127.0.0.1:0', token='secret',
+                       use_cache=False) as daemon:
+        records, job = run_job(daemon, server.url, templates=['sqli-error-based'], baseline=False)
+        assert job['total_scans'] == 1
+        assert [r['scan']['template_id'] for r in records] == ['sqli-error-based']
+
+        with DaemonClient(daemon.url, token='wrong') as intruder:
+            with pytest.raises(DaemonError, match='Invalid token'):
+                intruder.status()
+        with DaemonClient(daemon.url, token='secret') as client:
+            with pytest.raises(DaemonError, match='Unknown templates'):
+                client.submit([server.url], templates=['missing'])
+            status = client.status()
+        assert status['templates'] == 2
+        assert status['jobs']['done'] == 1
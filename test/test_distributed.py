@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import re
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.distributed import Coordinator, DistributedError, Worker
+from core.http_client import HttpClient
+from core.loader import load_template
+
+def found(url):
+    return {'vulnerable': True, 'results': [{'target_url': url, 'method': 'GET', 'status_code': 200}]}
+
+def coordinator(targets, templates, results, **kwargs):
+    return Coordinator(targets, templates, lambda target, result: results.append((target, result)),
+                       port=0, **kwargs)
+
+def test_leases_are_per_host(payloads_template):
+    template = payloads_template(6)
+    results = []
+    with coordinator(['http://a', 'http://b'], [template], results, lease_size=2, chunk_size=2) as c:
+        first = c.lease('w1')
+        second = c.lease('w2')
+        # a's other chunk stays queued while w1 holds the host
+        assert [unit[1] for unit in first['units']] == ['http://a', 'http://a']
+        assert [unit[1] for unit in second['units']] == ['http://b', 'http://b']
+        assert c.lease('w3') == {'wait': True}
+        assert c.status()['leases'] == 2
+
+def test_split_pair_shares_variables_across_leases(two_steps_template):
+    template = two_steps_template
+    results = []
+    with coordinator(['http://a'], [template], results, lease_size=1) as c:
+        first = c.lease('w1')
+        c.report('w1', first['lease'], [{'unit': first['units'][0][0], 'result': None}])
+        second = c.lease('w2')
+        assert first['units'][0][3] == 0 and second['units'][0][3] == 1
+        assert first['units'][0][5] == second['units'][0][5]
+        c.report('w2', second['lease'], [{'unit': second['units'][0][0], 'result': None}])
+        assert c.lease('w1') == {'done': True}
+        assert c._variables == {}
+
+def test_expired_lease_is_reissued_and_old_owner_ignored(payloads_template):
+    template = payloads_template(4)
+    results = []
+    with coordinator(['http://a'], [template], results, lease_size=2, chunk_size=2, lease_ttl=0.05) as c:
+        lost = c.lease('w1')
+        assert c.heartbeat('w1', [lost['lease']]) == {'lost': []}
+        time.sleep(0.1)
+        taken = c.lease('w2')
+        assert [unit[1:5] for unit in taken['units']] == [unit[1:5] for unit in lost['units']]
+        assert c.heartbeat('w1', [lost['lease']]) == {'lost': [lost['lease']]}
+
+        stale = [{'unit': unit[0], 'result': found('http://a/?p=stale')} for unit in lost['units']]
+        assert c.report('w1', lost['lease'], stale) == {'accepted': 0, 'lease_lost': True}
+        # Not the owner of the new lease either
+        assert c.report('w1', taken['lease'], stale)['lease_lost']
+        assert c.status()['finished_units'] == 0
+
+def test_report_merges_chunks_into_one_result(payloads_template):
+    template = payloads_template(6)
+    results = []
+    with coordinator(['http://a'], [template], results, lease_size=2, chunk_size=2) as c:
+        lease = c.lease('w1')
+        unit_ids = [unit[0] for unit in lease['units']]
+        reply = c.report('w1', lease['lease'], [
+            {'unit': unit_ids[0], 'result': {'vulnerable': False, 'results': []}},
+            {'unit': unit_ids[0], 'result': found('http://a/?p=duplicate')},
+        ])
+        assert reply == {'accepted': 1, 'lease_lost': False}
+        c.report('w1', lease['lease'], [{'unit': unit_ids[1], 'result': found('http://a/?p=3')}])
+        assert results == []
+        last = c.lease('w1')
+        c.report('w1', last['lease'], [{'unit': last['units'][0][0], 'error': 'connection reset'}])
+        assert c.lease('w1') == {'done': True}
+    [(target, result)] = results
+    assert target == 'http://a'
+    assert result.template_id == 'many-payloads'
+    assert [finding.target_url for finding in result.results] == ['http://a/?p=3']
+
+def test_worker_runs_a_split_pair_with_shared_variables(two_steps_template):
+    template = two_steps_template
+    results = []
+    with BenchServer() as server, coordinator([server.url], [template], results, lease_size=1) as c, \
+            HttpClient() as client:
+        worker = Worker(c.url, [load_template(template.path)], client, slots=2)
+        assert worker.run() == 2
+    [(target, result)] = results
+    markers = {re.search(r'm=(\d+)', finding.target_url).group(1) for finding in result.results}
+    assert len(result.results) == 2
+    assert len(markers) == 1, "Both steps should send the same random value"
+
+def test_worker_refuses_different_templates(payloads_template):
+    template = payloads_template(2)
+    with coordinator(['http://a'], [template], []) as c:
+        changed = payloads_template(3)
+        with HttpClient() as client:
+            with pytest.raises(DistributedError, match='differ'):
+                Worker(c.url, [changed], client).connect()
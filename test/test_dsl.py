@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.dsl import (DslError, UnresolvedName, compile_expression, compile_string, evaluate_variables,
+                      render)
+
+@pytest.mark.parametrize('source,expected', [
+    ('1 + 2 * 3', 7),
+    ('(1 + 2) * 3', 9),
+    ('10 % 4 - -1', 3),
+    ('"a" + 1', 'a1'),
+    ('"200" == 200', True),
+    ('"b" > "a" && 2 >= 3', False),
+    ('!false || nil', True),
+    ("'x\\ty' == \"x\\ty\"", True),
+    ('"abc123" =~ "[0-9]+$"', True),
+    ('"abc" !~ "^a"', False),
+    ('to_upper(trim("  hi  "))', 'HI'),
+    ('concat("a", 1, true)', 'a1true'),
+    ('join(",", "a", "b")', 'a,b'),
+    ('base64_decode(base64("id=1"))', 'id=1'),
+    ('url_encode("a b&c")', 'a%20b%26c'),
+    ('md5("a")', '0cc175b9c0f1b6a831c399e269772661'),
+    ('dec_to_hex(255) + "/" + hex_to_dec("ff")', 'ff/255'),
+    ('contains_any("error in SQL", "ORA-", "SQL")', True),
+    ('len(repeat("ab", 3))', 6),
+])
+def test_evaluation(source, expected):
+    expression = compile_expression(source)
+    assert expression({}) == expected
+    # Only pure functions on constants: folded at compile time
+    assert expression.constant
+
+def test_names_are_read_from_the_context():
+    expression = compile_expression('status_code == 200 && contains(body, word)')
+    assert expression.names == {'status_code', 'body', 'word'}
+    assert not expression.constant
+    assert expression({'status_code': '200', 'body': 'an error page', 'word': 'error'}) is True
+    with pytest.raises(UnresolvedName, match='word'):
+        expression({'status_code': 200, 'body': ''})
+    # As a condition, unresolved names and failures count as false
+    assert expression.test({'status_code': 200, 'body': ''}) is False
+    assert compile_expression('1 / zero').test({'zero': 0}) is False
+
+def test_random_functions_are_not_folded():
+    expression = compile_expression('rand_text_alpha(8, "abc")')
+    assert not expression.constant
+    first = expression({})
+    assert len(first) == 8 and not set(first) & set('abc')
+    assert 10 <= compile_expression('rand_int(10, 11)')({}) < 11
+
+@pytest.mark.parametrize('source,message', [
+    ('1 +', 'Incomplete expression'),
+    ('(1 + 2', r"Expected '\)'"),
+    ('1 2', "Unexpected '2'"),
+    ('nope(1)', r'Unknown function nope\(\)'),
+    ('a $ b', 'Unexpected character'),
+])
+def test_parse_errors(source, message):
+    with pytest.raises(DslError, match=message):
+        compile_expression(source)
+
+def test_compilations_are_cached():
+    assert compile_expression('a + 1') is compile_expression('a + 1')
+    assert compile_string('{{a}}-{{b}}') is compile_string('{{a}}-{{b}}')
+
+def test_template_strings():
+    template = compile_string('{{base}}/?id={{url_encode(payload)}}&n={{1 + 1}}')
+    assert template.dynamic and template.names == {'base', 'payload'}
+    assert template.render({'base': 'http://a', 'payload': "1' or"}) == 'http://a/?id=1%27%20or&n=2'
+    # Unresolved or unparsable placeholders are left as written
+    assert template.render({'base': 'http://a'}) == 'http://a/?id={{url_encode(payload)}}&n=2'
+    assert render('{{ not valid ( }} {{x}}', {'x': 1}) == '{{ not valid ( }} 1'
+    assert not compile_string('{{to_upper("a")}}b').dynamic
+    assert render('plain', {}) == 'plain'
+
+def test_variables_are_evaluated_in_order():
+    spec = {'token': '{{to_lower(name)}}', 'url': '{{base}}/{{token}}', 'count': 3}
+    values = evaluate_variables(spec, {'name': 'ABC', 'base': 'http://a'})
+    assert values == {'token': 'abc', 'url': 'http://a/abc', 'count': 3}
+    assert evaluate_variables(None, {}) == {}
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import main
+from bench.server import BenchServer
+from core.http_client import HttpClient
+from core.module_loader import ExploitRunner, run_exploit
+
+LFI = str(ROOT / 'modules' / 'lfi.py')
+
+@pytest.fixture
+def self_signed(tmp_path):
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl is not available')
+    key, cert = tmp_path / 'key.pem', tmp_path / 'cert.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-keyout', str(key), '-out', str(cert)],
+                   check=True, capture_output=True)
+    pem = tmp_path / 'server.pem'
+    pem.write_bytes(cert.read_bytes() + key.read_bytes())
+    return str(pem)
+
+def scan_args(monkeypatch, target):
+    monkeypatch.setattr(sys, 'argv', ['main.py', 'scan', '-t', target, '-template', 'templates'])
+    return main.parse_args()
+
+def test_lfi_exploit_on_self_signed_target(self_signed, monkeypatch):
+    with BenchServer(certfile=self_signed) as server:
+        args = scan_args(monkeypatch, server.url)
+        with HttpClient() as scan_client:
+            # The scan itself verifies certificates
+            [(_, response, error)] = list(scan_client.map([{'method': 'GET', 'url': server.url}]))
+            assert response is None and error is not None
+
+            runner = main.open_exploit_runner(args, scan_client)
+            try:
+                assert runner.client.rate_controller is scan_client.rate_controller
+                result = runner.result(runner.submit(LFI, server.url, {'vulnerable': True, 'results': []}))
+            finally:
+                main.close_exploit_runner(runner)
+
+    assert result['success']
+    assert [probe['status'] for probe in result['results']] == ['success'] * 4
+
+def test_exploit_runner_reports_failures(tmp_path):
+    broken = tmp_path / 'broken.py'
+    broken.write_text("def run(target_url, scan_result):\n    raise RuntimeError('no luck')\n")
+    missing = tmp_path / 'missing.py'
+    with ExploitRunner() as runner:
+        assert runner.result(runner.submit(str(broken), 'http://a', {})) == {'success': False, 'error': 'no luck'}
+    assert not run_exploit(str(missing), 'http://a', {})['success']
+
+def test_modules_without_client_argument_still_run(tmp_path):
+    plain = tmp_path / 'plain.py'
+    plain.write_text("def run(target_url, scan_result):\n    return {'success': True, 'target': target_url}\n")
+    with HttpClient() as client:
+        assert run_exploit(str(plain), 'http://a', {}, client=client) == {'success': True, 'target': 'http://a'}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.batch import ResultMerger, payload_chunks
+from core.findings import MAX_BUFFERED_FINDINGS, Finding, FindingLog
+from core.logger import JsonlResultSink
+
+def finding(n):
+    return Finding(f"http://a/?p={n}", 'GET', 200, ['Matched word p='], extracted_data=[str(n)])
+
+def test_findings_past_the_limit_spill_to_disk():
+    log = FindingLog()
+    for n in range(MAX_BUFFERED_FINDINGS + 44):
+        log.append(finding(n))
+    assert len(log) == 300
+    assert len(log._buffer) == MAX_BUFFERED_FINDINGS
+    assert log._spill is not None
+    # Read back in order, twice, with the spilled ones decoded again
+    for _ in range(2):
+        assert [f.extracted_data for f in log] == [[str(n)] for n in range(300)]
+    spilled = list(log)[-1]
+    assert spilled.match_details == ('Matched word p=',)
+    assert spilled.target_url == 'http://a/?p=299'
+
+    log.close()
+    assert log._spill is None
+    assert not log and list(log) == []
+
+def test_merged_pairs_spill_and_are_released_once_written(tmp_path, payloads_template):
+    template = payloads_template(6)
+    plan = payload_chunks(template, chunk_size=2)
+    results = []
+    merger = ResultMerger({template.path: template}, {template.path: plan}, set(),
+                          lambda target, result: results.append(result))
+
+    # Three chunks of 100 findings each
+    for chunk, payloads in enumerate(plan[0]):
+        partial = {'vulnerable': True, 'results': [finding(chunk * 100 + n).to_dict() for n in range(100)]}
+        merger.finish(None, ('http://a', template.path, 0, payloads), partial)
+        assert (results == []) == (chunk < 2)
+
+    [result] = results
+    assert result.template_id == 'many-payloads'
+    assert len(result.results) == 300
+    assert result.results._spill is not None
+    assert merger.merged == {}
+
+    with JsonlResultSink(str(tmp_path / 'out'), run_id='spill') as sink:
+        path = sink.save_result(result)
+    [line] = Path(path).read_text().splitlines()
+    record = json.loads(line)
+    assert [f['extracted_data'] for f in record['scan']['results']] == [[str(n)] for n in range(300)]
+    assert record['scan']['results'][0]['template_id'] == 'many-payloads'
+    # The sink released the findings after writing them
+    assert result.results._spill is None
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main
+from bench.server import BenchServer
+from core.http_client import HttpClient, host_key
+from core.ratelimit import RateController
+from core.scanner import run_scan
+
+def fixed_client(per_host, **kwargs):
+    """A client whose per-host window stays at per_host"""
+    return HttpClient(per_host=per_host, rate_controller=RateController(per_host, adaptive=False), **kwargs)
+
+def test_host_key():
+    assert host_key('HTTP://Example.com:8080/a?b') == 'http://example.com:8080'
+    assert host_key('https://example.com/') == 'https://example.com'
+
+def test_map_keeps_input_order():
+    with BenchServer(latency=0.01) as server, fixed_client(8, concurrency=8) as client:
+        specs = [{'method': 'GET', 'url': f"{server.url}?n={n}"} for n in range(30)]
+        results = list(client.map(specs))
+    assert [spec for spec, _, _ in results] == specs
+    for spec, response, error in results:
+        assert error is None
+        assert response.status_code == 200
+        assert spec['url'].split('/', 3)[3] in response.text
+
+def test_requests_run_concurrently():
+    with BenchServer(latency=0.2) as server, fixed_client(8, concurrency=8) as client:
+        start = time.perf_counter()
+        results = list(client.map({'method': 'GET', 'url': f"{server.url}?n={n}"} for n in range(8)))
+        elapsed = time.perf_counter() - start
+    assert all(response is not None for _, response, _ in results)
+    assert elapsed < 1.0, "8 requests should overlap rather than take 8 x 0.2s"
+
+def test_per_host_limit():
+    with BenchServer(latency=0.2) as server, fixed_client(2, concurrency=8) as client:
+        start = time.perf_counter()
+        list(client.map({'method': 'GET', 'url': f"{server.url}?n={n}"} for n in range(4)))
+        elapsed = time.perf_counter() - start
+    assert elapsed >= 0.4, "Only 2 requests may be in flight to the host at once"
+
+def test_skip_drops_queued_specs():
+    with BenchServer() as server, fixed_client(1, concurrency=1) as client:
+        done = set()
+        specs = [{'method': 'GET', 'url': f"{server.url}?n={n}", 'group': n % 2} for n in range(10)]
+        seen = []
+        for spec, response, error in client.map(specs, skip=lambda spec: spec['group'] in done):
+            seen.append(spec)
+            done.add(spec['group'])
+    # Once a group answered, its remaining specs are not yielded
+    assert [spec['group'] for spec in seen] == [0, 1]
+
+def test_connection_errors_are_yielded():
+    # Nothing listens on a port a server just released
+    server = BenchServer().start()
+    url = server.url
+    server.stop()
+    with HttpClient(connect_timeout=1.0, read_timeout=1.0) as client:
+        [(spec, response, error)] = list(client.map([{'method': 'GET', 'url': url}]))
+    assert response is None
+    assert error is not None
+
+def test_client_options_are_the_same_for_every_command(monkeypatch):
+    shared = ['--per-host', '3', '--rate-limit', '2', '--timeout', '4', '--transport', 'pooled']
+    commands = {
+        'scan': ['-t', 'http://a', '-template', 'templates'],
+        'batch': ['-l', 'targets.txt'],
+        'worker': ['--coordinator', 'http://c:8600'],
+        'serve': [],
+    }
+    for command, required in commands.items():
+        monkeypatch.setattr(sys, 'argv', ['main.py', command, *required, *shared])
+        args = main.parse_args()
+        assert main.client_options(args) == {
+            'concurrency': 20, 'per_host': 3, 'connect_timeout': 5.0, 'read_timeout': 4.0,
+            'max_body_size': 8 * 1024 * 1024, 'transport': 'pooled',
+        }, command
+
+    with main.make_client(args) as client, main.make_client(args, verify=False,
+                                                            rate_controller=client.rate_controller) as other:
+        assert client.per_host == 3 and client.verify
+        assert client.rate_controller.max_rate == 2
+        assert not other.verify
+        assert other.rate_controller is client.rate_controller
+
+PAGE_LENGTH = """
+id: page-length
+info:
+  name: Page length
+  author: test
+  severity: info
+http:
+  - method: GET
+    path:
+      - "{{BaseURL}}/"
+    matchers:
+      - type: {type}
+"""
+
+def test_findings_report_the_length_of_bodies_not_read(write_template):
+    status = write_template('status.yaml', PAGE_LENGTH.replace('{type}', 'status\n        status:\n          - 200'))
+    words = write_template('words.yaml', PAGE_LENGTH.replace('{type}', 'word\n        words:\n          - "<html>"'))
+    with BenchServer(body_size=200000) as server:
+        with HttpClient() as client:
+            # Skipped for a status matcher, and cut short once the word was seen
+            skipped = run_scan(server.url, status, client)
+            partial = run_scan(server.url, words, client)
+        with HttpClient(max_body_size=1000) as client:
+            # Cut at the size limit
+            truncated = run_scan(server.url, words, client)
+    for result in (skipped, partial, truncated):
+        [finding] = result.results
+        assert finding.response_length == 200000
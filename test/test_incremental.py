@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.http_client import HttpClient
+from core.incremental import StateError, ValidatorStore
+from core.scanner import run_scan
+
+PAGE = """
+id: versioned-page
+info:
+  name: Versioned page
+  author: test
+  severity: info
+http:
+  - method: GET
+    path:
+      - "{{BaseURL}}/page"
+    matchers:
+      - type: word
+        part: body
+        words:
+          - "version"
+    extractors:
+      - type: regex
+        part: body
+        regex:
+          - "version [0-9]+"
+"""
+
+class Versioned(BaseHTTPRequestHandler):
+    """Serves /page with an ETag, answering 304 while it still matches"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        etag = f'"v{server.version}"'
+        server.seen.append((self.headers.get('If-None-Match'), etag))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = f"version {server.version}".encode()
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Versioned)
+    httpd.version = 1
+    httpd.seen = []
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def scan(server, template, db):
+    with ValidatorStore(db) as store, HttpClient() as client:
+        result = run_scan(server.url, template, client=client, validators=store)
+        return [f.extracted_data for f in result.results], store.stats()
+
+def test_unchanged_responses_reuse_the_previous_outcome(server, tmp_path, write_template):
+    template = write_template('page.yaml', PAGE)
+    db = tmp_path / 'state.sqlite'
+
+    extracted, stats = scan(server, template, db)
+    assert stats == {'unchanged': 0, 'changed': 0, 'new': 1}
+    assert extracted == [['version 1']]
+
+    # The next run asks conditionally and the 304 keeps the finding
+    extracted, stats = scan(server, template, db)
+    assert stats == {'unchanged': 1, 'changed': 0, 'new': 0}
+    assert server.seen[-1] == ('"v1"', '"v1"')
+    assert extracted == [['version 1']]
+
+    # A changed page is downloaded and matched again
+    server.version = 2
+    extracted, stats = scan(server, template, db)
+    assert stats == {'unchanged': 0, 'changed': 1, 'new': 0}
+    assert extracted == [['version 2']]
+    extracted, stats = scan(server, template, db)
+    assert stats['unchanged'] == 1 and extracted == [['version 2']]
+
+def test_edited_templates_send_unconditional_requests(server, tmp_path, write_template):
+    db = tmp_path / 'state.sqlite'
+    scan(server, write_template('page.yaml', PAGE), db)
+    edited = write_template('page.yaml', PAGE.replace('name: Versioned page', 'name: Edited'))
+    extracted, stats = scan(server, edited, db)
+    assert stats == {'unchanged': 0, 'changed': 0, 'new': 1}
+    assert server.seen[-1][0] is None
+    assert extracted == [['version 1']]
+
+def test_prune_and_version_check(server, tmp_path, write_template):
+    db = tmp_path / 'state.sqlite'
+    scan(server, write_template('page.yaml', PAGE), db)
+    with ValidatorStore(db) as store:
+        assert store.prune() == 0
+        assert store.prune(max_age=-1) == 1
+
+    conn = sqlite3.connect(str(db))
+    conn.execute('PRAGMA user_version=99')
+    conn.close()
+    with pytest.raises(StateError, match='Unsupported incremental state version 99'):
+        ValidatorStore(db)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip('py_mini_racer')
+
+import core.javascript as javascript
+from core.javascript import JavascriptError, JsContextPool
+
+COOKIES = "template.http_all_headers.split('\\n').filter(l => l.startsWith('Set-Cookie')).map(l => l.split(/[:=]/)[1].trim())"
+
+def test_context_is_reused_per_thread():
+    pool = JsContextPool()
+    assert pool.call("1 + 1", {}) == 2
+    first = pool._local.context
+    assert pool.call(COOKIES, {'http_all_headers': "Set-Cookie: a=1\nSet-Cookie: b=2"}) == ['a', 'b']
+    assert pool._local.context is first
+    assert first.calls == 2
+
+    other = []
+    thread = threading.Thread(target=lambda: (pool.call("2", {}), other.append(pool._local.context)))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+def test_globals_do_not_survive_recycling():
+    pool = JsContextPool(max_calls=2)
+    pool.call("globalThis.leak = 1; 0", {})
+    first = pool._local.context
+    assert pool.call("typeof leak", {}) == 'number'
+    assert pool.call("typeof leak", {}) == 'undefined'
+    assert pool._local.context is not first
+    assert first.ctx is None
+
+def test_heap_limit_recycles(monkeypatch):
+    monkeypatch.setattr(javascript, 'HEAP_CHECK_INTERVAL', 2)
+    pool = JsContextPool(max_heap_bytes=1)
+    pool.call("1", {})
+    first = pool._local.context
+    pool.call("1", {})
+    assert pool._local.context is first
+    # Every context uses more than one byte of heap
+    pool.call("1", {})
+    assert pool._local.context is not first
+
+def test_failed_context_is_dropped():
+    pool = JsContextPool()
+    pool.call("1", {})
+    first = pool._local.context
+    with pytest.raises(JavascriptError):
+        pool.call("throw new Error('boom')", {})
+    assert pool._local.context is None
+    assert pool.call("1", {}) == 1
+    assert pool._local.context is not first
+
+def test_warm_compiles_steps_ahead_of_calls():
+    pool = JsContextPool()
+    pool.warm([COOKIES])
+    context = pool._local.context
+    assert COOKIES in context.functions
+    assert context.calls == 0
+    pool.call(COOKIES, {'http_all_headers': ''})
+    assert pool._local.context is context
+    assert len(context.functions) == 1
+
+CONCURRENT_CREATION = """
+import sys
+import threading
+sys.path.insert(0, sys.argv[1])
+from core.javascript import JsContextPool, init_engine
+
+init_engine()
+pool = JsContextPool(max_calls=3)
+start = threading.Barrier(8)
+results = []
+
+def work(n):
+    start.wait()
+    # Enough calls to recycle each thread's context several times
+    results.append([pool.call(f"{n} * {i}", {}) for i in range(10)])
+
+threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+assert sorted(results) == [[n * i for i in range(10)] for n in range(8)]
+print("ok")
+"""
+
+def test_contexts_created_from_many_threads():
+    # A fresh interpreter where no context exists yet, since a V8 crash
+    # would take the test run down with it
+    root = str(Path(__file__).resolve().parent.parent)
+    result = subprocess.run([sys.executable, '-c', CONCURRENT_CREATION, root],
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == 'ok'
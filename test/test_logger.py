@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import gzip
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import core.logger as result_logger
+from core.logger import JsonlResultSink, ResultLogger, create_result_logger
+
+def scan(n):
+    return {'target': f"http://a/?n={n}", 'template_id': 'numbers', 'vulnerable': True, 'results': []}
+
+def read_records(path):
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        return [json.loads(line) for line in f]
+
+def test_records_are_written_in_order(tmp_path):
+    # More than one batch, so the writer loops several times
+    count = result_logger.WRITE_BATCH_SIZE * 3 + 7
+    with JsonlResultSink(str(tmp_path), run_id='order', flush_interval=0.01) as sink:
+        for n in range(count):
+            assert sink.save_result(scan(n), {'success': n % 2 == 0} if n < 2 else None) == str(sink.path)
+    records = read_records(sink.path)
+    assert [r['scan']['target'] for r in records] == [f"http://a/?n={n}" for n in range(count)]
+    assert records[0]['exploit'] == {'success': True}
+    assert 'exploit' not in records[2]
+    assert sink.written == count
+
+@pytest.mark.parametrize('compress', [None, 'gzip'])
+def test_sync_position_resumes_without_duplicates(tmp_path, compress):
+    sink = JsonlResultSink(str(tmp_path), compress=compress, run_id='resume')
+    for n in range(3):
+        sink.save_result(scan(n))
+    position = sink.sync()
+    assert position['records'] == 3
+    assert position['offset'] == Path(position['path']).stat().st_size
+    # Written after the checkpoint, then lost with the interrupted run
+    sink.save_result(scan('lost'))
+    sink.close()
+    assert len(read_records(sink.path)) == 4
+
+    with JsonlResultSink(str(tmp_path), compress=compress, resume_from=position) as resumed:
+        assert resumed.path == sink.path
+        resumed.save_result(scan(3))
+    assert [r['scan']['target'] for r in read_records(sink.path)] == [f"http://a/?n={n}" for n in range(4)]
+    assert resumed.written == 4
+
+def test_zstd_output(tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    with JsonlResultSink(str(tmp_path), compress='zstd', run_id='zstd') as sink:
+        sink.save_result(scan(0))
+        sink.sync()
+        sink.save_result(scan(1))
+    assert sink.path.name == 'run_zstd.jsonl.zst'
+    with zstandard.open(sink.path, 'rt') as f:
+        assert [json.loads(line)['scan']['target'] for line in f] == ['http://a/?n=0', 'http://a/?n=1']
+
+def test_compression_needs_jsonl(tmp_path):
+    with pytest.raises(ValueError, match='only supported for jsonl'):
+        create_result_logger(str(tmp_path), 'json', 'gzip')
+    assert isinstance(create_result_logger(str(tmp_path), 'json'), ResultLogger)
+    with pytest.raises(ValueError, match='Unknown compression'):
+        JsonlResultSink(str(tmp_path), compress='bzip2')
+
+def test_failed_writer_does_not_block_callers(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_logger, 'WRITE_BATCH_SIZE', 1)
+    monkeypatch.setattr(result_logger, 'WRITER_POLL_INTERVAL', 0.01)
+    sink = JsonlResultSink(str(tmp_path), run_id='broken')
+    writing, release = threading.Event(), threading.Event()
+
+    def fail(records):
+        writing.set()
+        release.wait()
+        raise OSError('No space left on device')
+    sink._write = fail
+
+    sink.save_result(scan(0))
+    writing.wait(5)
+    # The writer holds the first record; these fill the queue
+    while not sink._queue.full():
+        sink.save_result(scan('queued'))
+    saved = []
+    blocked = threading.Thread(target=lambda: saved.append(sink.save_result(scan('blocked'))))
+    blocked.start()
+    release.set()
+    blocked.join(timeout=5)
+    assert not blocked.is_alive(), "save_result kept waiting on a dead writer"
+    assert saved == [None]
+    assert isinstance(sink._error, OSError)
+
+    assert sink.save_result(scan('late')) is None
+    assert sink.sync() is None
+    sink.close()
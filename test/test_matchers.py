@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import core.matchers as matchers
+from core.http_client import HttpResponse
+from core.matchers import (BodyWatcher, CompiledExtractor, CompiledMatcher, CompiledStep, PartCache, RegexSet, WordSet,
+                           _required_literals)
+
+def response(body='', headers=None, status=200):
+    return HttpResponse('http://example.test/', status, headers or {'Content-Type': 'text/html'},
+                        body.encode('utf-8'), encoding='utf-8')
+
+@pytest.mark.parametrize('pattern, literals, ignorecase', [
+    (r'root:.*:0:0:', [':0:0:', 'root:'], False),
+    (r'foo(bar)+baz?', ['bar', 'foo'], False),
+    (r'(?i)Allow: [A-Z,]*TRACE', ['allow: ', 'trace'], True),
+    (r'SQL (?i:syntax)', ['syntax', 'sql '], True),
+    # Optional parts, alternatives and lookarounds require nothing
+    (r'abc|xyz', [], False),
+    (r'(abc)?def', ['def'], False),
+    (r'(?=secret)\w+', [], False),
+    (r'(?!admin)user', ['user'], False),
+    (r'x{0,3}yyy', ['yyy'], False),
+    # Runs shorter than MIN_LITERAL_LENGTH filter nothing
+    (r'ab\d+cd', [], False),
+    # Case-insensitive literals must be ASCII
+    (r'(?i)straße', ['stra'], True),
+    (r'[invalid', [], False),
+])
+def test_required_literals(pattern, literals, ignorecase):
+    assert _required_literals(pattern) == (literals, ignorecase)
+
+PATTERNS = [
+    r'root:.*:0:0:',
+    r'foo(bar)+baz?',
+    r'(?i)Allow: [A-Z,]*TRACE',
+    r'SQL (?i:syntax)',
+    r'abc|xyz',
+    r'(abc)?def',
+    r'(?i)test',
+    r'(?i)kin',
+    r'(?i)straße',
+    r'\bswagger-ui\b',
+    r'(?i)<title>[^<]*admin',
+    r'Warning: mysql_',
+]
+
+TEXTS = [
+    'root:x:0:0:root:/root:/bin/bash',
+    'foobarbarbaz',
+    'fooba',
+    'ALLOW: GET,TRACE',
+    'allow: trace',
+    'SQL SYNTAX error',
+    'sql syntax error',
+    'xyz',
+    'def',
+    'teſt',
+    'TEST',
+    'tİn KIN kın',
+    'STRASSE',
+    'STRAßE',
+    'Straße',
+    'swagger-ui.js',
+    '<TITLE>Site Admin</TITLE>',
+    'warning: mysql_',
+    'Warning: mysql_fetch',
+    '',
+]
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_regex_set_agrees_with_re(text):
+    parts = PartCache(response(text))
+    regexes = RegexSet(PATTERNS)
+    expected = [p for p in PATTERNS if re.search(p, text)]
+    assert regexes.matching(parts, 'body') == expected
+    assert regexes.first(parts, 'body') == (expected[0] if expected else None)
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_regex_set_agrees_with_re_through_automaton(monkeypatch, text):
+    pytest.importorskip('ahocorasick')
+    monkeypatch.setattr(matchers, 'AUTOMATON_MIN_WORDS', 1)
+    test_regex_set_agrees_with_re(text)
+
+def test_regex_set_skips_invalid_patterns():
+    regexes = RegexSet(['[invalid', 'ok'])
+    assert len(regexes) == 1
+    assert regexes.first(PartCache(response('ok')), 'body') == 'ok'
+
+def test_regex_set_finditer_in_pattern_order():
+    regexes = RegexSet([r'id=(\d+)', r'name=(\w+)'])
+    found = [(p, m.group(1)) for p, m in regexes.finditer(PartCache(response('name=a id=1 id=2')), 'body')]
+    assert found == [(r'id=(\d+)', '1'), (r'id=(\d+)', '2'), (r'name=(\w+)', 'a')]
+
+def test_word_set():
+    words = WordSet(['alpha', 'beta', 'gamma'])
+    assert words.found('beta and gamma') == {1, 2}
+    assert len(words.found('beta and gamma', stop_after=1)) == 1
+    assert words.found('delta') == set()
+
+def test_repeated_words_still_match_all():
+    words = ['admin', 'password', 'admin']
+    assert WordSet(words).words == ['admin', 'password']
+    matcher = CompiledMatcher({'type': 'word', 'words': words, 'condition': 'and'})
+    assert matcher.match(PartCache(response('admin password')))
+    assert not matcher.match(PartCache(response('admin only')))
+
+def test_repeated_words_still_match_all_through_automaton(monkeypatch):
+    pytest.importorskip('ahocorasick')
+    monkeypatch.setattr(matchers, 'AUTOMATON_MIN_WORDS', 1)
+    test_repeated_words_still_match_all()
+
+@pytest.mark.parametrize('part, needs_body', [
+    ('body', True), ('all', True), ('header', False),
+    # Any other part is read from the body, as response_part does
+    ('response', True), ('raw', True),
+])
+def test_needs_body_follows_response_part(part, needs_body):
+    matcher = CompiledMatcher({'type': 'word', 'part': part, 'words': ['x']})
+    extractor = CompiledExtractor({'type': 'regex', 'part': part, 'regex': ['x']})
+    assert matcher.needs_body == extractor.needs_body == needs_body
+    assert matcher.match(PartCache(response('x', headers={'X-Header': 'y'}))) == needs_body
+
+def test_body_watcher_finds_words_split_across_chunks():
+    watcher = BodyWatcher([b'needle'])
+    assert not watcher.feed(b'hay hay nee')
+    assert watcher.feed(b'dle hay')
+
+def test_step_skips_body_when_status_decides():
+    step = CompiledStep({
+        'matchers-condition': 'and',
+        'matchers': [
+            {'type': 'status', 'status': [200]},
+            {'type': 'word', 'part': 'body', 'words': ['secret']},
+        ],
+    })
+    assert not step.body_needed(response(status=404))
+    assert step.body_needed(response(status=200))
+    assert step.evaluate(response('a secret', status=200))[0]
+    assert not step.evaluate(response('a secret', status=404))[0]
+
+def test_step_extracts_with_named_extractors():
+    step = CompiledStep({
+        'matchers': [{'type': 'word', 'part': 'header', 'words': ['text/html']}],
+        'extractors': [{'type': 'regex', 'name': 'version', 'part': 'body', 'regex': [r'v(\d+\.\d+)'], 'group': 1}],
+    })
+    matched, details, parts = step.evaluate(response('running v4.15'))
+    assert matched
+    assert details == ['Matched words in header']
+    assert step.extract(parts) == ['4.15']
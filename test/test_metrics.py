@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import json
+import pstats
+import sys
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.http_client import HttpClient
+from core.metrics import LATENCY_BUCKETS, Histogram, Metrics, MetricsServer, ProgressReporter, TemplateProfiler
+
+def enabled_registry():
+    registry = Metrics()
+    registry.enable()
+    return registry
+
+def test_disabled_registry_records_nothing():
+    registry = Metrics()
+    registry.inc('requests_total', host='a')
+    registry.observe('request_seconds', 0.1, host='a')
+    with registry.timer('match_seconds'):
+        pass
+    assert registry.snapshot() == {'counters': [], 'histograms': []}
+
+def test_histogram_quantiles():
+    histogram = Histogram()
+    assert histogram.quantile(0.5) is None
+    for value in [0.003] * 98 + [0.2, 100.0]:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(0.99) == 0.25
+    assert histogram.quantile(1.0) == float('inf')
+    assert histogram.count == 100 and round(histogram.sum, 3) == 100.494
+
+def test_prometheus_text():
+    registry = enabled_registry()
+    registry.inc('requests_total', host='http://a', status=200)
+    registry.inc('requests_total', 2, host='http://a', status=200)
+    registry.inc('findings_total', template='say "hi"\n')
+    registry.observe('request_seconds', 0.004, host='http://a')
+    registry.observe('request_seconds', 0.3, host='http://a')
+    lines = registry.to_prometheus().splitlines()
+
+    assert '# HELP pentoscan_requests_total HTTP requests sent, by host and status' in lines
+    assert '# TYPE pentoscan_requests_total counter' in lines
+    assert 'pentoscan_requests_total{host="http://a",status="200"} 3' in lines
+    assert 'pentoscan_findings_total{template="say \\"hi\\"\\n"} 1' in lines
+    assert '# TYPE pentoscan_request_seconds histogram' in lines
+    buckets = [line for line in lines if line.startswith('pentoscan_request_seconds_bucket')]
+    assert len(buckets) == len(LATENCY_BUCKETS) + 1
+    assert 'pentoscan_request_seconds_bucket{host="http://a",le="0.0025"} 0' in buckets
+    assert 'pentoscan_request_seconds_bucket{host="http://a",le="0.005"} 1' in buckets
+    assert 'pentoscan_request_seconds_bucket{host="http://a",le="+Inf"} 2' in buckets
+    assert 'pentoscan_request_seconds_count{host="http://a"} 2' in lines
+    # Every metric is described once
+    assert sum(line.startswith('# TYPE pentoscan_requests_total') for line in lines) == 1
+
+def test_snapshots_merge_across_processes(tmp_path):
+    worker, parent = enabled_registry(), enabled_registry()
+    worker.inc('scans_total', template='t')
+    worker.observe('scan_seconds', 1.0, template='t')
+    parent.inc('scans_total', template='t')
+    parent.merge(worker.snapshot(reset=True))
+    assert worker.snapshot() == {'counters': [], 'histograms': []}
+    assert parent.total('scans_total') == 2
+    data = parent.to_dict()
+    assert data['histograms']['scan_seconds'] == [{'labels': {'template': 't'}, 'count': 1, 'sum': 1.0,
+                                                   'p50': 1.0, 'p99': 1.0}]
+
+    parent.write(tmp_path / 'metrics.json')
+    assert json.loads((tmp_path / 'metrics.json').read_text())['counters']['scans_total'][0]['value'] == 2
+    parent.write(tmp_path / 'metrics.prom')
+    assert 'pentoscan_scans_total{template="t"} 2' in (tmp_path / 'metrics.prom').read_text()
+
+def test_client_requests_are_counted_and_served(monkeypatch):
+    registry = enabled_registry()
+    for module in ('core.http_client', 'core.transport'):
+        monkeypatch.setattr(f"{module}.metrics", registry)
+    with BenchServer() as server, HttpClient() as client:
+        client.request('GET', server.url)
+        client.request('GET', f"{server.url}missing")
+        host = server.url.rstrip('/')
+    assert registry.total('requests_total', host=host) == 2
+    assert registry.total('requests_total', status=404) == 1
+    assert registry.total('response_bytes_total') > 0
+    assert 'Requests: 2' in registry.summary()
+
+    exporter = MetricsServer(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{exporter._httpd.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert f'pentoscan_requests_total{{host="{host}",status="404"}} 1' in response.read().decode()
+        with urllib.request.urlopen(f"{url}/metrics.json") as response:
+            assert 'requests_total' in json.loads(response.read())['counters']
+    finally:
+        exporter.close()
+
+def test_progress_reporter_rewrites_the_metrics_file(tmp_path):
+    registry = enabled_registry()
+    registry.inc('scans_total', 3, template='t')
+    reporter = ProgressReporter(total=10, interval=60, show=False, metrics_file=str(tmp_path / 'm.prom'),
+                                registry=registry)
+    assert 'scans 3/10' in reporter.line()
+    reporter.close()
+    assert 'pentoscan_scans_total{template="t"} 3' in (tmp_path / 'm.prom').read_text()
+
+def test_template_profiler_accumulates_per_template(tmp_path):
+    profiler = TemplateProfiler(tmp_path, suffix='.1')
+    for _ in range(2):
+        with profiler.profile('sqli'):
+            sum(range(1000))
+    stats = pstats.Stats(str(tmp_path / 'sqli.1.prof'))
+    assert stats.total_calls > 0
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.http_client import HttpClient
+from core.payloads import PayloadError, Wordlist, count_combinations, expand_payloads
+from core.scanner import build_requests, run_scan
+
+def test_attack_types():
+    payloads = {'user': ['a', 'b'], 'password': ['1', '2', '3']}
+    assert list(expand_payloads(payloads, 'pitchfork')) == [
+        {'user': 'a', 'password': '1'}, {'user': 'b', 'password': '2'}]
+    assert list(expand_payloads(payloads, 'clusterbomb')) == [
+        {'user': u, 'password': p} for u in 'ab' for p in '123']
+    assert list(expand_payloads({'a': ['x', 'y'], 'b': ['z']})) == [
+        {'a': 'x', 'b': 'x'}, {'a': 'y', 'b': 'y'}, {'a': 'z', 'b': 'z'}]
+    assert list(expand_payloads(None)) == [{}]
+    assert [count_combinations(payloads, attack) for attack in ('batteringram', 'pitchfork', 'clusterbomb')] == [5, 2, 6]
+    with pytest.raises(PayloadError, match='Unknown attack type'):
+        list(expand_payloads(payloads, 'sniper'))
+
+def test_wordlists_are_streamed_and_reiterable(tmp_path):
+    words = tmp_path / 'words.txt'
+    words.write_text("admin\n\nroot\r\nguest\n")
+    wordlist = Wordlist(words)
+    assert list(wordlist) == list(wordlist) == ['admin', 'root', 'guest']
+    assert len(wordlist) == 3
+    # Resolved next to the template as well as from the cwd
+    template_path = str(tmp_path / 'template.yaml')
+    assert list(expand_payloads({'w': 'words.txt'}, template_path=template_path)) == [
+        {'w': 'admin'}, {'w': 'root'}, {'w': 'guest'}]
+    with pytest.raises(PayloadError, match='not found'):
+        list(expand_payloads({'w': 'missing.txt'}, template_path=template_path))
+
+def test_clusterbomb_is_expanded_lazily(tmp_path):
+    big = tmp_path / 'big.txt'
+    big.write_text(''.join(f"{n}\n" for n in range(100000)))
+    payloads = {'a': str(big), 'b': str(big)}
+    assert count_combinations(payloads, 'clusterbomb') == 10 ** 10
+    started = time.perf_counter()
+    first = list(islice(expand_payloads(payloads, 'clusterbomb'), 3))
+    assert time.perf_counter() - started < 1
+    assert first == [{'a': '0', 'b': '0'}, {'a': '0', 'b': '1'}, {'a': '0', 'b': '2'}]
+
+FUZZING = """
+id: fuzzing
+info:
+  name: Fuzzing rules
+  author: test
+  severity: info
+http:
+  - method: GET
+    path:
+      - "{{BaseURL}}/search?q=x&page=1"
+    payloads:
+      injection:
+        - "'"
+      directory:
+        - admin
+    attack: clusterbomb
+    fuzzing:
+      - part: query
+        type: postfix
+        fuzz:
+          - "{{injection}}"
+      - part: path
+        type: prefix
+        fuzz:
+          - "/{{directory}}"
+    matchers:
+      - type: word
+        words:
+          - "SQL syntax"
+"""
+
+def test_fuzzing_rules_combine_across_payloads(write_template):
+    template = write_template('fuzzing.yaml', FUZZING)
+    urls = [spec['url'] for spec in build_requests('http://a', template)]
+    # One request per injected parameter, each also under the fuzzed path
+    assert urls == ["http://a/admin/search?q=x%27&page=1", "http://a/admin/search?q=x&page=1%27"]
+
+def test_stopped_step_generates_no_more_requests(payloads_template):
+    template = payloads_template(1000)
+    stopped = set()
+    specs = build_requests('http://a', template, stopped=stopped)
+    assert next(specs)['url'] == 'http://a/?p=0'
+    stopped.add(0)
+    assert list(specs) == []
+
+def test_first_match_cancels_the_remaining_payloads(payloads_template):
+    template = payloads_template(1000, stop_at_first_match=True)
+    with BenchServer() as server, HttpClient(concurrency=4, per_host=4) as client:
+        result = run_scan(server.url, template, client)
+        sent = server.requests
+    assert [finding.target_url for finding in result.results] == [f"{server.url}?p=7"]
+    # The hit is the eighth payload; only what was already queued follows it
+    assert sent < 50
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import core.ratelimit as ratelimit
+from core.http_client import HttpClient
+from core.ratelimit import HostLimiter, RateController, parse_retry_after
+
+def test_parse_retry_after():
+    now = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    assert parse_retry_after('7') == 7.0
+    assert parse_retry_after('Thu, 01 Jan 2026 12:00:30 GMT', now=now) == 30.0
+    # Dates in the past mean now; huge values are capped
+    assert parse_retry_after('Thu, 01 Jan 2026 11:00:00 GMT', now=now) == 0.0
+    assert parse_retry_after('86400') == ratelimit.MAX_RETRY_AFTER
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+def healthy(limiter, count, latency=0.01):
+    for _ in range(count):
+        limiter.acquire()
+        limiter.release(status_code=200, latency=latency)
+
+def test_slow_start_then_backoff_on_throttling():
+    limiter = HostLimiter(16, initial_rate=10.0)
+    assert limiter.window == ratelimit.INITIAL_CONCURRENCY
+    healthy(limiter, 4)
+    # Slow start: one slot per healthy response
+    assert limiter.window == 6
+    rate = limiter.rate
+    assert rate > 10.0
+
+    limiter.acquire()
+    limiter.acquire()
+    limiter.release(status_code=429, latency=0.01)
+    assert limiter.window == 3
+    assert limiter.rate == rate * ratelimit.BACKOFF
+    # Answers to requests sent under the old limits do not cut again
+    limiter.release(status_code=503, latency=0.01)
+    assert limiter.window == 3
+
+    # After the first backoff the window grows by about one slot per window
+    healthy(limiter, 3)
+    assert 3.9 < limiter.window < 4.1
+
+def test_latency_above_baseline_backs_off():
+    limiter = HostLimiter(16)
+    healthy(limiter, 3, latency=0.01)
+    window = limiter.window
+    healthy(limiter, 1, latency=1.0)
+    assert limiter.window == window * ratelimit.BACKOFF
+
+def test_errors_back_off_and_limits_stay_within_bounds():
+    limiter = HostLimiter(4, initial_rate=100.0, max_rate=50.0)
+    assert limiter.rate == 50.0
+    healthy(limiter, 20)
+    assert limiter.window == 4 and limiter.rate == 50.0
+    for _ in range(10):
+        # Neither waiting for tokens nor counting as an answer to the last cut
+        limiter.tokens = 1.0
+        limiter.acquire()
+        limiter._last_backoff = 0.0
+        limiter.release(error=True)
+    assert limiter.window == ratelimit.MIN_CONCURRENCY
+    assert limiter.rate == ratelimit.MIN_RATE
+
+def test_fixed_limits():
+    limiter = HostLimiter(3, max_rate=None, adaptive=False)
+    limiter.acquire()
+    limiter.release(status_code=429)
+    assert (limiter.window, limiter.rate) == (3, None)
+
+def test_window_bounds_requests_in_flight():
+    limiter = HostLimiter(1, adaptive=False)
+    limiter.acquire()
+    entered = threading.Event()
+    thread = threading.Thread(target=lambda: (limiter.acquire(), entered.set()))
+    thread.start()
+    assert not entered.wait(0.1)
+    limiter.release(status_code=200)
+    assert entered.wait(1)
+    thread.join()
+
+def test_retry_after_pauses_the_host():
+    limiter = HostLimiter(4, adaptive=False)
+    limiter.acquire()
+    limiter.release(status_code=429, retry_after=0.3)
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.25
+
+def test_controller_keeps_one_limiter_per_host():
+    controller = RateController(4)
+    assert controller.host('http://a') is controller.host('http://a')
+    assert controller.host('http://a') is not controller.host('http://b')
+    assert set(controller.snapshot()) == {'http://a', 'http://b'}
+
+class Throttling(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    hits = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.hits.append(time.monotonic())
+        status, headers = (429, [('Retry-After', '1')]) if len(self.hits) == 1 else (200, [])
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+def test_client_retries_after_the_server_asked_to_wait():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Throttling)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with HttpClient() as client:
+            response = client.request('GET', f"http://127.0.0.1:{server.server_address[1]}/")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert response.status_code == 200
+    assert len(Throttling.hits) == 2
+    assert Throttling.hits[1] - Throttling.hits[0] >= 0.9
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.server import BenchServer
+from core.http_client import HttpClient, HttpResponse
+from core.response_cache import ResponseCache, normalize_url, request_key
+
+def response(body=b'page', body_read=True, partial=False):
+    result = HttpResponse('http://a/', 200, {'Content-Type': 'text/html'}, body if body_read else b'')
+    result.body_read = body_read
+    result.partial = partial
+    return result
+
+def test_request_key_normalizes_urls_and_headers():
+    assert normalize_url('HTTP://Example.COM:80') == 'http://example.com/'
+    assert normalize_url('https://a:443/x?b=1#frag') == 'https://a/x?b=1'
+    assert normalize_url('http://a:8080/') == 'http://a:8080/'
+    assert request_key('get', 'http://A/', {'X-A': 1}) == request_key('GET', 'http://a', {'x-a': '1'})
+    assert request_key('GET', 'http://a/', data='x') != request_key('GET', 'http://a/')
+
+def test_hits_misses_and_eviction():
+    cache = ResponseCache(max_bytes=3500)
+    sent = []
+
+    def send(key):
+        sent.append(key)
+        return response(b'x' * 1000)
+    for key in ('a', 'b', 'a', 'c'):
+        cache.fetch(key, lambda: send(key))
+    assert sent == ['a', 'b', 'c']
+    # Each entry is 1000 bytes of body plus headers and overhead: 'b',
+    # the least recently used, made room for 'c'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (1, 3, 1, 2)
+    cache.fetch('b', lambda: send('b'))
+    assert sent[-1] == 'b'
+
+def test_identical_requests_in_flight_are_coalesced():
+    cache = ResponseCache()
+    release = threading.Event()
+    calls = []
+
+    def send():
+        calls.append(1)
+        release.wait(5)
+        return response()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.fetch('key', send))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache.stats()['coalesced'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 5 and all(r is results[0] for r in results)
+
+def test_failed_request_is_not_cached():
+    cache = ResponseCache()
+
+    def fail():
+        raise ConnectionError('reset')
+    with pytest.raises(ConnectionError):
+        cache.fetch('key', fail)
+    assert cache.fetch('key', response).content == b'page'
+    assert cache.stats()['misses'] == 2
+
+def test_partial_bodies_only_answer_requests_that_skip_the_body():
+    cache = ResponseCache()
+    head_only = response(body_read=False)
+    cache.fetch('key', lambda: head_only, read_body=lambda head: False)
+    # Another request that can do without the body reuses the head
+    assert cache.fetch('key', response, read_body=lambda head: False) is head_only
+    # One that needs it sends the request again, and its full response replaces the head
+    full = cache.fetch('key', lambda: response(b'full'), read_body=lambda head: True)
+    assert full.content == b'full'
+    assert cache.fetch('key', response) is full
+
+    stopped = response(b'par', partial=True)
+    cache.fetch('other', lambda: stopped, read_body=lambda head: False)
+    assert cache.fetch('other', lambda: response(b'rest')).content == b'rest'
+
+def test_client_shares_responses_between_calls():
+    with BenchServer() as server, HttpClient(cache=ResponseCache()) as client:
+        first = client.request('GET', server.url)
+        second = client.request('GET', server.url.rstrip('/'))
+        # POST is not cached
+        client.request('POST', server.url, data='a')
+        client.request('POST', server.url, data='a')
+        assert second is first
+        assert server.requests == 3
+        assert client.cache.stats()['hits'] == 1
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.logger import JsonlResultSink
+from core.results_db import ResultsDbError, ResultsIndex, parse_time
+
+def record(template_id, target, timestamp, severity='high', extracted=None):
+    findings = []
+    if extracted is not None:
+        findings.append({'target_url': f"{target}/?x", 'method': 'GET', 'status_code': 200, 'vulnerable': True,
+                         'match_details': ['Matched word'], 'extracted_data': extracted})
+    scan = {'template_id': template_id, 'template_name': template_id.title(), 'severity': severity,
+            'tags': ['sqli'], 'target': target, 'vulnerable': bool(findings), 'results': findings}
+    return {'scan': scan, 'timestamp': timestamp}
+
+def line(item):
+    return json.dumps(item) + '\n'
+
+@pytest.fixture
+def results(tmp_path):
+    directory = tmp_path / 'results'
+    directory.mkdir()
+    (directory / 'run_1.jsonl').write_text(''.join([
+        line(record('sqli', 'http://a.test', '2026-01-01T10:00:00', extracted=['mysql'])),
+        line(record('sqli', 'http://b.test:8080', '2026-01-02T10:00:00', extracted=[])),
+        line(record('xss', 'http://a.test', '2026-01-02T11:00:00', severity='Medium', extracted=['<b>'])),
+        line(record('xss', 'http://b.test:8080', '2026-01-03T11:00:00')),
+    ]))
+    (directory / 'tech_20260104.json').write_text(
+        json.dumps(record('tech', 'http://c.test', '2026-01-04T09:00:00', severity='info', extracted=['nginx'])))
+    return directory
+
+def test_queries(results, tmp_path):
+    with ResultsIndex(tmp_path / 'index.sqlite') as index:
+        assert index.ingest(results) == 5
+        rows = index.query()
+        assert [(r['template_id'], r['host']) for r in rows] == [
+            ('tech', 'c.test'), ('xss', 'a.test'), ('sqli', 'b.test:8080'), ('sqli', 'a.test')]
+        assert len(index.query(vulnerable=False)) == 5
+        assert [r['target'] for r in index.query(template=['sqli'], host=['B.test:8080'])] == ['http://b.test:8080']
+        assert [r['template_id'] for r in index.query(severity=['medium'])] == ['xss']
+        assert [r['template_id'] for r in index.query(since='2026-01-02', until='2026-01-04')] == ['xss', 'sqli']
+        assert len(index.query(limit=1)) == 1
+
+        assert index.count_by('template') == [('sqli', 2), ('tech', 1), ('xss', 1)]
+        assert index.count_by('host', vulnerable=False) == [('a.test', 2), ('b.test:8080', 2), ('c.test', 1)]
+        assert index.count_by('day', template=['sqli']) == [('2026-01-01', 1), ('2026-01-02', 1)]
+        with pytest.raises(ResultsDbError, match='Cannot group by'):
+            index.count_by('author')
+
+        [row] = index.query(template=['sqli'], host=['a.test'])
+        assert index.findings(row['scan_id']) == [{
+            'url': 'http://a.test/?x', 'method': 'GET', 'status_code': 200,
+            'match_details': ['Matched word'], 'extracted_data': ['mysql'],
+        }]
+
+def test_ingest_is_incremental(results, tmp_path):
+    run = results / 'run_1.jsonl'
+    with ResultsIndex(tmp_path / 'index.sqlite') as index:
+        assert index.ingest(results) == 5
+        assert index.ingest(results) == 0
+
+        # A run still being written: the incomplete last line waits
+        complete = line(record('sqli', 'http://d.test', '2026-01-05T10:00:00', extracted=['x']))
+        with open(run, 'a') as f:
+            f.write(complete + complete[:20])
+        assert index.ingest(results) == 1
+        with open(run, 'a') as f:
+            f.write(complete[20:])
+        assert index.ingest(results) == 1
+        assert index.count_by('host', template=['sqli']) == [('d.test', 2), ('a.test', 1), ('b.test:8080', 1)]
+
+        # A rewritten per-scan file replaces what it held before
+        (results / 'tech_20260104.json').write_text(
+            json.dumps(record('tech', 'http://e.test', '2026-01-04T09:00:00', severity='info', extracted=['apache'])))
+        assert index.ingest(results) == 1
+        assert [r['host'] for r in index.query(template=['tech'])] == ['e.test']
+
+    # The index survives reopening
+    with ResultsIndex(tmp_path / 'index.sqlite') as index:
+        assert index.ingest(results) == 0
+        assert len(index.query(vulnerable=False, limit=1000)) == 7
+
+def test_compressed_run_files(tmp_path):
+    directory = tmp_path / 'results'
+    with JsonlResultSink(str(directory), compress='gzip', run_id='gz') as sink:
+        sink.save_result(record('sqli', 'http://a.test', None, extracted=['1'])['scan'])
+        sink.sync()
+        sink.save_result(record('sqli', 'http://b.test', None, extracted=['2'])['scan'])
+    with ResultsIndex(tmp_path / 'index.sqlite') as index:
+        assert index.ingest(directory) == 2
+        assert index.ingest(directory) == 0
+        assert index.count_by('host') == [('a.test', 1), ('b.test', 1)]
+
+def test_parse_time():
+    now = datetime(2026, 3, 10, 12, 0, 0)
+    assert parse_time('7d', now=now) == '2026-03-03T12:00:00'
+    assert parse_time('90m', now=now) == '2026-03-10T10:30:00'
+    assert parse_time('2026-01-02') == '2026-01-02T00:00:00'
+    assert parse_time(None) is None
+    with pytest.raises(ResultsDbError, match='Invalid time'):
+        parse_time('yesterday')
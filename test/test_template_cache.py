@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import core.template_cache as template_cache
+from core.loader import load_templates
+from core.template_cache import TemplateCache
+
+TEMPLATE = """
+id: {id}
+info:
+  name: {id}
+  author: test
+  severity: {severity}
+  tags: {tags}
+http:
+  - method: GET
+    path:
+      - "{{{{BaseURL}}}}/{id}"
+    matchers:
+      - type: status
+        status:
+          - 200
+"""
+
+def write(directory, name, severity='info', tags='misc', template_id=None):
+    path = directory / f"{name}.yaml"
+    path.write_text(TEMPLATE.format(id=template_id or name, severity=severity, tags=tags))
+    return path
+
+def count_parses(monkeypatch):
+    parsed = []
+    original = template_cache.parse_template
+
+    def parse(content, path):
+        parsed.append(Path(path).name)
+        return original(content, path)
+
+    monkeypatch.setattr(template_cache, 'parse_template', parse)
+    return parsed
+
+def test_unchanged_templates_are_not_parsed_again(tmp_path, monkeypatch):
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    write(templates, 'one')
+    write(templates, 'two')
+    cache = TemplateCache(tmp_path / 'cache')
+    parsed = count_parses(monkeypatch)
+
+    assert [t.id for t in cache.load(templates).templates] == ['one', 'two']
+    assert sorted(parsed) == ['one.yaml', 'two.yaml']
+    parsed.clear()
+    assert [t.id for t in cache.load(templates).templates] == ['one', 'two']
+    assert parsed == []
+
+def test_changed_templates_are_parsed_again(tmp_path, monkeypatch):
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    one = write(templates, 'one')
+    write(templates, 'two')
+    cache = TemplateCache(tmp_path / 'cache')
+    cache.load(templates)
+    parsed = count_parses(monkeypatch)
+
+    # Touched but identical: the content hash saves the parse
+    stat = one.stat()
+    os.utime(one, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    cache.load(templates)
+    assert parsed == []
+
+    write(templates, 'one', severity='critical')
+    (templates / 'two.yaml').unlink()
+    write(templates, 'three')
+    index = cache.load(templates)
+    assert sorted(parsed) == ['one.yaml', 'three.yaml']
+    assert [t.id for t in index.templates] == ['one', 'three']
+    assert index.by_id['one'].info['severity'] == 'critical'
+
+def test_invalid_templates_are_left_out(tmp_path, caplog):
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    write(templates, 'good')
+    (templates / 'bad.yaml').write_text("info:\n  name: no id\n")
+    cache = TemplateCache(tmp_path / 'cache')
+    assert [t.id for t in cache.load(templates).templates] == ['good']
+    # Reported again when served from the cache
+    caplog.clear()
+    cache.load(templates)
+    assert "missing required 'id'" in caplog.text
+
+def test_index_selection(tmp_path):
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    write(templates, 'sqli', severity='high', tags='sqli,injection')
+    write(templates, 'xss', severity='medium', tags='xss,injection')
+    write(templates, 'trace', severity='info', tags='misc')
+    index = TemplateCache(tmp_path / 'cache').load(templates)
+
+    ids = lambda selected: [t.id for t in selected]
+    assert ids(index.select()) == ['sqli', 'trace', 'xss']
+    assert ids(index.select(tags=['Injection'])) == ['sqli', 'xss']
+    assert ids(index.select(tags=['injection'], severity=['high'])) == ['sqli']
+    assert ids(index.select(severity=['info', 'medium'])) == ['trace', 'xss']
+    assert ids(index.select(ids=['xss', 'missing'])) == ['xss']
+    assert ids(index.select(tags=['misc'], ids=['xss'])) == []
+
+def test_cache_agrees_with_direct_parsing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    templates = Path(__file__).resolve().parent.parent / 'templates'
+    cached = load_templates(str(templates), tags=['xss', 'misc'])
+    direct = load_templates(str(templates), tags=['xss', 'misc'], use_cache=False)
+    assert sorted(t.id for t in cached) == sorted(t.id for t in direct)
+    assert (tmp_path / '.cache').is_dir()
+
+def test_unreadable_cache_is_rebuilt(tmp_path):
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    write(templates, 'one')
+    cache = TemplateCache(tmp_path / 'cache')
+    cache.load(templates)
+    cache._cache_file(templates).write_bytes(b'not a pickle')
+    assert [t.id for t in cache.load(templates).templates] == ['one']
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import core.transport as transport
+from bench.server import BenchServer
+from core.http_client import HttpClient
+from core.transport import HTTP10, HTTP11, HTTP11_PIPELINED, Transport
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError, match='Unknown transport'):
+        Transport('carrier-pigeon')
+
+def test_pooled_mode_never_loads_httpx(monkeypatch):
+    monkeypatch.setattr(transport, '_load_httpx', lambda: pytest.fail('httpx loaded'))
+    selected = Transport('pooled')
+    assert selected.http2 is None and selected.pipeline is None
+    selected.close()
+
+@pytest.mark.parametrize('mode', ['auto', 'http2', 'pipeline'])
+def test_http2_falls_back_without_httpx(monkeypatch, caplog, mode):
+    monkeypatch.setattr(transport, '_load_httpx', lambda: None)
+    with BenchServer() as server, HttpClient(transport=mode) as client:
+        assert client.transport.http2 is None
+        assert (client.transport.pipeline is not None) == (mode == 'pipeline')
+        response = client.request('POST', server.url, data='a=1')
+    # Only asking for HTTP/2 by name is worth a warning
+    assert ('needs the httpx and h2 packages' in caplog.text) == (mode == 'http2')
+    assert response.status_code == 200 and response.transport == HTTP11
+
+def test_pipelined_gets_share_connections():
+    with BenchServer(body_size=2000) as server, HttpClient(transport='pipeline', per_host=2) as client:
+        urls = [f"{server.url}?id={i}" for i in range(40)]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            responses = list(executor.map(lambda url: client.request('GET', url), urls))
+        head = client.request('HEAD', server.url)
+        post = client.request('POST', server.url, data='a=1')
+        pools = client.transport.pipeline._pools
+    for i, response in enumerate(responses):
+        assert response.status_code == 200 and response.transport == HTTP11_PIPELINED
+        assert len(response.content) == 2000 and f"id={i}" in response.text
+    assert head.transport == HTTP11_PIPELINED and head.content == b''
+    # Only GET and HEAD are pipelined
+    assert post.transport == HTTP11
+    [pool] = pools.values()
+    assert len(pool) <= 2
+
+class Closing(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+def test_hosts_that_close_connections_are_not_pipelined():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Closing)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        with HttpClient(transport='pipeline') as client:
+            first = client.request('GET', url)
+            assert not client.transport.pipeline.supports(url)
+            second = client.request('GET', url)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert first.transport == HTTP11_PIPELINED and first.content == b'ok'
+    assert second.transport == HTTP10 and second.content == b'ok'